@@ -0,0 +1,19 @@
+"""
+Guard for operator-only endpoints
+
+Admin endpoints are disabled unless ADMIN_TOKEN is set; callers then have
+to send the same value in the X-Admin-Token header.
+"""
+import hmac
+import os
+
+from fastapi import Header, HTTPException, status
+
+
+def require_admin(x_admin_token: str = Header(None)):
+    expected = os.environ.get("ADMIN_TOKEN")
+    if not expected:
+        # Pretend the endpoint doesn't exist rather than advertise it
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), expected.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required")
@@ -0,0 +1,328 @@
+"""
+Watchlist alerts evaluated on every quote tick
+
+Users put price and percent-change thresholds on their favorite stocks.
+Alerts are one-shot: the first tick that crosses the threshold triggers
+the alert, which is then deactivated and stamped with the tick's value.
+
+An alert fires on a move across its threshold, not on a level. Each
+alert stores its ``reference``, the quote's value when it was created.
+An alert created on the far side of its threshold (a price_above alert
+at 100 while the price is 105) first waits for the value to come back
+across, and fires on the next crossing after that.
+
+AlertIndex keeps every active alert in memory, inverted by symbol and
+kind into flat numpy threshold arrays. A tick only touches the symbols
+whose quote moved, and each of their blocks is checked with a single
+vectorized comparison; freed slots hold a threshold that can never be
+crossed, so no separate "active" mask is needed. Alerts still waiting
+to come back across sit in a second block per (symbol, kind) with the
+opposite comparison. When that block fires, they move to the first one.
+
+AlertEngine runs the index once per host (leader-elected like the quote
+producer): it loads active alerts from MongoDB, picks up new and removed
+ones incrementally, evaluates each new tick of the shared quote snapshot
+and writes triggers back.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import metrics
+from database import db
+from leader import LeaderLock
+from quote_snapshot import SnapshotReader, default_path
+
+logger = logging.getLogger(__name__)
+
+PRICE_ABOVE = "price_above"
+PRICE_BELOW = "price_below"
+CHANGE_ABOVE = "change_above"
+CHANGE_BELOW = "change_below"
+KINDS = (PRICE_ABOVE, PRICE_BELOW, CHANGE_ABOVE, CHANGE_BELOW)
+
+# How often the engine looks for a new tick
+POLL_SECONDS = float(os.environ.get("ALERT_POLL_SECONDS", 0.25))
+# How often the engine picks up alerts created or removed by other workers
+SYNC_SECONDS = float(os.environ.get("ALERT_SYNC_SECONDS", 2.0))
+# Re-read this much history on every sync so slow writes aren't missed
+SYNC_OVERLAP = timedelta(seconds=5)
+ELECTION_SECONDS = 5.0
+
+
+class _Block:
+    """Thresholds of one (symbol, kind), fired by ``value >= t`` or ``value <= t`` (``>``/``<`` if strict)"""
+
+    def __init__(self, above, strict=False, capacity=16):
+        self.above = above
+        self.strict = strict
+        # A threshold no finite value can cross
+        self.sentinel = np.inf if above else -np.inf
+        self.thresholds = np.full(capacity, self.sentinel)
+        self.ids = np.empty(capacity, dtype=object)
+        self.free = []
+        self.used = 0  # high-water mark; slots past it are never scanned
+        self.count = 0
+
+    def add(self, alert_id, threshold):
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.used == len(self.thresholds):
+                grown = np.full(2 * len(self.thresholds), self.sentinel)
+                grown[: self.used] = self.thresholds
+                self.thresholds = grown
+                ids = np.empty(len(grown), dtype=object)
+                ids[: self.used] = self.ids
+                self.ids = ids
+            slot = self.used
+            self.used += 1
+        self.thresholds[slot] = threshold
+        self.ids[slot] = alert_id
+        self.count += 1
+        return slot
+
+    def remove(self, slot):
+        self.thresholds[slot] = self.sentinel
+        self.ids[slot] = None
+        self.free.append(slot)
+        self.count -= 1
+
+    def fire(self, value):
+        """Remove and return ``(ids, thresholds)`` of every alert ``value`` crosses"""
+        thresholds = self.thresholds[: self.used]
+        if self.above:
+            crossed = thresholds < value if self.strict else thresholds <= value
+        else:
+            crossed = thresholds > value if self.strict else thresholds >= value
+        slots = np.flatnonzero(crossed)
+        if not len(slots):
+            return None
+        ids, crossed = self.ids[slots], thresholds[slots]
+        self.thresholds[slots] = self.sentinel
+        self.ids[slots] = None
+        self.free.extend(slots.tolist())
+        self.count -= len(slots)
+        return ids, crossed
+
+
+def _above(kind):
+    return kind in (PRICE_ABOVE, CHANGE_ABOVE)
+
+
+class AlertIndex:
+    def __init__(self):
+        # symbol -> kind -> _Block
+        self._blocks = {}
+        # symbol -> kind -> _Block of alerts waiting to come back across
+        # their threshold, fired by the opposite (strict) comparison
+        self._arming = {}
+        # alert id -> (block, slot). Fired alerts are left behind rather than
+        # deleted one by one on the hot path; _locate() skips them and the
+        # engine's next sync drops them.
+        self._where = {}
+
+    def __len__(self):
+        return sum(
+            block.count for blocks in (self._blocks, self._arming) for kinds in blocks.values() for block in kinds.values()
+        )
+
+    def __contains__(self, alert_id):
+        return self._locate(alert_id) is not None
+
+    def _locate(self, alert_id):
+        where = self._where.get(alert_id)
+        if where is None:
+            return None
+        block, slot = where
+        if block.ids[slot] != alert_id:
+            # Fired (and maybe reused) since it was indexed
+            del self._where[alert_id]
+            return None
+        return where
+
+    def add(self, alert_id, symbol, kind, threshold, reference=None):
+        """
+        Index an alert, replacing any alert already indexed under ``alert_id``
+
+        ``reference`` is the value the alert was created at. If it is
+        already at or past ``threshold``, the alert fires only after the
+        value has moved back across. Without one, any value at or past the
+        threshold fires it.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown alert kind: {kind}")
+        self.remove(alert_id)
+        threshold = float(threshold)
+        above = _above(kind)
+        armed = reference is None or (reference < threshold if above else reference > threshold)
+        kinds = (self._blocks if armed else self._arming).setdefault(symbol, {})
+        block = kinds.get(kind)
+        if block is None:
+            block = kinds[kind] = _Block(above) if armed else _Block(not above, strict=True)
+        self._where[alert_id] = (block, block.add(alert_id, threshold))
+
+    def remove(self, alert_id):
+        where = self._locate(alert_id)
+        if where is not None:
+            block, slot = where
+            block.remove(slot)
+            del self._where[alert_id]
+
+    def evaluate(self, symbol, price, change):
+        """
+        Fire every alert on ``symbol`` crossed by this quote
+
+        Fired alerts are removed from the index. Returns a list of
+        ``(kind, value, ids, thresholds)``, one per kind that fired, with
+        ``ids`` and ``thresholds`` as numpy arrays.
+        """
+        arming = self._arming.get(symbol)
+        if arming:
+            for kind, block in arming.items():
+                if not block.count:
+                    continue
+                hit = block.fire(price if kind in (PRICE_ABOVE, PRICE_BELOW) else change)
+                if hit is not None:
+                    # Back on the near side: from now on a crossing fires them
+                    for alert_id, threshold in zip(*hit):
+                        self.add(alert_id, symbol, kind, threshold)
+        kinds = self._blocks.get(symbol)
+        if not kinds:
+            return []
+        fired = []
+        for kind, block in kinds.items():
+            if not block.count:
+                continue
+            value = price if kind in (PRICE_ABOVE, PRICE_BELOW) else change
+            hit = block.fire(value)
+            if hit is not None:
+                fired.append((kind, value) + hit)
+        return fired
+
+
+class AlertEngine:
+    def __init__(self, path=None, poll_seconds=POLL_SECONDS, sync_seconds=SYNC_SECONDS):
+        self.path = path or default_path()
+        self.poll_seconds = poll_seconds
+        self.sync_seconds = sync_seconds
+        self.index = AlertIndex()
+        self.reader = SnapshotReader(self.path)
+        self._leader = LeaderLock(self.path + ".alerts.lock")
+        self._task = None
+        self._tick = None
+        # symbol -> (price, change) last evaluated
+        self._last = {}
+        self._synced_at = None
+        self._next_sync = 0.0
+
+    @property
+    def is_leader(self):
+        return self._leader.held
+
+    async def _sync(self):
+        """Load active alerts, then apply whatever changed since the last sync"""
+        started = datetime.utcnow()
+        if self._synced_at is None:
+            query = {"active": True}
+        else:
+            query = {"updated_at": {"$gte": self._synced_at - SYNC_OVERLAP}}
+        fields = {"_id": 0, "id": 1, "symbol": 1, "kind": 1, "threshold": 1, "reference": 1, "active": 1}
+        async for alert in db.alerts.find(query, fields):
+            if alert.get("active"):
+                # Thresholds never change; re-adding would forget that an alert has armed
+                if alert["id"] in self.index:
+                    continue
+                self.index.add(alert["id"], alert["symbol"], alert["kind"], alert["threshold"], alert.get("reference"))
+            else:
+                self.index.remove(alert["id"])
+        self._synced_at = started
+        metrics.ALERTS_ACTIVE.set(len(self.index))
+
+    def check_tick(self):
+        """Evaluate the latest tick if it is new; returns fired alerts as ``(symbol, fired)``"""
+        tick = self.reader.tick
+        if tick is None or tick == self._tick:
+            return []
+        try:
+            snapshot = self.reader.snapshot()
+        except RuntimeError:
+            return []
+        if snapshot is None:
+            # The producer is laying the snapshot out again; retry next poll
+            return []
+        _, records = snapshot
+        self._tick = tick
+        start = time.perf_counter()
+        fired = []
+        for symbol, price, change in zip(
+            records["symbol"].tolist(), records["price"].tolist(), records["change"].tolist()
+        ):
+            if self._last.get(symbol) == (price, change):
+                continue
+            self._last[symbol] = (price, change)
+            hits = self.index.evaluate(symbol.decode(), price, change)
+            if hits:
+                fired.append((symbol.decode(), hits))
+        metrics.ALERT_EVALUATION_SECONDS.observe(time.perf_counter() - start)
+        return fired
+
+    async def _persist(self, fired):
+        now = datetime.utcnow()
+        try:
+            # Alerts of one (symbol, kind) all fired on the same value
+            for _, hits in fired:
+                for _, value, ids, _ in hits:
+                    await db.alerts.update_many(
+                        {"id": {"$in": ids.tolist()}, "active": True},
+                        {"$set": {"active": False, "triggered_at": now, "triggered_value": value, "updated_at": now}},
+                    )
+        except Exception:
+            # Put them back so the next crossing fires them again; ones
+            # already written are dropped again on the next sync
+            for symbol, hits in fired:
+                for kind, _, ids, thresholds in hits:
+                    for alert_id, threshold in zip(ids.tolist(), thresholds.tolist()):
+                        self.index.add(alert_id, symbol, kind, threshold)
+            raise
+        metrics.ALERTS_TRIGGERED.inc(sum(len(ids) for _, hits in fired for _, _, ids, _ in hits))
+        metrics.ALERTS_ACTIVE.set(len(self.index))
+
+    async def _run(self):
+        while True:
+            if not self._leader.try_acquire():
+                await asyncio.sleep(ELECTION_SECONDS)
+                continue
+            try:
+                loop = asyncio.get_running_loop()
+                if loop.time() >= self._next_sync:
+                    self._next_sync = loop.time() + self.sync_seconds
+                    await self._sync()
+                fired = self.check_tick()
+                if fired:
+                    await self._persist(fired)
+            except Exception as e:
+                logger.warning(f"Alert engine iteration failed: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._leader.release()
+        self.reader.close()
+
+
+engine = AlertEngine()
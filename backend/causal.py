@@ -0,0 +1,124 @@
+"""
+Read-your-own-writes while list reads go to secondaries
+
+List routes read through ``database.read_db``, which prefers secondaries
+(MONGO_READ_PREFERENCE, at most MONGO_MAX_STALENESS_SECONDS behind the
+primary). A secondary may not have applied a write yet, so a user who
+just posted could miss their own post on the next page, whichever worker
+or host serves it.
+
+Writes made in ``write_session()`` use a causally consistent session.
+Afterwards its cluster and operation times go back to the client in the
+X-Read-After header, as an opaque token. The frontend sends the newest
+token it was given on later requests. Routes that depend on
+``read_session`` then read in a session advanced to those times: the
+driver adds readConcern ``afterClusterTime``, and the member serving the
+read waits until it has applied the write. Requests without the token
+are plain secondary reads. On a standalone server there are no cluster
+times, so no token is handed out.
+
+The token comes from the client, so it is never trusted: one that
+doesn't decode or that the driver won't advance to is ignored, and
+reads made through ``read()`` are retried without it if the server
+rejects it (a forged or stale cluster time signature, a time ahead of
+the cluster). Such requests get a plain read, never an error.
+
+The guarantee holds as long as the write is not rolled back. Writes are
+acknowledged by a majority by default on replica sets (MongoDB 5.0+),
+which covers that. scripts/check_read_split.py checks all of this on a
+local three-node replica set.
+"""
+import base64
+import binascii
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import Request
+
+from database import get_client
+
+logger = logging.getLogger(__name__)
+
+HEADER = "X-Read-After"
+
+
+def encode(session):
+    """The token for the writes made in ``session``, or None without cluster times"""
+    import bson
+
+    if session.operation_time is None or session.cluster_time is None:
+        return None
+    document = {"operationTime": session.operation_time, "clusterTime": session.cluster_time}
+    return base64.urlsafe_b64encode(bson.encode(document)).decode().rstrip("=")
+
+
+def decode(token):
+    """``{"operationTime", "clusterTime"}`` from a token, or None if it isn't one"""
+    import bson
+
+    if not token:
+        return None
+    try:
+        document = bson.decode(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (binascii.Error, bson.errors.BSONError, ValueError):
+        return None
+    cluster_time = document.get("clusterTime")
+    if not isinstance(document.get("operationTime"), bson.Timestamp) or not isinstance(cluster_time, dict):
+        return None
+    if not isinstance(cluster_time.get("clusterTime"), bson.Timestamp):
+        return None
+    return document
+
+
+@asynccontextmanager
+async def session_after(token):
+    """A causally consistent session that reads at least what ``token`` saw; None without a token"""
+    times = decode(token)
+    if times is None:
+        yield None
+        return
+    session = await get_client().start_session(causal_consistency=True)
+    try:
+        try:
+            session.advance_cluster_time(times["clusterTime"])
+            session.advance_operation_time(times["operationTime"])
+        except Exception as e:
+            logger.info(f"Ignoring an {HEADER} token the driver won't accept: {e}")
+            await session.end_session()
+            session = None
+        yield session
+    finally:
+        if session is not None:
+            await session.end_session()
+
+
+async def read_session(request: Request):
+    """Route dependency: the session reads pass as ``session=``, after the caller's own writes"""
+    async with session_after(request.headers.get(HEADER)) as session:
+        yield session
+
+
+async def read(session, query):
+    """``await query(session)``, or ``query(None)`` if the server rejects the session's token"""
+    from pymongo.errors import OperationFailure
+
+    if session is None:
+        return await query(None)
+    try:
+        return await query(session)
+    except OperationFailure as e:
+        logger.info(f"{HEADER} token rejected, reading without it: {e}")
+        return await query(None)
+
+
+@asynccontextmanager
+async def write_session(response):
+    """A causally consistent session for a handler's writes; sets their token on ``response`` if they succeed"""
+    session = await get_client().start_session(causal_consistency=True)
+    try:
+        yield session
+        token = encode(session)
+        if token is not None:
+            response.headers[HEADER] = token
+    finally:
+        await session.end_session()
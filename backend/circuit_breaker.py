@@ -0,0 +1,69 @@
+"""
+Circuit breaker for upstream dependencies
+
+closed     requests flow; consecutive failures are counted
+open       requests are refused without touching the upstream until
+           ``reset_timeout`` has passed since the breaker tripped
+half-open  exactly one probe request is let through; its success closes
+           the breaker, its failure opens it again for another timeout
+"""
+import time
+
+import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        metrics.CIRCUIT_BREAKER_STATE.labels(name).set(0)
+
+    def _transition(self, state):
+        if state != self._state:
+            self._state = state
+            metrics.CIRCUIT_BREAKER_STATE.labels(self.name).set(_STATE_VALUES[state])
+            metrics.CIRCUIT_BREAKER_TRANSITIONS.labels(self.name, state).inc()
+
+    @property
+    def state(self):
+        if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def allow(self):
+        """Whether a request may go upstream now; claims the probe when half-open"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def cancel(self):
+        """Give back a permission from allow() that ended up not being used"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self._probe_in_flight = False
+        self._transition(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self._opened_at = self.clock()
+            self._transition(OPEN)
@@ -0,0 +1,183 @@
+"""
+Lazily created MongoDB client
+
+Importing this module is free: motor (and pymongo underneath it) is only
+imported, and the client only created, the first time a collection is
+used. Handlers keep using ``db.news``, ``db.users`` ... exactly as before.
+
+Pool sizing comes from the MONGO_* settings below; each gunicorn worker
+has its own pool. ``warmup()`` opens connections ahead of the first
+requests, and ``pool_stats()`` reports live checked-out, available and
+waiting counts from the driver's connection pool (CMAP) events.
+
+``read_db`` is the same database for reads that tolerate some lag (list
+routes): they follow MONGO_READ_PREFERENCE, secondaries first by
+default, skipping members more than MONGO_MAX_STALENESS_SECONDS behind.
+Everything else, writes included, goes through ``db`` to the primary.
+causal.py lets users read their own writes through ``read_db``.
+"""
+import asyncio
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+def _optional_int(name):
+    value = os.environ.get(name, "")
+    return int(value) if value else None
+
+
+# Connection pool, per worker process (pymongo's defaults when unset)
+MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", 100))
+MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", 0))
+MAX_IDLE_TIME_MS = _optional_int("MONGO_MAX_IDLE_TIME_MS")
+# How long a request may wait for a free connection before failing
+WAIT_QUEUE_TIMEOUT_MS = _optional_int("MONGO_WAIT_QUEUE_TIMEOUT_MS")
+MAX_CONNECTING = int(os.environ.get("MONGO_MAX_CONNECTING", 2))
+# Connections opened by warmup(); defaults to the pool's minimum, at least one
+WARMUP_CONNECTIONS = int(os.environ.get("MONGO_WARMUP_CONNECTIONS", max(1, MIN_POOL_SIZE)))
+# Where read_db reads go: primary, primaryPreferred, secondary, secondaryPreferred or nearest
+READ_PREFERENCE = os.environ.get("MONGO_READ_PREFERENCE", "secondaryPreferred")
+# Members further behind the primary aren't read from; -1 for no limit (at least 90 otherwise)
+MAX_STALENESS_SECONDS = int(os.environ.get("MONGO_MAX_STALENESS_SECONDS", 90))
+
+_client = None
+_read_database = None
+_pool_stats = None
+
+
+def get_mongo_url():
+    # Check if we're in production or dev environment
+    is_production = os.environ.get('RENDER', '') == 'true'
+
+    if is_production:
+        # In production, use the connection_string environment variable
+        mongo_url = os.environ.get('connection_string')
+        if not mongo_url:
+            logger.warning("'connection_string' environment variable not found, falling back to MONGO_URL")
+            mongo_url = os.environ.get('MONGO_URL')
+        logger.info("Using production MongoDB connection")
+    else:
+        # In dev, use MONGO_URL from .env file
+        mongo_url = os.environ.get('MONGO_URL')
+        logger.info("Using development MongoDB connection")
+    return mongo_url
+
+
+def get_db_name():
+    # This database name should match what you want to use in MongoDB Atlas
+    return os.environ.get('DB_NAME', 'stock_news_db')
+
+
+def get_client():
+    """Return the process-wide Motor client, creating it on first use"""
+    global _client, _pool_stats
+    if _client is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        from mongo_monitoring import MongoCommandMetrics, MongoPoolStats
+
+        _pool_stats = MongoPoolStats()
+        try:
+            # Set a reasonable timeout for connection
+            _client = AsyncIOMotorClient(
+                get_mongo_url(),
+                serverSelectionTimeoutMS=10000,
+                maxPoolSize=MAX_POOL_SIZE,
+                minPoolSize=MIN_POOL_SIZE,
+                maxIdleTimeMS=MAX_IDLE_TIME_MS,
+                waitQueueTimeoutMS=WAIT_QUEUE_TIMEOUT_MS,
+                maxConnecting=MAX_CONNECTING,
+                event_listeners=[MongoCommandMetrics(), _pool_stats],
+            )
+        except Exception as e:
+            print(f"MongoDB connection error: {e}", file=sys.stderr)
+            raise
+        logger.info(f"MongoDB client created for database: {get_db_name()}")
+    return _client
+
+
+def get_database():
+    return get_client()[get_db_name()]
+
+
+def get_read_database():
+    """The database with READ_PREFERENCE applied, for reads that tolerate lag"""
+    global _read_database
+    if _read_database is None:
+        from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+
+        mode = read_pref_mode_from_name(READ_PREFERENCE)
+        # The primary is never stale, so it takes no staleness limit
+        preference = make_read_preference(mode, None, MAX_STALENESS_SECONDS if mode else -1)
+        _read_database = get_client().get_database(get_db_name(), read_preference=preference)
+        logger.info(f"Lag-tolerant reads use read preference {preference.mongos_mode}, "
+                    f"max staleness {preference.max_staleness} s")
+    return _read_database
+
+
+def close_client():
+    global _client, _pool_stats, _read_database
+    if _client is not None:
+        _client.close()
+        _client = None
+        _pool_stats = None
+        _read_database = None
+
+
+async def ping(timeout=None):
+    """Round-trip to the server; raises if it does not answer within ``timeout`` seconds"""
+    command = get_client().admin.command("ping")
+    return await (asyncio.wait_for(command, timeout) if timeout else command)
+
+
+async def warmup(connections=WARMUP_CONNECTIONS):
+    """
+    Open ``connections`` pooled connections before the first request
+
+    Concurrent pings each check out their own connection, so the pool ends
+    up with that many established and authenticated. Failures are logged;
+    the app still starts and connects on demand.
+    """
+    try:
+        await asyncio.gather(*(ping() for _ in range(min(connections, MAX_POOL_SIZE or connections))))
+        logger.info(f"MongoDB pool warmed up: {pool_stats()}")
+    except Exception as e:
+        logger.warning(f"MongoDB warmup failed: {e}")
+
+
+def pool_stats():
+    """Live pool counts per server, empty until the client exists"""
+    return _pool_stats.stats() if _pool_stats is not None else {}
+
+
+def pool_options():
+    return {
+        "max_pool_size": MAX_POOL_SIZE,
+        "min_pool_size": MIN_POOL_SIZE,
+        "max_idle_time_ms": MAX_IDLE_TIME_MS,
+        "wait_queue_timeout_ms": WAIT_QUEUE_TIMEOUT_MS,
+        "max_connecting": MAX_CONNECTING,
+        "read_preference": READ_PREFERENCE,
+        "max_staleness_seconds": MAX_STALENESS_SECONDS,
+    }
+
+
+class LazyDatabase:
+    """Stand-in for ``client[db_name]`` that defers creating the client"""
+
+    def __init__(self, get=get_database):
+        self._get = get
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._get(), name)
+
+    def __getitem__(self, name):
+        return self._get()[name]
+
+
+db = LazyDatabase()
+read_db = LazyDatabase(get_read_database)
@@ -0,0 +1,153 @@
+"""
+Strong ETags and 304 Not Modified for JSON API responses
+
+ETagMiddleware tags every 200 JSON response to GET/HEAD with a hash of
+the serialized body and answers a matching If-None-Match with a bodyless
+304, so unchanged dashboard polls cost headers only.
+
+Routes whose data carries its own version (a quote tick, the fetch time
+of a cached NewsAPI response) can call ``versioned()`` before building
+the body: the ETag then comes from the version and a matching request is
+answered without serializing anything. Either way the 304 carries the
+headers the 200 would have had, less those describing a body. The
+middleware leaves responses that already carry an ETag alone.
+"""
+import hashlib
+from collections import OrderedDict
+
+from fastapi import Request, Response
+
+import metrics
+
+# Remember body sizes of recently sent versioned ETags so 304s answered
+# by routes can be credited with the bytes they saved
+_SIZE_MEMORY = 4096
+# Describe a body, so a 304 doesn't carry them; it keeps every other header
+# the 200 would have had (CORS, Vary, Cache-Control...)
+_BODY_HEADERS = {b"content-length", b"content-type", b"content-encoding", b"transfer-encoding", b"content-range"}
+
+
+def _tag(digest_input):
+    return '"' + hashlib.blake2b(digest_input, digest_size=16).hexdigest() + '"'
+
+
+def if_none_match(header, etag):
+    """Weak comparison of an If-None-Match header against ``etag`` (RFC 9110)"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def not_modified(headers):
+    """Bodyless 304 with ``headers``, those of the 200 it stands in for"""
+    response = Response(status_code=304)
+    response.raw_headers.extend((k, v) for k, v in headers.raw if k.lower() not in _BODY_HEADERS)
+    return response
+
+
+def versioned(request: Request, response: Response, *version):
+    """
+    Tag the response with an ETag derived from ``version``
+
+    Returns a 304 response to send instead when the client already has
+    this version, otherwise None (and the route builds its body as usual).
+    """
+    etag = _tag(repr((request.url.path, version)).encode())
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if if_none_match(request.headers.get("if-none-match"), etag):
+        return not_modified(response.headers)
+    return None
+
+
+class ETagMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._sizes = OrderedDict()
+
+    def _remember_size(self, etag, size):
+        self._sizes[etag] = size
+        self._sizes.move_to_end(etag)
+        if len(self._sizes) > _SIZE_MEMORY:
+            self._sizes.popitem(last=False)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        request_tag = None
+        for name, value in scope["headers"]:
+            if name == b"if-none-match":
+                request_tag = value.decode("latin-1")
+                break
+
+        start = None
+        chunks = []
+        passthrough_etag = None
+        passthrough_size = 0
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough_etag, passthrough_size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = message.get("headers", [])
+                etag = next((v.decode("latin-1") for k, v in headers if k == b"etag"), None)
+                if status == 304 and etag is not None:
+                    self._count(scope, self._sizes.get(etag, 0))
+                    await send(message)
+                    return
+                content_type = next((v for k, v in headers if k == b"content-type"), b"")
+                if status != 200 or etag is not None or not content_type.startswith(b"application/json"):
+                    passthrough_etag = etag if status == 200 else None
+                    await send(message)
+                    return
+                # Hold the start message until the whole body has been hashed
+                start = message
+                return
+
+            if start is None:
+                if passthrough_etag is not None:
+                    passthrough_size += len(message.get("body", b""))
+                    if not message.get("more_body", False):
+                        self._remember_size(passthrough_etag, passthrough_size)
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(chunks)
+            etag = _tag(body)
+            headers = list(start.get("headers", []))
+            headers.append((b"etag", etag.encode()))
+            if not any(k == b"cache-control" for k, _ in headers):
+                headers.append((b"cache-control", b"no-cache"))
+            if if_none_match(request_tag, etag):
+                self._count(scope, len(body))
+                await send({
+                    "type": "http.response.start",
+                    "status": 304,
+                    "headers": [(k, v) for k, v in headers if k.lower() not in _BODY_HEADERS],
+                })
+                await send({"type": "http.response.body", "body": b""})
+                return
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _count(scope, saved):
+        route = getattr(scope.get("route"), "path", "<unmatched>")
+        metrics.ETAG_NOT_MODIFIED.labels(route).inc()
+        metrics.ETAG_BYTES_SAVED.labels(route).inc(saved)
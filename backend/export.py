@@ -0,0 +1,94 @@
+"""
+Streaming NDJSON and CSV exports straight from MongoDB cursors
+
+``export_response()`` turns a Motor cursor into a StreamingResponse. Rows
+are pulled one cursor batch at a time, encoded, and sent in chunks of
+about CHUNK_BYTES. Memory stays constant whatever the size of the
+result. Each chunk is only produced after the previous one has been
+handed to the server, whose ``send`` waits while the client's socket is
+full, so a slow reader slows the cursor down instead of piling up data.
+If the client disconnects, the generator is closed and so is the cursor.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+from fastapi.responses import StreamingResponse
+
+# Documents fetched per cursor round trip
+CURSOR_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 500))
+# Encoded rows are sent in chunks of roughly this size
+CHUNK_BYTES = 64 * 1024
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        # Lists (affected_stocks, validated_sources ...) go in one cell
+        return "|".join(str(v) for v in value)
+    return "" if value is None else value
+
+
+async def _chunks(cursor, encode, header=b""):
+    """Encode every document with ``encode`` and yield ~CHUNK_BYTES pieces"""
+    buffer = bytearray(header)
+    try:
+        async for document in cursor:
+            buffer += encode(document)
+            if len(buffer) >= CHUNK_BYTES:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+    finally:
+        await cursor.close()
+
+
+def ndjson_stream(cursor, fields):
+    def encode(document):
+        row = {field: document.get(field) for field in fields}
+        return json.dumps(row, default=_default, separators=(",", ":")).encode() + b"\n"
+
+    return _chunks(cursor, encode)
+
+
+def csv_stream(cursor, fields):
+    line = io.StringIO()
+    writer = csv.writer(line)
+
+    def encode_row(values):
+        line.seek(0)
+        line.truncate()
+        writer.writerow(values)
+        return line.getvalue().encode()
+
+    def encode(document):
+        return encode_row([_csv_value(document.get(field)) for field in fields])
+
+    return _chunks(cursor, encode, header=encode_row(fields))
+
+
+def export_response(collection, query, fields, format, filename, sort=None):
+    """StreamingResponse of every document of ``collection`` matching ``query``"""
+    projection = dict.fromkeys(fields, 1)
+    projection["_id"] = 0
+    cursor = collection.find(query, projection, batch_size=CURSOR_BATCH_SIZE)
+    if sort:
+        cursor = cursor.sort(sort)
+    stream = ndjson_stream(cursor, fields) if format == "ndjson" else csv_stream(cursor, fields)
+    return StreamingResponse(
+        stream,
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'},
+    )
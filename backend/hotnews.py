@@ -0,0 +1,346 @@
+"""
+Compact in-memory hot set of the most recent news
+
+Most news reads are for the latest few thousand articles: the front
+page, a category, or one stock's news. The hot set keeps the newest
+HOT_NEWS_SIZE articles in memory, so ``get_news`` and ``get_stock_news``
+don't have to go to MongoDB:
+
+- Each article is a slotted record rather than a dict. Dates are stored
+  as integer milliseconds, source and category strings are interned (a
+  few dozen distinct values shared by every article), and
+  ``affected_stocks`` is packed into bytes of 32-bit ids from a symbol
+  table.
+- Every list is kept in ascending (published_at, id) order: all
+  articles, plus a secondary index per category and per symbol. A page
+  is a slice from the end of one list.
+
+The set always holds *every* article published at or after its oldest
+one. So when a list has at least skip + limit entries, its newest ones
+are exactly what MongoDB would return. Otherwise the query goes to
+MongoDB, unless the set holds the whole collection. ``newest()`` returns
+None in that case.
+
+Like suggest.py, it registers with the invalidation bus. A write marks
+the article stale, and a background task re-reads it and patches the
+set. Until then, reads fall back to MongoDB, so a worker sees its own
+writes at once. A clear reloads the whole set, and so does a timer
+every HOT_NEWS_RELOAD_SECONDS, in case an event is ever missed.
+scripts/bench_hot_news.py measures bytes per article against the
+decoded documents.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import sys
+from array import array
+from datetime import datetime, timedelta
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+HOT_NEWS_SIZE = int(os.environ.get("HOT_NEWS_SIZE", 5000))
+RELOAD_SECONDS = float(os.environ.get("HOT_NEWS_RELOAD_SECONDS", 300.0))
+RETRY_SECONDS = 5.0
+FIELDS = {
+    "_id": 0, "id": 1, "title": 1, "content": 1, "url": 1, "source": 1, "published_at": 1, "category": 1,
+    "affected_stocks": 1, "confidence_score": 1, "validated_sources": 1, "created_at": 1,
+}
+
+# MongoDB dates are naive UTC with millisecond precision
+_EPOCH = datetime(1970, 1, 1)
+_MS = timedelta(milliseconds=1)
+# Packed symbol ids
+_ID_FORMAT = "I"
+
+
+def _millis(value):
+    return None if value is None else (value - _EPOCH) // _MS
+
+
+def _datetime(millis):
+    return None if millis is None else _EPOCH + timedelta(milliseconds=millis)
+
+
+def _symbol_ids(article):
+    return memoryview(article.stocks).cast(_ID_FORMAT)
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class _Article:
+    """One article of the hot set; ordered by (published, id)"""
+
+    __slots__ = ("id", "title", "content", "url", "source", "published", "category", "stocks",
+                 "confidence_score", "validated_sources", "created")
+
+    def __lt__(self, other):
+        return (self.published, self.id) < (other.published, other.id)
+
+
+class HotNews:
+    # Registered with invalidation.bus like a ReadCache of this collection
+    collection = "news"
+    key_fields = ("id",)
+
+    def __init__(self, size=HOT_NEWS_SIZE, reload_seconds=RELOAD_SECONDS):
+        self.size = size
+        self.reload_seconds = reload_seconds
+        self._reset()
+        self._stale = set()
+        # Stale keys being re-read right now
+        self._applying = set()
+        self._reload = True
+        self._loading = False
+        self._wake = None
+        self._task = None
+        self.hits = self.misses = 0
+
+    def _reset(self):
+        # Ascending (published, id): every article, then per category and per symbol id
+        self._articles = []
+        self._by_id = {}
+        self._by_category = {}
+        self._by_symbol = {}
+        # symbol <-> id; ids are never reused until the next load
+        self._symbols = []
+        self._symbol_ids = {}
+        # True while the set holds every article in the collection
+        self.complete = False
+
+    def __len__(self):
+        return len(self._articles)
+
+    @property
+    def ready(self):
+        """Whether the set is loaded and has no changes waiting to be applied"""
+        return not (self._reload or self._loading or self._stale or self._applying)
+
+    # -- building ---------------------------------------------------------
+
+    def _symbol_id(self, symbol):
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self._symbol_ids[symbol] = len(self._symbols)
+            self._symbols.append(symbol)
+        return symbol_id
+
+    def _pack(self, document):
+        article = _Article()
+        article.id = document["id"]
+        article.title = document.get("title")
+        article.content = document.get("content")
+        article.url = document.get("url")
+        article.source = _intern(document.get("source"))
+        article.published = _millis(document.get("published_at"))
+        article.category = _intern(document.get("category"))
+        symbol_ids = [self._symbol_id(symbol) for symbol in dict.fromkeys(document.get("affected_stocks") or ())]
+        article.stocks = array(_ID_FORMAT, symbol_ids).tobytes()
+        article.confidence_score = document.get("confidence_score")
+        article.validated_sources = tuple(_intern(source) for source in document.get("validated_sources") or ())
+        article.created = _millis(document.get("created_at"))
+        return article
+
+    def load(self, documents, complete):
+        """Index ``documents`` (the newest of the collection) from scratch"""
+        self._reset()
+        articles = sorted(
+            self._pack(document) for document in documents
+            if document.get("id") is not None and document.get("published_at") is not None
+        )
+        # Appending in ascending order keeps every list sorted
+        for article in articles[max(len(articles) - self.size, 0):]:
+            self._by_id[article.id] = article
+            for listed in self._lists(article):
+                listed.append(article)
+        self.complete = complete and len(articles) <= self.size
+
+    def _lists(self, article):
+        yield self._articles
+        yield self._by_category.setdefault(article.category, [])
+        for symbol_id in _symbol_ids(article):
+            yield self._by_symbol.setdefault(symbol_id, [])
+
+    def _add(self, article):
+        self._by_id[article.id] = article
+        for articles in self._lists(article):
+            bisect.insort(articles, article)
+
+    def _discard(self, article):
+        del self._by_id[article.id]
+        for articles in self._lists(article):
+            del articles[bisect.bisect_left(articles, article)]
+            if not articles and articles is not self._articles:
+                self._drop_empty(article, articles)
+
+    def _drop_empty(self, article, articles):
+        if self._by_category.get(article.category) is articles:
+            del self._by_category[article.category]
+        for symbol_id in _symbol_ids(article):
+            if self._by_symbol.get(symbol_id) is articles:
+                del self._by_symbol[symbol_id]
+
+    def _evict(self):
+        """Drop the oldest article; the set no longer holds the whole collection"""
+        self._discard(self._articles[0])
+        self.complete = False
+
+    def remove(self, news_id):
+        article = self._by_id.get(news_id)
+        if article is not None:
+            self._discard(article)
+
+    def upsert(self, document):
+        """Apply a written article, keeping the set a prefix of the collection by date"""
+        self.remove(document["id"])
+        if document.get("published_at") is None:
+            return
+        article = self._pack(document)
+        # Older than everything held: articles between it and the oldest
+        # one may be missing, unless the set holds the whole collection
+        if not self.complete and (not self._articles or article < self._articles[0]):
+            return
+        self._add(article)
+        if len(self._articles) > self.size:
+            self._evict()
+
+    # -- querying ---------------------------------------------------------
+
+    def _document(self, article):
+        document = {
+            "id": article.id,
+            "title": article.title,
+            "content": article.content,
+            "url": article.url,
+            "source": article.source,
+            "published_at": _datetime(article.published),
+            "category": article.category,
+            "affected_stocks": [self._symbols[symbol_id] for symbol_id in _symbol_ids(article)],
+            "confidence_score": article.confidence_score,
+            "validated_sources": list(article.validated_sources),
+            "created_at": _datetime(article.created),
+        }
+        # Fields missing from the stored document stay missing
+        return {field: value for field, value in document.items() if value is not None}
+
+    def get(self, news_id):
+        """The article ``news_id`` as a document, or None if the set can't say"""
+        article = self._by_id.get(news_id) if self.ready else None
+        return None if article is None else self._document(article)
+
+    def newest(self, limit, skip=0, category=None, symbol=None):
+        """
+        ``find(...).sort("published_at", -1).skip(skip).limit(limit)`` over
+        all news, one category or the news affecting one symbol; None when
+        only MongoDB can answer it
+        """
+        if not self.ready or limit <= 0 or skip < 0:
+            self.misses += 1
+            return None
+        if category is not None:
+            articles = self._by_category.get(category, ())
+        elif symbol is not None:
+            symbol_id = self._symbol_ids.get(symbol)
+            articles = () if symbol_id is None else self._by_symbol.get(symbol_id, ())
+        else:
+            articles = self._articles
+        if len(articles) < skip + limit and not self.complete:
+            self.misses += 1
+            return None
+        self.hits += 1
+        end = len(articles) - skip
+        return [self._document(article) for article in reversed(articles[max(end - limit, 0):max(end, 0)])]
+
+    # -- invalidation bus -------------------------------------------------
+
+    def keys_of(self, document):
+        if not document or document.get("id") is None:
+            return []
+        return [("id", document["id"])]
+
+    def invalidate(self, keys):
+        self._stale.update(tuple(key) for key in keys)
+        self._notify()
+
+    def clear(self):
+        self._reload = True
+        self._notify()
+
+    def _notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    # -- background sync --------------------------------------------------
+
+    async def refresh(self):
+        """Apply pending changes: a full reload, or just the stale articles"""
+        if self._reload:
+            self._reload = False
+            self._loading = True
+            # Changes made from here on are applied after the load
+            self._stale.clear()
+            try:
+                documents = await db.news.find({}, FIELDS).sort("published_at", -1).limit(self.size + 1).to_list(None)
+                self.load(documents, complete=len(documents) <= self.size)
+            finally:
+                self._loading = False
+            logger.info(f"Holding the {len(self)} newest news items in memory")
+            return
+        if not self._stale:
+            return
+        # Invalidated again during the read: stale once more, re-read next time
+        stale, self._stale = self._stale, set()
+        self._applying = stale
+        try:
+            ids = [value for field, value in stale if field == "id"]
+            found = await db.news.find({"id": {"$in": ids}}, FIELDS).to_list(None)
+            for document in found:
+                self.upsert(document)
+            found_ids = {document["id"] for document in found}
+            for news_id in ids:
+                if news_id not in found_ids:
+                    self.remove(news_id)
+        finally:
+            self._applying = set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_reload = loop.time() + self.reload_seconds
+        while True:
+            # Changes arriving while we refresh wake the next iteration
+            self._wake.clear()
+            try:
+                if loop.time() >= next_reload:
+                    next_reload = loop.time() + self.reload_seconds
+                    self._reload = True
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Could not refresh the news hot set, reloading in {RETRY_SECONDS} s: {e}")
+                self._reload = True
+                await asyncio.sleep(RETRY_SECONDS)
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(next_reload - loop.time(), 0.1))
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+hot = HotNews()
@@ -0,0 +1,293 @@
+"""
+Per-user net news impact on their favorite stocks
+
+Every StockImpact is one entry of a sparse news x stock matrix M. A news
+item's weight is its confidence score, decayed exponentially with its age
+(IMPACT_HALF_LIFE_HOURS), so the net impact on every stock at once is
+
+    v = M.T @ (confidence * 0.5 ** (age / half_life))
+
+and a user's summary is ``v`` read at their favorites. ``v`` is cached for
+IMPACT_CACHE_SECONDS, so a single summary is a handful of lookups; batch
+mode multiplies a sparse users x stocks favorites matrix by ``v``.
+
+Each worker keeps its own matrix, loaded from MongoDB in the background
+at startup and then topped up with impacts created since the previous
+refresh. Summaries are answered from the matrix as it is and start the
+next refresh without waiting for it; only a worker with nothing loaded
+yet waits. The matrix covers IMPACT_HORIZON_HOURS (by default 20
+half-lives, after which a news item keeps less than a millionth of its
+weight): the first load reads that much, in batches of LOAD_BATCH, and
+every refresh drops news that has aged past it. scipy is only imported
+once the matrix is first read.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+HALF_LIFE_HOURS = float(os.environ.get("IMPACT_HALF_LIFE_HOURS", 24.0))
+# How long a computed impact vector is reused; decay over it is negligible
+CACHE_SECONDS = float(os.environ.get("IMPACT_CACHE_SECONDS", 5.0))
+# How often new impacts are pulled from MongoDB
+REFRESH_SECONDS = float(os.environ.get("IMPACT_REFRESH_SECONDS", 30.0))
+# Re-read this much history on every refresh so slow writes aren't missed
+REFRESH_OVERLAP = timedelta(seconds=30)
+# How far back the first load reads; older news has decayed to nothing
+HORIZON_HOURS = float(os.environ.get("IMPACT_HORIZON_HOURS", 20 * HALF_LIFE_HOURS))
+LOAD_BATCH = 5000
+
+
+def _epoch(value):
+    if isinstance(value, datetime):
+        return value.timestamp() if value.tzinfo else (value - datetime(1970, 1, 1)).total_seconds()
+    return float(value or 0.0)
+
+
+class ImpactMatrix:
+    """Sparse news x stock impact scores with per-news time and weight"""
+
+    def __init__(self, half_life_hours=HALF_LIFE_HOURS, cache_seconds=CACHE_SECONDS, clock=time.time):
+        self.decay_rate = math.log(2) / (half_life_hours * 3600)
+        self.half_life_hours = half_life_hours
+        self.cache_seconds = cache_seconds
+        self.clock = clock
+        self.news_index = {}
+        self.stock_index = {}
+        self.symbols = []
+        self.published = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.matrix = None
+        # impact id -> news id
+        self._seen = {}
+        # Appended to by add_news()/add_impact(), merged on the next read
+        self._pending_news = ([], [])
+        self._pending = ([], [], [])
+        self._vector = None
+        self._vector_at = 0.0
+        self._counts = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self._seen)
+
+    def __contains__(self, impact_id):
+        return impact_id in self._seen
+
+    def add_news(self, news_id, published_at, confidence=1.0):
+        row = self.news_index.get(news_id)
+        if row is None:
+            row = self.news_index[news_id] = len(self.news_index)
+            self._pending_news[0].append(_epoch(published_at))
+            self._pending_news[1].append(confidence)
+        return row
+
+    def add_impact(self, impact_id, news_id, symbol, score):
+        """Record one impact; the news item must have been added first"""
+        if impact_id in self._seen:
+            return
+        self._seen[impact_id] = news_id
+        col = self.stock_index.get(symbol)
+        if col is None:
+            col = self.stock_index[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        rows, cols, scores = self._pending
+        rows.append(self.news_index[news_id])
+        cols.append(col)
+        scores.append(score)
+
+    def _merge_pending(self):
+        from scipy import sparse
+
+        published, weights = self._pending_news
+        rows, cols, scores = self._pending
+        if self.matrix is not None and not published and not rows:
+            return
+        shape = (len(self.news_index), len(self.symbols))
+        matrix = self.matrix if self.matrix is not None else sparse.csr_matrix(shape)
+        matrix.resize(shape)
+        if rows:
+            matrix = matrix + sparse.csr_matrix((scores, (rows, cols)), shape=shape)
+        self.matrix = matrix.tocsr()
+        self.published = np.concatenate([self.published, published])
+        self.weights = np.concatenate([self.weights, weights])
+        self._counts = self.matrix.getnnz(axis=0)
+        self._pending_news = ([], [])
+        self._pending = ([], [], [])
+        self._vector = None
+
+    def prune(self, before):
+        """Drop news published before ``before`` (epoch seconds) with their impacts"""
+        self._merge_pending()
+        keep = self.published >= before
+        if keep.all():
+            return
+        rows = np.flatnonzero(keep)
+        self.matrix = self.matrix[rows]
+        self.published = self.published[rows]
+        self.weights = self.weights[rows]
+        renumbered = np.cumsum(keep) - 1
+        self.news_index = {news_id: int(renumbered[row]) for news_id, row in self.news_index.items() if keep[row]}
+        self._seen = {impact_id: news_id for impact_id, news_id in self._seen.items() if news_id in self.news_index}
+        self._counts = self.matrix.getnnz(axis=0)
+        self._vector = None
+
+    def vector(self):
+        """Net decayed impact per stock, in ``self.symbols`` order"""
+        self._merge_pending()
+        now = self.clock()
+        if self._vector is None or now - self._vector_at > self.cache_seconds:
+            decay = np.exp(-self.decay_rate * np.maximum(0.0, now - self.published))
+            self._vector = self.matrix.T @ (self.weights * decay)
+            self._vector_at = now
+        return self._vector
+
+    def summary(self, favorites):
+        """Net impact of each favorite and their equal-weighted mean"""
+        vector = self.vector()
+        stocks = []
+        for symbol in favorites:
+            col = self.stock_index.get(symbol)
+            stocks.append({
+                "symbol": symbol,
+                "net_impact": float(vector[col]) if col is not None else 0.0,
+                "news_count": int(self._counts[col]) if col is not None else 0,
+            })
+        return {
+            "net_impact": float(np.mean([s["net_impact"] for s in stocks])) if stocks else 0.0,
+            "half_life_hours": self.half_life_hours,
+            "as_of": datetime.utcfromtimestamp(self._vector_at),
+            "stocks": stocks,
+        }
+
+    def summaries(self, favorites_by_user):
+        """
+        Batch mode: ``{user_id: net_impact}`` for every user at once
+
+        Builds a sparse users x stocks matrix of equal weights per favorite
+        and multiplies it by the impact vector.
+        """
+        from scipy import sparse
+
+        vector = self.vector()
+        user_ids = list(favorites_by_user)
+        rows, cols, weights = [], [], []
+        for row, user_id in enumerate(user_ids):
+            favorites = favorites_by_user[user_id]
+            known = [self.stock_index[s] for s in favorites if s in self.stock_index]
+            for col in known:
+                rows.append(row)
+                cols.append(col)
+                # Unknown favorites still count towards the mean, as zeros
+                weights.append(1.0 / len(favorites))
+        holdings = sparse.csr_matrix((weights, (rows, cols)), shape=(len(user_ids), len(self.symbols)))
+        return dict(zip(user_ids, (holdings @ vector).tolist()))
+
+
+class ImpactAnalytics:
+    """ImpactMatrix kept in sync with the stock_impacts collection"""
+
+    def __init__(self, refresh_seconds=REFRESH_SECONDS, horizon_hours=HORIZON_HOURS, **matrix_options):
+        self.matrix = ImpactMatrix(**matrix_options)
+        self.refresh_seconds = refresh_seconds
+        self.horizon = timedelta(hours=horizon_hours)
+        self._synced_at = None
+        self._next_refresh = 0.0
+        self._refreshing = None
+
+    async def _load(self):
+        started = datetime.utcnow()
+        since = started - self.horizon if self._synced_at is None else self._synced_at - REFRESH_OVERLAP
+        cursor = db.stock_impacts.find(
+            {"created_at": {"$gte": since}},
+            {"_id": 0, "id": 1, "news_id": 1, "stock_id": 1, "stock_symbol": 1, "impact_score": 1},
+        ).batch_size(LOAD_BATCH)
+        while True:
+            impacts = await cursor.to_list(LOAD_BATCH)
+            if not impacts:
+                break
+            await self._add(impacts)
+        self.matrix.prune(self.matrix.clock() - self.horizon.total_seconds())
+        self._synced_at = started
+
+    async def _add(self, impacts):
+        impacts = [i for i in impacts if i.get("id") not in self.matrix]
+        if not impacts:
+            return
+        # Older impacts only carry the stock's id
+        stock_ids = {i["stock_id"] for i in impacts if not i.get("stock_symbol") and i.get("stock_id")}
+        symbols = {}
+        if stock_ids:
+            async for stock in db.stocks.find({"id": {"$in": list(stock_ids)}}, {"_id": 0, "id": 1, "symbol": 1}):
+                symbols[stock["id"]] = stock["symbol"]
+        news_ids = list({i["news_id"] for i in impacts} - set(self.matrix.news_index))
+        if news_ids:
+            async for news in db.news.find(
+                {"id": {"$in": news_ids}}, {"_id": 0, "id": 1, "published_at": 1, "confidence_score": 1}
+            ):
+                confidence = news.get("confidence_score")
+                self.matrix.add_news(news["id"], news.get("published_at"), 1.0 if confidence is None else confidence)
+        for impact in impacts:
+            symbol = impact.get("stock_symbol") or symbols.get(impact.get("stock_id"))
+            if symbol and impact["news_id"] in self.matrix.news_index:
+                self.matrix.add_impact(impact["id"], impact["news_id"], symbol, impact["impact_score"])
+
+    def _start_refresh(self, force):
+        loop = asyncio.get_running_loop()
+        if self._refreshing is None and (force or loop.time() >= self._next_refresh):
+            self._next_refresh = loop.time() + self.refresh_seconds
+            self._refreshing = loop.create_task(self._load())
+            self._refreshing.add_done_callback(self._refreshed)
+
+    def _refreshed(self, task):
+        self._refreshing = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Could not load stock impacts: {task.exception()}")
+
+    async def refresh(self, force=False):
+        """
+        Pull new impacts if the last refresh is older than ``refresh_seconds``
+
+        Waits for the refresh only if ``force`` is set or nothing has been
+        loaded yet; otherwise it runs in the background.
+        """
+        self._start_refresh(force)
+        if self._refreshing is not None and (force or self._synced_at is None):
+            # Concurrent callers share one refresh
+            await asyncio.shield(self._refreshing)
+
+    async def _current(self):
+        try:
+            await self.refresh()
+        except Exception:
+            pass  # logged by _refreshed; answer from whatever is loaded
+
+    async def summary(self, favorites):
+        await self._current()
+        return self.matrix.summary(favorites)
+
+    async def summaries(self, favorites_by_user):
+        await self._current()
+        return self.matrix.summaries(favorites_by_user)
+
+    async def start(self):
+        """Start loading the matrix, so it is usually ready before the first summary"""
+        self._start_refresh(force=True)
+
+    async def stop(self):
+        if self._refreshing is not None:
+            self._refreshing.cancel()
+            try:
+                await self._refreshing
+            except (asyncio.CancelledError, Exception):
+                pass  # failures are logged by _refreshed
+
+
+analytics = ImpactAnalytics()
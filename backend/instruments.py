@@ -0,0 +1,213 @@
+"""
+Instrument registry: every stock, mutual fund and ETF the app quotes
+
+The registry is the one place instruments are defined. The quote feed
+ticks all of them (quotes.py), server.py seeds the stocks collection from
+the stock class, and ``/api/instruments/snapshot?class=`` serves a whole
+asset class at once.
+
+Instruments are loaded once into per-class arrays (symbols, names,
+exchanges, price ranges). Built-in defaults can be extended with a CSV
+file (INSTRUMENTS_PATH, columns ``symbol,name,class,exchange,min,max``)
+to tens of thousands of rows. Snapshots are serialized straight to JSON
+bytes from per-instrument prefixes and the shared quote snapshot. Each
+class is rebuilt at most once per quote tick per worker, and is tagged
+with the tick so unchanged polls get a 304.
+"""
+import csv
+import json
+import logging
+import os
+
+import numpy as np
+from fastapi import HTTPException, Request, Response
+
+import etag
+
+logger = logging.getLogger(__name__)
+
+STOCK = "stock"
+MUTUAL_FUND = "mutual_fund"
+ETF = "etf"
+CLASSES = (STOCK, MUTUAL_FUND, ETF)
+
+INSTRUMENTS_PATH = os.environ.get("INSTRUMENTS_PATH", "")
+
+# symbol, name, class, exchange, price range of the mock feed
+DEFAULT_INSTRUMENTS = [
+    ("AAPL", "Apple Inc.", STOCK, "NASDAQ", 150, 200),
+    ("GOOGL", "Alphabet Inc.", STOCK, "NASDAQ", 120, 150),
+    ("MSFT", "Microsoft Corporation", STOCK, "NASDAQ", 300, 350),
+    ("AMZN", "Amazon.com Inc.", STOCK, "NASDAQ", 120, 150),
+    ("TSLA", "Tesla Inc.", STOCK, "NASDAQ", 150, 200),
+    ("META", "Meta Platforms Inc.", STOCK, "NASDAQ", 300, 350),
+    ("NVDA", "NVIDIA Corp.", STOCK, "NASDAQ", 700, 800),
+    ("JPM", "JPMorgan Chase & Co.", STOCK, "NYSE", 150, 200),
+    ("V", "Visa Inc.", STOCK, "NYSE", 230, 280),
+    ("JNJ", "Johnson & Johnson", STOCK, "NYSE", 150, 180),
+    ("WMT", "Walmart Inc.", STOCK, "NYSE", 55, 70),
+    ("VFIAX", "Vanguard 500 Index", MUTUAL_FUND, "NASDAQ", 410, 455),
+    ("FXAIX", "Fidelity 500 Index", MUTUAL_FUND, "NASDAQ", 170, 188),
+    ("SWPPX", "Schwab S&P 500 Index", MUTUAL_FUND, "NASDAQ", 65, 73),
+    ("VTSAX", "Vanguard Total Stock", MUTUAL_FUND, "NASDAQ", 113, 125),
+    ("VBTLX", "Vanguard Total Bond", MUTUAL_FUND, "NASDAQ", 9.7, 10.8),
+    ("PRMTX", "T. Rowe Price Growth", MUTUAL_FUND, "NASDAQ", 135, 150),
+    ("AGTHX", "American Growth Fund", MUTUAL_FUND, "NASDAQ", 62, 69),
+    ("FCNTX", "Fidelity Contrafund", MUTUAL_FUND, "NASDAQ", 16.5, 18.5),
+    ("VWELX", "Vanguard Wellington", MUTUAL_FUND, "NASDAQ", 43, 48),
+    ("VDIGX", "Vanguard Dividend Growth", MUTUAL_FUND, "NASDAQ", 33.5, 37.5),
+    ("SPY", "SPDR S&P 500 ETF", ETF, "NYSE Arca", 455, 500),
+    ("QQQ", "Invesco QQQ Trust", ETF, "NASDAQ", 405, 445),
+    ("VTI", "Vanguard Total Stock ETF", ETF, "NYSE Arca", 240, 265),
+    ("VOO", "Vanguard S&P 500 ETF", ETF, "NYSE Arca", 417, 460),
+    ("ARKK", "ARK Innovation ETF", ETF, "NYSE Arca", 43, 48),
+    ("IVV", "iShares Core S&P 500", ETF, "NYSE Arca", 451, 499),
+    ("VEA", "Vanguard FTSE Developed", ETF, "NYSE Arca", 46, 51),
+    ("IEFA", "iShares Core MSCI EAFE", ETF, "BATS", 69, 76),
+    ("AGG", "iShares Core US Aggregate", ETF, "NYSE Arca", 103, 113),
+    ("BND", "Vanguard Total Bond ETF", ETF, "NASDAQ", 69, 76),
+]
+
+
+def _load_csv(path):
+    rows = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            if row.get("class") not in CLASSES:
+                logger.warning(f"Skipping {row.get('symbol')} in {path}: unknown class {row.get('class')!r}")
+                continue
+            rows.append((row["symbol"], row["name"], row["class"], row.get("exchange", ""),
+                         float(row["min"]), float(row["max"])))
+    return rows
+
+
+def _json(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class _Class:
+    """Arrays of one asset class, in registry order"""
+
+    def __init__(self, rows):
+        self.symbols = [row[0] for row in rows]
+        self.names = [row[1] for row in rows]
+        self.exchanges = [row[3] for row in rows]
+        self.low = np.array([row[4] for row in rows], dtype=float)
+        self.high = np.array([row[5] for row in rows], dtype=float)
+        # Everything before the price, serialized once
+        self.prefixes = [
+            _json({"symbol": s, "name": n, "exchange": e})[:-1] + b',"price":'
+            for s, n, e in zip(self.symbols, self.names, self.exchanges)
+        ]
+
+
+class InstrumentRegistry:
+    def __init__(self, rows=None, path=INSTRUMENTS_PATH):
+        rows = list(rows if rows is not None else DEFAULT_INSTRUMENTS)
+        if path:
+            seen = {row[0] for row in rows}
+            rows += [row for row in _load_csv(path) if row[0] not in seen]
+        self.classes = {name: _Class([row for row in rows if row[2] == name]) for name in CLASSES}
+        self.class_of = {row[0]: row[2] for row in rows}
+        self.symbols = [s for name in CLASSES for s in self.classes[name].symbols]
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def quote_info(self):
+        """``{symbol: {"name", "min", "max"}}`` for the quote feed, grouped by class"""
+        return {
+            symbol: {"name": name, "min": low, "max": high}
+            for cls in self.classes.values()
+            for symbol, name, low, high in zip(cls.symbols, cls.names, cls.low.tolist(), cls.high.tolist())
+        }
+
+    def stock_documents(self):
+        """Seed documents for the stocks collection"""
+        cls = self.classes[STOCK]
+        return [{"symbol": s, "name": n, "exchange": e} for s, n, e in zip(cls.symbols, cls.names, cls.exchanges)]
+
+
+class SnapshotCache:
+    """Pre-serialized per-class snapshots, rebuilt once per quote tick"""
+
+    def __init__(self, registry, reader):
+        self.registry = registry
+        self.reader = reader
+        # class -> (tick, body)
+        self._bodies = {}
+        # class -> rows of its instruments in the quote snapshot
+        self._rows = {}
+        self._rows_for = None
+
+    def _snapshot_rows(self, name):
+        if self._rows_for is not self.reader.index:
+            # The producer (re)laid out the snapshot
+            self._rows, self._rows_for = {}, self.reader.index
+        rows = self._rows.get(name)
+        if rows is None:
+            index = self.reader.index
+            rows = self._rows[name] = np.array(
+                [index.get(s, -1) for s in self.registry.classes[name].symbols], dtype=np.int64
+            )
+        return rows
+
+    def body(self, name):
+        """``(tick, JSON bytes)`` of the latest snapshot of class ``name``, or None before the first tick"""
+        tick = self.reader.tick
+        if tick is None:
+            return None
+        cached = self._bodies.get(name)
+        if cached is not None and cached[0] == tick:
+            return cached
+        snapshot = self.reader.snapshot()
+        if snapshot is None:
+            # The producer is laying the snapshot out again
+            return None
+        tick, records = snapshot
+        rows = self._snapshot_rows(name)
+        known = rows >= 0
+        prices = np.where(known, records["price"][rows], np.nan).tolist()
+        changes = np.where(known, records["change"][rows], np.nan).tolist()
+        items = [
+            prefix + (b'%.2f,"change":%.2f}' % (price, change) if price == price else b'null,"change":null}')
+            for prefix, price, change in zip(self.registry.classes[name].prefixes, prices, changes)
+        ]
+        body = b'{"class":"%s","tick":%d,"count":%d,"instruments":[%s]}' % (
+            name.encode(), tick, len(items), b",".join(items)
+        )
+        self._bodies[name] = (tick, body)
+        return tick, body
+
+    def response(self, request: Request, name):
+        """The class snapshot as a Response, or 304 when the client has this tick"""
+        if name not in self.registry.classes:
+            raise HTTPException(status_code=404, detail=f"Unknown asset class: {name}; use one of {', '.join(CLASSES)}")
+        tick = self.reader.tick
+        if tick is None:
+            raise HTTPException(status_code=503, detail="Quotes are not available yet")
+        headers = Response()
+        not_modified = etag.versioned(request, headers, name, tick)
+        if not_modified is not None:
+            return not_modified
+        try:
+            built = self.body(name)
+        except RuntimeError:
+            built = None
+        if built is None:
+            raise HTTPException(status_code=503, detail="Quotes are being republished, try again")
+        built, body = built
+        if built != tick:
+            # A newer tick landed in between: tag what was actually built
+            headers = Response()
+            not_modified = etag.versioned(request, headers, name, built)
+            if not_modified is not None:
+                return not_modified
+        return Response(
+            content=body,
+            media_type="application/json",
+            headers={"ETag": headers.headers["ETag"], "Cache-Control": headers.headers["Cache-Control"]},
+        )
+
+
+registry = InstrumentRegistry()
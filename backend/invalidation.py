@@ -0,0 +1,329 @@
+"""
+Read caches kept coherent by a change-event invalidation bus
+
+A ReadCache holds documents of one collection under ``(field, value)``
+keys, e.g. ``("username", "alice")``. Caches register with the bus, and
+every change to a document invalidates the keys built from its
+``key_fields`` in every worker:
+
+- Change streams: each worker watches the news, stocks and users
+  collections (``fullDocument: updateLookup``) and invalidates from the
+  events, whichever process or host made the write. This needs a replica
+  set; a single-node one is enough.
+- Fallback: on a standalone server, handlers' ``publish()`` calls are
+  appended to a small shared log (/dev/shm, next to the quote snapshot)
+  that every worker on the host tails.
+
+``publish()`` always invalidates the calling worker's caches at once, so
+a handler reads its own writes even before the change event arrives.
+Entries also expire after CACHE_TTL_SECONDS, bounding staleness if an
+event is ever missed.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from database import db
+from quote_snapshot import default_path
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", 60.0))
+# How often the fallback log is checked for other workers' writes
+POLL_SECONDS = float(os.environ.get("INVALIDATION_POLL_SECONDS", 0.2))
+# The fallback log is started afresh once it grows past this
+MAX_LOG_BYTES = 1 << 20
+RETRY_SECONDS = 5.0
+# Server error code for "$changeStream is only supported on replica sets"
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+
+class ReadCache:
+    """LRU cache of documents from one collection with a TTL per entry"""
+
+    def __init__(self, collection, key_fields, maxsize=10000, ttl=CACHE_TTL_SECONDS, clock=time.monotonic):
+        self.collection = collection
+        self.key_fields = tuple(key_fields)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self.hits = self.misses = 0
+        # Bumped by every invalidation, so a read that raced one isn't cached
+        self._generation = 0
+        self._cleared = 0
+        # key -> generation it was last invalidated at, kept while reads are in flight
+        self._invalidated = {}
+        # generation a read started at -> reads in flight
+        self._reads = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, field, value):
+        entry = self._entries.get((field, value))
+        if entry is None or entry[0] < self.clock():
+            self.misses += 1
+            return None
+        self._entries.move_to_end((field, value))
+        self.hits += 1
+        return entry[1]
+
+    def put(self, document):
+        """Cache ``document`` under each of its key fields"""
+        expires = self.clock() + self.ttl
+        for field in self.key_fields:
+            if document.get(field) is not None:
+                self._entries[(field, document[field])] = (expires, document)
+                self._entries.move_to_end((field, document[field]))
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def find_one(self, field, value):
+        """Cached ``db[collection].find_one({field: value})``"""
+        document = self.get(field, value)
+        if document is None:
+            generation = self._generation
+            self._reads[generation] = self._reads.get(generation, 0) + 1
+            try:
+                document = await db[self.collection].find_one({field: value}, {"_id": 0})
+                if document is not None and not self._invalidated_since(generation, document):
+                    self.put(document)
+            finally:
+                self._read_done(generation)
+        return document
+
+    def _invalidated_since(self, generation, document):
+        return self._cleared > generation or any(
+            self._invalidated.get(key, 0) > generation for key in self.keys_of(document)
+        )
+
+    def _read_done(self, generation):
+        self._reads[generation] -= 1
+        if not self._reads[generation]:
+            del self._reads[generation]
+        # Only invalidations newer than the oldest read in flight still matter
+        if not self._reads:
+            self._invalidated.clear()
+        elif len(self._invalidated) > self.maxsize:
+            oldest = min(self._reads)
+            self._invalidated = {key: at for key, at in self._invalidated.items() if at > oldest}
+
+    def keys_of(self, document):
+        return [(field, document[field]) for field in self.key_fields if document.get(field) is not None]
+
+    def invalidate(self, keys):
+        self._generation += 1
+        for key in keys:
+            if self._reads:
+                self._invalidated[tuple(key)] = self._generation
+            entry = self._entries.pop(tuple(key), None)
+            if entry is not None:
+                # The same document may be cached under its other keys too
+                for other in self.keys_of(entry[1]):
+                    self._entries.pop(other, None)
+
+    def clear(self):
+        self._generation += 1
+        self._cleared = self._generation
+        self._entries.clear()
+
+
+class _SharedLog:
+    """Append-only file of invalidations that workers on one host tail"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock_fd = None
+        self._fd = None
+        self._inode = None
+        self._buffer = b""
+
+    def _lock(self, operation):
+        if self._lock_fd is None:
+            self._lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._lock_fd, operation)
+
+    def append(self, event):
+        line = json.dumps(event, separators=(",", ":"), default=str).encode() + b"\n"
+        self._lock(fcntl.LOCK_SH)
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+        finally:
+            self._lock(fcntl.LOCK_UN)
+        if size > MAX_LOG_BYTES:
+            # Start a new file; readers finish the old one through their
+            # open descriptor before switching
+            self._lock(fcntl.LOCK_EX)
+            try:
+                if os.path.exists(self.path) and os.stat(self.path).st_size > MAX_LOG_BYTES:
+                    os.unlink(self.path)
+            finally:
+                self._lock(fcntl.LOCK_UN)
+
+    def _open(self, at_end):
+        try:
+            self._fd = os.open(self.path, os.O_RDONLY | os.O_CREAT, 0o644)
+        except OSError:
+            self._fd = None
+            return
+        self._inode = os.fstat(self._fd).st_ino
+        self._buffer = b""
+        if at_end:
+            os.lseek(self._fd, 0, os.SEEK_END)
+
+    def _drain(self):
+        while True:
+            chunk = os.read(self._fd, 1 << 16)
+            if not chunk:
+                break
+            self._buffer += chunk
+        # A line still being written stays buffered until it is complete
+        complete, _, self._buffer = self._buffer.rpartition(b"\n")
+        return [json.loads(line) for line in complete.split(b"\n") if line]
+
+    def read(self):
+        """Events appended since the last call; the first call skips history"""
+        if self._fd is None:
+            self._open(at_end=True)
+            return []
+        events = self._drain()
+        try:
+            rotated = os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            rotated = True
+        if rotated:
+            os.close(self._fd)
+            self._open(at_end=False)
+            if self._fd is not None:
+                events += self._drain()
+        return events
+
+    def close(self):
+        for fd in (self._fd, self._lock_fd):
+            if fd is not None:
+                os.close(fd)
+        self._fd = self._lock_fd = None
+
+
+class InvalidationBus:
+    def __init__(self, path=None, poll_seconds=POLL_SECONDS, change_streams=True):
+        self.path = path or default_path() + ".invalidations"
+        self.poll_seconds = poll_seconds
+        self.change_streams = change_streams
+        # collection -> [ReadCache]
+        self.caches = {}
+        self.streaming = False
+        self._log = _SharedLog(self.path)
+        self._task = None
+
+    def register(self, cache):
+        self.caches.setdefault(cache.collection, []).append(cache)
+        return cache
+
+    def invalidate(self, collection, document=None, keys=None):
+        """Drop ``document`` (or explicit ``keys``) from this worker's caches; no document clears them"""
+        for cache in self.caches.get(collection, ()):
+            if document is None and keys is None:
+                cache.clear()
+            else:
+                cache.invalidate(keys if keys is not None else cache.keys_of(document))
+
+    def clear(self):
+        for caches in self.caches.values():
+            for cache in caches:
+                cache.clear()
+
+    def publish(self, collection, document=None, **keys):
+        """
+        Announce a write to ``collection``
+
+        Pass the written document, or its identifying fields as keywords
+        (``publish("users", username=...)``). Without either, every cache
+        of the collection is cleared.
+        """
+        key_list = list(keys.items()) or None
+        self.invalidate(collection, document, key_list)
+        if not self.streaming:
+            event = {"pid": os.getpid(), "collection": collection}
+            if document is not None or key_list is not None:
+                event["keys"] = key_list or [
+                    key for cache in self.caches.get(collection, ()) for key in cache.keys_of(document)
+                ]
+            try:
+                self._log.append(event)
+            except OSError as e:
+                logger.warning(f"Could not share invalidation of {collection}: {e}")
+
+    async def _watch(self):
+        """Invalidate from change events until the stream fails"""
+        pipeline = [{"$match": {"ns.coll": {"$in": list(self.caches)}}}]
+        resume_token = None
+        while True:
+            try:
+                async with db.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                    if not self.streaming:
+                        # Writes made before the stream opened weren't seen
+                        self.streaming = True
+                        self.clear()
+                        logger.info("Cache invalidation is following MongoDB change streams")
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self.invalidate(change["ns"]["coll"], change.get("fullDocument"))
+            except Exception as e:
+                self.streaming = False
+                if getattr(e, "code", None) == CHANGE_STREAMS_UNSUPPORTED:
+                    raise
+                logger.warning(f"Change stream interrupted, retrying in {RETRY_SECONDS} s: {e}")
+                await asyncio.sleep(RETRY_SECONDS)
+
+    async def _tail(self):
+        pid = os.getpid()
+        while True:
+            try:
+                for event in self._log.read():
+                    if event.get("pid") != pid:
+                        self.invalidate(event["collection"], keys=event.get("keys"))
+            except Exception as e:
+                logger.warning(f"Could not read shared invalidations: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    async def _run(self):
+        self._log.read()  # start tailing from the current end
+        tail = asyncio.get_running_loop().create_task(self._tail())
+        try:
+            if not self.change_streams:
+                await tail
+            await self._watch()
+        except Exception as e:
+            logger.info(f"Change streams unavailable, sharing cache invalidations through {self.path}: {e}")
+            await tail
+        finally:
+            tail.cancel()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.streaming = False
+        self._log.close()
+
+
+bus = InvalidationBus()
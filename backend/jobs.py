@@ -0,0 +1,381 @@
+"""
+Durable job queue in MongoDB, and the workers that run it
+
+Jobs are documents in the ``jobs`` collection:
+
+    {id, kind, key, payload, status, attempts, max_attempts,
+     run_at, lease_until, worker, last_error, result, ...}
+
+- ``enqueue()`` is idempotent per ``key`` (e.g. ``impact:<news id>``), so
+  re-ingesting the same article never queues it twice.
+- A worker claims the oldest due job with one ``find_one_and_update``.
+  It is either queued with ``run_at`` in the past, or running with an
+  expired lease. The claim sets a lease of JOB_LEASE_SECONDS, which a
+  heartbeat extends while the handler runs. If the worker dies, the job
+  becomes visible again once the lease runs out.
+- Completing or failing a job only applies while the worker's claim
+  still holds: same worker, same attempt. A worker whose lease was taken
+  over cannot overwrite the new attempt.
+- A failed attempt is retried after an exponential, jittered backoff
+  (JOB_BACKOFF_SECONDS * 2 ** (attempts - 1)), until max_attempts. The
+  job then stays ``failed`` with its last error.
+
+Handlers are ``async def handler(payload, worker)`` registered per kind
+with ``@queue.handler(kind)``. They must be safe to run more than once,
+since delivery is at least once. CPU-bound work goes through
+``worker.compute()``, which runs inline with JOB_RUNNER=async and in a
+process pool with JOB_RUNNER=process.
+
+Every API worker runs JOB_WORKERS concurrent jobs; set it to 0 and run
+scripts/run_jobs.py to scale analysis separately from request serving.
+Operators can see the queue at /api/jobs/stats (ADMIN_TOKEN).
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from admin import require_admin
+from database import db
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+STATUSES = (QUEUED, RUNNING, DONE, FAILED)
+
+# Jobs run concurrently by each worker process; 0 runs none
+WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+# "async": handlers on the event loop; "process": worker.compute() in a process pool
+RUNNER = os.environ.get("JOB_RUNNER", "async")
+LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 60.0))
+MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 5))
+BACKOFF_SECONDS = float(os.environ.get("JOB_BACKOFF_SECONDS", 2.0))
+MAX_BACKOFF_SECONDS = 600.0
+# How often idle workers look for due jobs enqueued by other processes
+POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", 1.0))
+# Finished jobs are kept this long for inspection
+KEEP_FINISHED = timedelta(days=7)
+RETRY_SECONDS = 5.0
+MAX_ERROR_LENGTH = 1000
+
+
+def backoff(attempts, base=BACKOFF_SECONDS):
+    """Delay before retrying after ``attempts`` failed attempts: exponential, capped, half jittered"""
+    delay = min(base * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class JobQueue:
+    def __init__(self, collection="jobs", lease_seconds=LEASE_SECONDS):
+        self.collection = collection
+        self.lease_seconds = lease_seconds
+        # kind -> async handler(payload, worker)
+        self.handlers = {}
+        # Set on enqueue, so this process's idle workers start at once
+        self.wakeups = set()
+
+    @property
+    def jobs(self):
+        return db[self.collection]
+
+    def handler(self, kind):
+        def register(func):
+            self.handlers[kind] = func
+            return func
+
+        return register
+
+    async def ensure_indexes(self):
+        await self.jobs.create_index("id", unique=True)
+        await self.jobs.create_index("key", unique=True, sparse=True)
+        await self.jobs.create_index([("status", 1), ("run_at", 1)])
+        await self.jobs.create_index([("status", 1), ("lease_until", 1)])
+        await self.jobs.create_index("finished_at", expireAfterSeconds=int(KEEP_FINISHED.total_seconds()))
+
+    def _new(self, kind, payload, key, max_attempts, run_at, now):
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "payload": payload,
+            "status": QUEUED,
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "run_at": run_at,
+            "created_at": now,
+            "updated_at": now,
+        }
+        if key is not None:
+            job["key"] = key
+        return job
+
+    def _notify(self):
+        for wakeup in self.wakeups:
+            wakeup.set()
+
+    async def enqueue(self, kind, payload, key=None, max_attempts=MAX_ATTEMPTS, delay=0.0):
+        """Queue a job and return its id; with ``key``, the id of the job already queued under it"""
+        from pymongo import ReturnDocument
+
+        now = datetime.utcnow()
+        job = self._new(kind, payload, key, max_attempts, now + timedelta(seconds=delay), now)
+        if key is None:
+            await self.jobs.insert_one(job)
+        else:
+            job = await self.jobs.find_one_and_update(
+                {"key": key}, {"$setOnInsert": job}, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        self._notify()
+        return job["id"]
+
+    async def enqueue_many(self, kind, payloads, keys, max_attempts=MAX_ATTEMPTS):
+        """Queue one job per payload, skipping keys already queued; returns how many were new"""
+        from pymongo import UpdateOne
+
+        if not payloads:
+            return 0
+        now = datetime.utcnow()
+        result = await self.jobs.bulk_write(
+            [
+                UpdateOne({"key": key}, {"$setOnInsert": self._new(kind, payload, key, max_attempts, now, now)},
+                          upsert=True)
+                for payload, key in zip(payloads, keys)
+            ],
+            ordered=False,
+        )
+        self._notify()
+        return result.upserted_count
+
+    async def claim(self, worker_id, kinds):
+        """Lease the oldest due job of one of ``kinds`` to ``worker_id``, or return None"""
+        from pymongo import ReturnDocument
+
+        while True:
+            now = datetime.utcnow()
+            job = await self.jobs.find_one_and_update(
+                {
+                    "kind": {"$in": list(kinds)},
+                    "$or": [
+                        {"status": QUEUED, "run_at": {"$lte": now}},
+                        # Claimed by a worker that died or stalled: visible again
+                        {"status": RUNNING, "lease_until": {"$lt": now}},
+                    ],
+                },
+                {
+                    "$set": {
+                        "status": RUNNING,
+                        "worker": worker_id,
+                        "lease_until": now + timedelta(seconds=self.lease_seconds),
+                        "started_at": now,
+                        "updated_at": now,
+                    },
+                    "$inc": {"attempts": 1},
+                },
+                sort=[("run_at", 1)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None or job["attempts"] <= job["max_attempts"]:
+                return job
+            # Its leases kept expiring (e.g. it crashes its worker): give up on it
+            await self._finish(job, FAILED, error="Lease expired on every attempt")
+
+    def _claimed(self, job):
+        # Only while this attempt still holds the job
+        return {"id": job["id"], "status": RUNNING, "worker": job["worker"], "attempts": job["attempts"]}
+
+    async def extend(self, job):
+        """Renew the lease; False once the job is no longer ours"""
+        now = datetime.utcnow()
+        result = await self.jobs.update_one(
+            self._claimed(job),
+            {"$set": {"lease_until": now + timedelta(seconds=self.lease_seconds), "updated_at": now}},
+        )
+        return result.matched_count == 1
+
+    async def _finish(self, job, status, result=None, error=None):
+        now = datetime.utcnow()
+        update = {"status": status, "lease_until": None, "finished_at": now, "updated_at": now}
+        if result is not None:
+            update["result"] = result
+        if error is not None:
+            update["last_error"] = error[:MAX_ERROR_LENGTH]
+        done = await self.jobs.update_one(self._claimed(job), {"$set": update})
+        return done.matched_count == 1
+
+    async def complete(self, job, result=None):
+        return await self._finish(job, DONE, result=result)
+
+    async def fail(self, job, error):
+        """Schedule a retry with backoff, or fail the job for good; returns its new status"""
+        error = f"{type(error).__name__}: {error}"
+        if job["attempts"] >= job["max_attempts"]:
+            await self._finish(job, FAILED, error=error)
+            return FAILED
+        now = datetime.utcnow()
+        await self.jobs.update_one(
+            self._claimed(job),
+            {"$set": {
+                "status": QUEUED,
+                "run_at": now + timedelta(seconds=backoff(job["attempts"])),
+                "lease_until": None,
+                "last_error": error[:MAX_ERROR_LENGTH],
+                "updated_at": now,
+            }},
+        )
+        return QUEUED
+
+    async def get(self, job_id):
+        return await self.jobs.find_one({"id": job_id}, {"_id": 0})
+
+    async def stats(self):
+        now = datetime.utcnow()
+        kinds = {}
+        async for row in self.jobs.aggregate([{"$group": {"_id": {"kind": "$kind", "status": "$status"}, "count": {"$sum": 1}}}]):
+            counts = kinds.setdefault(row["_id"]["kind"], dict.fromkeys(STATUSES, 0))
+            counts[row["_id"]["status"]] = row["count"]
+        oldest = await self.jobs.find_one(
+            {"status": QUEUED, "run_at": {"$lte": now}}, {"run_at": 1}, sort=[("run_at", 1)]
+        )
+        expired = await self.jobs.count_documents({"status": RUNNING, "lease_until": {"$lt": now}})
+        return {
+            "kinds": kinds,
+            # How long the oldest due job has been waiting for a worker
+            "oldest_due_seconds": (now - oldest["run_at"]).total_seconds() if oldest else 0.0,
+            "expired_leases": expired,
+        }
+
+
+class Worker:
+    """Runs ``concurrency`` jobs at a time from ``queue`` in this process"""
+
+    def __init__(self, queue, concurrency=WORKERS, runner=RUNNER, poll_seconds=POLL_SECONDS):
+        if runner not in ("async", "process"):
+            raise ValueError(f"Unknown job runner {runner!r}; use async or process")
+        self.queue = queue
+        self.concurrency = concurrency
+        self.runner = runner
+        self.poll_seconds = poll_seconds
+        self.id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.processed = self.failed = 0
+        self._pool = None
+        self._wakeup = None
+        self._tasks = []
+
+    async def compute(self, func, *args):
+        """``func(*args)`` inline, or in the process pool (``func`` must then be importable)"""
+        if self._pool is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+
+    async def _heartbeat(self, job):
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            if not await self.queue.extend(job):
+                logger.warning(f"Job {job['id']} ({job['kind']}) lost its lease to another worker")
+                return
+
+    async def run(self, job):
+        heartbeat = asyncio.get_running_loop().create_task(self._heartbeat(job))
+        try:
+            try:
+                result = await self.queue.handlers[job["kind"]](job["payload"], self)
+            except Exception as e:
+                heartbeat.cancel()
+                self.failed += 1
+                status = await self.queue.fail(job, e)
+                log = logger.error if status == FAILED else logger.warning
+                log(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']}/{job['max_attempts']} "
+                    f"failed, {status}: {e}")
+            else:
+                heartbeat.cancel()
+                self.processed += 1
+                await self.queue.complete(job, result)
+        finally:
+            # Also when cancelled, or when recording the outcome fails
+            heartbeat.cancel()
+
+    async def _loop(self):
+        while True:
+            try:
+                job = await self.queue.claim(self.id, self.queue.handlers)
+            except Exception as e:
+                logger.warning(f"Could not claim a job, retrying in {RETRY_SECONDS} s: {e}")
+                await asyncio.sleep(RETRY_SECONDS)
+                continue
+            if job is not None:
+                try:
+                    await self.run(job)
+                except Exception as e:
+                    # The job stays claimed and runs again once its lease expires
+                    logger.warning(f"Could not record the outcome of job {job['id']} ({job['kind']}), "
+                                   f"retrying in {RETRY_SECONDS} s: {e}")
+                    await asyncio.sleep(RETRY_SECONDS)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        if self._tasks or self.concurrency <= 0:
+            return
+        if self.runner == "process":
+            self._pool = ProcessPoolExecutor(self.concurrency, mp_context=multiprocessing.get_context("spawn"))
+        self._wakeup = asyncio.Event()
+        self.queue.wakeups.add(self._wakeup)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._loop()) for _ in range(self.concurrency)]
+        logger.info(f"Job worker {self.id}: {self.concurrency} x {self.runner} for {', '.join(self.queue.handlers)}")
+
+    async def stop(self):
+        # Jobs cut short here are picked up again once their lease expires
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self._wakeup is not None:
+            self.queue.wakeups.discard(self._wakeup)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+queue = JobQueue()
+worker = Worker(queue)
+
+router = APIRouter(prefix="/api/jobs", dependencies=[Depends(require_admin)])
+
+
+@router.get("/stats")
+async def job_stats():
+    stats = await queue.stats()
+    stats["worker"] = {
+        "id": worker.id,
+        "runner": worker.runner,
+        "concurrency": worker.concurrency,
+        "processed": worker.processed,
+        "failed": worker.failed,
+    }
+    return stats
+
+
+@router.get("/{job_id}")
+async def job_status(job_id: str):
+    job = await queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -0,0 +1,39 @@
+"""
+Cross-worker leader election through an advisory file lock
+
+Background jobs that must run once per host rather than once per gunicorn
+worker (quote producer, NewsAPI refresh scheduler) hold a LeaderLock. The
+kernel drops the lock when its holder exits, so another worker can take
+over simply by retrying ``try_acquire()``.
+"""
+import fcntl
+import os
+
+
+class LeaderLock:
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        """Take the lock without blocking; returns whether we hold it"""
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            # Closing the descriptor releases the flock
+            os.close(self._fd)
+            self._fd = None
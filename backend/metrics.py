@@ -0,0 +1,230 @@
+"""
+Prometheus metrics shared by server.py and simple_server.py
+
+Everything here is cheap enough to leave on in production: route metrics
+bind their label children once per route, Mongo timings come straight
+from pymongo's command monitoring events (see mongo_monitoring.py) and
+the event-loop probe wakes up twice a second.
+
+When gunicorn runs several workers, set PROMETHEUS_MULTIPROC_DIR to a
+shared, empty directory and /metrics will aggregate across workers.
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+
+logger = logging.getLogger(__name__)
+
+# Buckets tuned for an API whose requests mostly finish in a few ms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# HTTP
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request, by route template",
+    ["route", "method"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_TOTAL = Counter(
+    "http_requests_total",
+    "Requests handled, by route template and status code",
+    ["route", "method", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled, by route template",
+    ["route"],
+    multiprocess_mode="livesum",
+)
+
+# MongoDB
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command round-trip time",
+    ["collection", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongo_command_failures_total",
+    "MongoDB commands that returned an error",
+    ["collection", "operation"],
+)
+MONGO_POOL_CONNECTIONS = Gauge(
+    "mongo_pool_connections",
+    "Connections in this worker's MongoDB pool, by server and state (checked_out, available, waiting)",
+    ["server", "state"],
+    multiprocess_mode="liveall",
+)
+MONGO_POOL_WAIT_FAILURES = Counter(
+    "mongo_pool_checkout_failures_total",
+    "Connection check-outs that failed, by reason (timeout, connectionError, poolClosed)",
+    ["server", "reason"],
+)
+
+# NewsAPI
+NEWSAPI_LATENCY = Histogram(
+    "newsapi_request_duration_seconds",
+    "Upstream NewsAPI request time",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+NEWSAPI_ERRORS = Counter(
+    "newsapi_errors_total",
+    "Upstream NewsAPI requests that failed",
+    ["endpoint", "reason"],
+)
+NEWSAPI_CACHE_RESULTS = Counter(
+    "newsapi_cache_results_total",
+    "How NewsAPI proxy requests were answered (hit, stale, miss, exhausted, hedged, fallback)",
+    ["endpoint", "result"],
+)
+NEWSAPI_BUDGET_REMAINING = Gauge(
+    "newsapi_budget_remaining",
+    "Requests left in the shared NewsAPI token bucket",
+    multiprocess_mode="max",
+)
+CIRCUIT_BREAKER_STATE = Gauge(
+    "circuit_breaker_state",
+    "Upstream circuit breaker state (0 closed, 1 half-open, 2 open)",
+    ["name"],
+    multiprocess_mode="max",
+)
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total",
+    "Circuit breaker state changes, by the state entered",
+    ["name", "state"],
+)
+
+# Conditional requests (see etag.py)
+ETAG_NOT_MODIFIED = Counter(
+    "http_not_modified_total",
+    "Requests answered with 304 Not Modified",
+    ["route"],
+)
+ETAG_BYTES_SAVED = Counter(
+    "http_not_modified_bytes_saved_total",
+    "Response body bytes not sent thanks to 304 Not Modified",
+    ["route"],
+)
+
+# Watchlist alerts (see alerts.py)
+ALERT_EVALUATION_SECONDS = Histogram(
+    "alert_evaluation_seconds",
+    "Time to evaluate every active alert against one quote tick",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+ALERTS_ACTIVE = Gauge(
+    "alerts_active",
+    "Active alerts held by the alert engine",
+    multiprocess_mode="max",
+)
+ALERTS_TRIGGERED = Counter(
+    "alerts_triggered_total",
+    "Alerts fired by a quote tick",
+)
+
+# Event loop
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop woke up a timer",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    APIRoute that records latency, status and in-flight requests
+
+    Labels use the route template (``/api/news/{news_id}``), never the raw
+    path, so cardinality stays bounded by the number of routes.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        route = self.path
+        in_flight = REQUESTS_IN_FLIGHT.labels(route)
+        latencies = {method: REQUEST_LATENCY.labels(route, method) for method in self.methods}
+
+        async def instrumented_handler(request: Request) -> Response:
+            method = request.method
+            status = 500
+            in_flight.inc()
+            start = time.perf_counter()
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except Exception as e:
+                status = getattr(e, "status_code", 500)
+                raise
+            finally:
+                latencies[method].observe(time.perf_counter() - start)
+                in_flight.dec()
+                REQUESTS_TOTAL.labels(route, method, status).inc()
+
+        return instrumented_handler
+
+
+@contextmanager
+def observe_newsapi(endpoint):
+    """Time an upstream NewsAPI call and count it if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        status_code = getattr(getattr(e, "response", None), "status_code", None)
+        NEWSAPI_ERRORS.labels(endpoint, str(status_code) if status_code else type(e).__name__).inc()
+        raise
+    finally:
+        NEWSAPI_LATENCY.labels(endpoint).observe(time.perf_counter() - start)
+
+
+async def _monitor_event_loop_lag(interval):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - expected))
+
+
+_lag_task = None
+
+
+def start_event_loop_monitor(interval=0.5):
+    """Start the event-loop lag probe on the running loop (idempotent)"""
+    global _lag_task
+    if _lag_task is None or _lag_task.done():
+        _lag_task = asyncio.get_running_loop().create_task(_monitor_event_loop_lag(interval))
+    return _lag_task
+
+
+def stop_event_loop_monitor():
+    global _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        _lag_task = None
+
+
+def metrics_response():
+    """Render every registered metric in the Prometheus text format"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,306 @@
+"""
+Pure ASGI middleware shared by server.py and simple_server.py
+
+Unlike ``@app.middleware("http")`` functions, these wrap ``send`` directly:
+no extra task per request, no response stream re-wrapping, and every
+constant header is encoded to bytes once when the app is built.
+
+SecurityHeadersMiddleware  fixed security headers on every response
+CORSMiddleware             CORS for a fixed origin list (or any origin)
+CompressionMiddleware      brotli or gzip for compressible bodies above a
+                           size threshold, streamed when the body is
+"""
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+SECURITY_HEADERS = {
+    # Allow JavaScript execution
+    "Content-Security-Policy": "default-src 'self'; script-src 'self' 'unsafe-inline' 'unsafe-eval'; style-src 'self' 'unsafe-inline'; img-src 'self' data: https:; connect-src 'self' https:;",
+    # Other security headers
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "X-XSS-Protection": "1; mode=block",
+}
+
+COMPRESSIBLE_TYPES = (
+    b"application/json",
+    b"application/x-ndjson",
+    b"application/javascript",
+    b"application/xml",
+    b"image/svg+xml",
+    b"text/",
+)
+
+# Smaller bodies aren't worth the CPU or the framing overhead
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+
+ALL_METHODS = "DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"
+
+
+def _encode(headers):
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()]
+
+
+def _header(headers, name):
+    for key, value in headers:
+        if key == name:
+            return value
+    return None
+
+
+class SecurityHeadersMiddleware:
+    def __init__(self, app, headers=None):
+        self.app = app
+        self.headers = _encode(SECURITY_HEADERS if headers is None else headers)
+        self._names = {name for name, _ in self.headers}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = [h for h in message.get("headers", []) if h[0] not in self._names]
+                headers.extend(self.headers)
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class CORSMiddleware:
+    """
+    CORS with every method and request header allowed
+
+    With ``allow_origins=("*",)`` any origin is accepted; when credentials
+    are allowed too, the request's Origin is echoed back instead of ``*``
+    as browsers require. ``expose_headers`` are response headers that
+    scripts on the page may read.
+    """
+
+    def __init__(self, app, allow_origins=("*",), allow_credentials=False, max_age=600, expose_headers=()):
+        self.app = app
+        self.allow_any = "*" in allow_origins
+        self.origins = {origin.encode("latin-1") for origin in allow_origins}
+        self.allow_credentials = allow_credentials
+        # Echo the request Origin whenever "*" isn't acceptable as the answer
+        self.echo_origin = not self.allow_any or allow_credentials
+        credentials = [(b"access-control-allow-credentials", b"true")] if allow_credentials else []
+        expose = [(b"access-control-expose-headers", ", ".join(expose_headers).encode())] if expose_headers else []
+        self.simple_headers = (
+            credentials + expose + ([] if self.echo_origin else [(b"access-control-allow-origin", b"*")])
+        )
+        self.preflight_headers = credentials + [
+            (b"access-control-allow-methods", ALL_METHODS.encode()),
+            (b"access-control-max-age", str(max_age).encode()),
+        ]
+
+    def _allowed(self, origin):
+        return self.allow_any or origin in self.origins
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = scope["headers"]
+        origin = _header(request_headers, b"origin")
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS" and _header(request_headers, b"access-control-request-method") is not None:
+            await self._preflight(origin, request_headers, send)
+            return
+
+        if not self._allowed(origin):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.extend(self.simple_headers)
+                if self.echo_origin:
+                    headers.append((b"access-control-allow-origin", origin))
+                    headers.append((b"vary", b"Origin"))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _preflight(self, origin, request_headers, send):
+        if not self._allowed(origin):
+            status, body = 400, b"Disallowed CORS origin"
+            headers = []
+        else:
+            status, body = 200, b"OK"
+            headers = list(self.preflight_headers)
+            headers.append((b"access-control-allow-origin", origin if self.echo_origin else b"*"))
+            if self.echo_origin:
+                headers.append((b"vary", b"Origin"))
+            requested = _header(request_headers, b"access-control-request-headers")
+            if requested is not None:
+                headers.append((b"access-control-allow-headers", requested))
+        headers.append((b"content-type", b"text/plain; charset=utf-8"))
+        headers.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+def _accepted_encoding(accept_encoding):
+    """Best encoding we support from an Accept-Encoding header, or None"""
+    if accept_encoding is None:
+        return None
+    offered = set()
+    for item in accept_encoding.decode("latin-1").lower().split(","):
+        coding, _, params = item.partition(";")
+        params = params.replace(" ", "")
+        try:
+            q = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            q = 1.0
+        if q > 0:
+            offered.add(coding.strip())
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered:
+        return "gzip"
+    return None
+
+
+def _vary_encoding(headers):
+    """``headers`` plus ``Vary: Accept-Encoding`` unless they already vary on it"""
+    headers = list(headers)
+    if not any(key == b"vary" and b"accept-encoding" in value.lower() for key, value in headers):
+        headers.append((b"vary", b"Accept-Encoding"))
+    return headers
+
+
+def _varies_by_encoding(message):
+    """Whether this response (start message) would be compressed for some client"""
+    headers = message.get("headers", [])
+    if message["status"] == 304:
+        # Stands in for a 200 that may have been compressed
+        return True
+    return (
+        message["status"] != 204
+        and _header(headers, b"content-encoding") is None
+        and (_header(headers, b"content-type") or b"").startswith(COMPRESSIBLE_TYPES)
+    )
+
+
+class _Compressor:
+    def __init__(self, encoding, gzip_level, brotli_quality):
+        if encoding == "br":
+            self._stream = brotli.Compressor(quality=brotli_quality)
+            self._flush = self._stream.flush
+            self._finish = self._stream.finish
+            self.compress = self._stream.process
+        else:
+            # wbits 31 writes a gzip header and trailer
+            self._stream = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self._flush = lambda: self._stream.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._stream.flush
+            self.compress = self._stream.compress
+
+    def chunk(self, data):
+        # Flush each chunk so streamed responses reach the client promptly
+        return self.compress(data) + self._flush()
+
+    def last(self, data):
+        return self.compress(data) + self._finish()
+
+
+class CompressionMiddleware:
+    """
+    Compress responses the client accepts in brotli or gzip
+
+    Only bodies of a compressible content type are touched. A response
+    sent in one piece is compressed when it is at least ``minimum_size``
+    bytes; a streamed response is always compressed, chunk by chunk.
+    Strong ETags become weak ones, as the compressed bytes differ from
+    what the ETag was computed over. Every response that could be
+    compressed for some client carries ``Vary: Accept-Encoding``, whether
+    or not this one was, so shared caches keep the encodings apart.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESS_MIN_BYTES, gzip_level=6, brotli_quality=4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = _accepted_encoding(_header(scope["headers"], b"accept-encoding"))
+        if encoding is None or scope["method"] == "HEAD":
+
+            async def vary_only(message):
+                if message["type"] == "http.response.start" and _varies_by_encoding(message):
+                    message = {**message, "headers": _vary_encoding(message.get("headers", []))}
+                await send(message)
+
+            await self.app(scope, receive, vary_only)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                if message["status"] == 304:
+                    passthrough = True
+                    await send({**message, "headers": _vary_encoding(message.get("headers", []))})
+                elif not _varies_by_encoding(message):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Wait for the first body chunk to decide
+                    start = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send({**start, "headers": _vary_encoding(start.get("headers", []))})
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers = [
+                    (k, v) for k, v in start.get("headers", [])
+                    if k != b"content-length" and k != b"etag"
+                ]
+                etag = _header(start.get("headers", []), b"etag")
+                if etag is not None:
+                    headers.append((b"etag", etag if etag.startswith(b"W/") else b"W/" + etag))
+                headers.append((b"content-encoding", encoding.encode()))
+                headers = _vary_encoding(headers)
+                if not more_body:
+                    body = compressor.last(body)
+                    headers.append((b"content-length", str(len(body)).encode()))
+                    await send({**start, "headers": headers})
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send({**start, "headers": headers})
+
+            data = compressor.chunk(body) if more_body else compressor.last(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
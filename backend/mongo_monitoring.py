@@ -0,0 +1,126 @@
+"""
+pymongo event listeners feeding the Prometheus metrics in metrics.py
+
+Kept apart from metrics.py so that importing the metrics does not pull in
+pymongo; this module is only imported when the Mongo client is created.
+"""
+import threading
+
+from pymongo import monitoring
+
+from metrics import MONGO_COMMAND_FAILURES, MONGO_COMMAND_LATENCY, MONGO_POOL_CONNECTIONS, MONGO_POOL_WAIT_FAILURES
+
+# Mongo commands that carry no collection name
+_ADMIN_COMMANDS = {"ping", "hello", "ismaster", "isMaster", "buildInfo", "endSessions", "saslStart", "saslContinue"}
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener feeding the Mongo histograms"""
+
+    def __init__(self):
+        # Only the started event carries the command document, so remember
+        # the collection until the matching succeeded/failed event arrives
+        self._collections = {}
+
+    def started(self, event):
+        name = event.command_name
+        if name in _ADMIN_COMMANDS:
+            return
+        target = event.command.get(name)
+        if name == "getMore":
+            target = event.command.get("collection")
+        if not isinstance(target, str):
+            target = "<none>"
+        self._collections[(event.connection_id, event.request_id)] = target
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), None)
+        if collection is not None:
+            MONGO_COMMAND_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), None)
+        if collection is not None:
+            MONGO_COMMAND_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+            MONGO_COMMAND_FAILURES.labels(collection, event.command_name).inc()
+
+
+class MongoPoolStats(monitoring.ConnectionPoolListener):
+    """
+    Live connection pool counts per server, from CMAP events
+
+    ``open`` connections are either checked out or available; ``waiting``
+    counts check-outs that have started but not yet got a connection.
+    Events arrive on pymongo's threads, hence the lock, which also covers
+    the gauges so they are set in the order the counts changed. A pool
+    is tracked from pool_created to pool_closed; connection events that
+    arrive after it closed are ignored.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # address -> {"open", "checked_out", "waiting"}
+        self._pools = {}
+
+    def _update(self, address, **deltas):
+        with self._lock:
+            pool = self._pools.get(address)
+            if pool is None:
+                return
+            for key, delta in deltas.items():
+                pool[key] += delta
+            server = "%s:%s" % address
+            MONGO_POOL_CONNECTIONS.labels(server, "checked_out").set(pool["checked_out"])
+            MONGO_POOL_CONNECTIONS.labels(server, "available").set(max(0, pool["open"] - pool["checked_out"]))
+            MONGO_POOL_CONNECTIONS.labels(server, "waiting").set(pool["waiting"])
+
+    def stats(self):
+        """``{"host:port": {"open", "checked_out", "available", "waiting"}}``"""
+        with self._lock:
+            return {
+                "%s:%s" % address: dict(pool, available=max(0, pool["open"] - pool["checked_out"]))
+                for address, pool in self._pools.items()
+            }
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pools[event.address] = {"open": 0, "checked_out": 0, "waiting": 0}
+        self._update(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            if self._pools.pop(event.address, None) is None:
+                return
+            server = "%s:%s" % event.address
+            for state in ("checked_out", "available", "waiting"):
+                # Zeroed first: in multiprocess mode the value outlives remove()
+                MONGO_POOL_CONNECTIONS.labels(server, state).set(0)
+                MONGO_POOL_CONNECTIONS.remove(server, state)
+
+    def connection_created(self, event):
+        self._update(event.address, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._update(event.address, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._update(event.address, waiting=-1)
+        MONGO_POOL_WAIT_FAILURES.labels("%s:%s" % event.address, event.reason).inc()
+
+    def connection_checked_out(self, event):
+        self._update(event.address, waiting=-1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, checked_out=-1)
@@ -0,0 +1,652 @@
+"""
+Quota-aware NewsAPI client shared by server.py and simple_server.py
+
+NewsAPI keys have a hard daily quota, so every upstream request has to
+be paid for from a token bucket shared by all workers on the host:
+
+* The bucket refills at ``(quota - burst) / window`` tokens per second
+  and holds at most ``burst`` tokens, so no window can spend more than
+  the quota.
+* Scheduled refreshes of the popular (category, country) pairs may drain
+  the bucket completely; ad-hoc requests (searches, unpopular pairs) have
+  to leave ``reserve`` tokens behind for them.
+* One elected worker runs the refresh scheduler, refreshing the stalest
+  popular pair at a steady pace that spends the scheduled share of the
+  quota evenly across the window.
+
+Responses land in a cache shared by all workers through the filesystem.
+When the budget is gone, callers get the cached copy, however old, or a
+"budget exhausted" payload with no articles instead of an error.
+
+Upstream incidents must not turn into dashboard incidents, so every
+upstream request also runs under a deadline and behind a circuit breaker
+(circuit_breaker.py). If a cached copy exists and the upstream hasn't
+answered within the hedge delay, the caller gets the cached copy right
+away and the request carries on in the background to refresh the cache.
+Once the breaker trips, cached copies are served without waiting at all.
+
+The shared cache lives in /dev/shm and is lost on redeploy, so a worker
+that refreshed anything rewrites a compact gzip snapshot of the cache on
+durable disk (NEWSAPI_SNAPSHOT_PATH) every NEWSAPI_SNAPSHOT_SECONDS and
+at shutdown, in a thread. Workers seed the cache from it at
+boot, and only one worker at a time refreshes a given stale query, so a
+restart neither serves mock headlines nor stampedes the upstream.
+
+For load tests the upstream can be recorded into, and replayed from, an
+archive (newsapi_archive.py; NEWSAPI_RECORD_PATH / NEWSAPI_REPLAY_PATH).
+A replaying client makes one replayed request per call and waits for
+it: no hedging, no sharing of concurrent requests and no stale copies
+while another worker refreshes. Load tests then measure the recorded
+upstream rather than the cache.
+"""
+import asyncio
+import fcntl
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import struct
+import tempfile
+import time
+from collections import Counter, namedtuple
+from urllib.parse import urlencode
+
+import metrics
+from circuit_breaker import CircuitBreaker
+from leader import LeaderLock
+from newsapi_archive import RECORDED, ArchiveRecorder, ArchiveReplay
+
+logger = logging.getLogger(__name__)
+
+NEWS_API_URL = "https://newsapi.org/v2"
+
+DAILY_QUOTA = int(os.environ.get("NEWSAPI_DAILY_QUOTA", 100))
+QUOTA_WINDOW_SECONDS = float(os.environ.get("NEWSAPI_QUOTA_WINDOW_SECONDS", 86400))
+# Share of the quota that may be spent in one burst
+BURST_FRACTION = float(os.environ.get("NEWSAPI_BURST_FRACTION", 0.1))
+# Share of the quota set aside for scheduled refreshes
+SCHEDULED_SHARE = float(os.environ.get("NEWSAPI_SCHEDULED_SHARE", 0.5))
+CACHE_TTL_SECONDS = float(os.environ.get("NEWSAPI_CACHE_TTL_SECONDS", 900))
+# (category, country) pairs that are always kept warm, e.g. "business:us,technology:us"
+REFRESH_PAIRS = os.environ.get("NEWSAPI_REFRESH_PAIRS", "business:us")
+# How many of the most requested pairs the scheduler keeps warm on top of those
+REFRESH_TOP = int(os.environ.get("NEWSAPI_REFRESH_TOP", 3))
+# Requests for a pair count half as much after this long
+POPULARITY_HALF_LIFE_SECONDS = 6 * 3600.0
+# Decay is applied at most this often
+POPULARITY_DECAY_SECONDS = 60.0
+# The only values top-headlines accepts, so the only pairs worth keeping warm
+CATEGORIES = frozenset(("business", "entertainment", "general", "health", "science", "sports", "technology"))
+COUNTRIES = frozenset((
+    "ae", "ar", "at", "au", "be", "bg", "br", "ca", "ch", "cn", "co", "cu", "cz", "de", "eg", "fr", "gb", "gr",
+    "hk", "hu", "id", "ie", "il", "in", "it", "jp", "kr", "lt", "lv", "ma", "mx", "my", "ng", "nl", "no", "nz",
+    "ph", "pl", "pt", "ro", "rs", "ru", "sa", "se", "sg", "si", "sk", "th", "tr", "tw", "ua", "us", "ve", "za",
+))
+# How often a worker that isn't running the scheduler checks whether it should
+ELECTION_SECONDS = 30.0
+# Durable warm-start snapshot of the cache; set to an empty string to disable
+SNAPSHOT_PATH = os.environ.get(
+    "NEWSAPI_SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "newsapi-snapshot.json.gz")
+)
+SNAPSHOT_MAX_ENTRIES = int(os.environ.get("NEWSAPI_SNAPSHOT_MAX_ENTRIES", 200))
+# How often a worker that refreshed anything rewrites the snapshot
+SNAPSHOT_SECONDS = float(os.environ.get("NEWSAPI_SNAPSHOT_SECONDS", 60.0))
+# Total time an upstream request may take before the caller gives up on it
+DEADLINE_SECONDS = float(os.environ.get("NEWSAPI_DEADLINE_SECONDS", 3.0))
+# How long to wait for the upstream before answering from cache instead
+HEDGE_SECONDS = float(os.environ.get("NEWSAPI_HEDGE_SECONDS", 0.3))
+BREAKER_FAILURES = int(os.environ.get("NEWSAPI_BREAKER_FAILURES", 5))
+BREAKER_RESET_SECONDS = float(os.environ.get("NEWSAPI_BREAKER_RESET_SECONDS", 30.0))
+# Append every upstream response to this archive (newsapi_archive.py)
+RECORD_PATH = os.environ.get("NEWSAPI_RECORD_PATH", "")
+# Serve responses from this archive instead of NewsAPI
+REPLAY_PATH = os.environ.get("NEWSAPI_REPLAY_PATH", "")
+# "recorded" replays each response after its recorded latency, "max" at once
+REPLAY_SPEED = os.environ.get("NEWSAPI_REPLAY_SPEED", RECORDED)
+
+
+class UpstreamError(Exception):
+    """NewsAPI could not answer and there was nothing cached to fall back on"""
+
+    status_code = 502
+
+
+class UpstreamTimeout(UpstreamError):
+    status_code = 504
+
+
+class UpstreamUnavailable(UpstreamError):
+    status_code = 503
+
+
+class ReplayMiss(UpstreamError):
+    """The replay archive has no recording of the query"""
+
+    status_code = 404
+
+
+def _is_upstream_fault(exc):
+    if isinstance(exc, ReplayMiss):
+        return False
+    # Our own bad requests (400, 401, 426...) say nothing about NewsAPI's health
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status is None or status == 429 or status >= 500
+
+
+def default_state_dir():
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.environ.get("NEWSAPI_STATE_DIR", os.path.join(base, "connect-the-plots-newsapi"))
+
+
+class SharedTokenBucket:
+    """Token bucket whose state lives in a file so every worker draws from it"""
+
+    _STATE = struct.Struct("<dd")  # tokens, updated_at
+
+    def __init__(self, path, capacity, rate):
+        self.path = path
+        self.capacity = capacity
+        self.rate = rate
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def _update(self, cost=0.0, reserve=0.0):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            now = time.time()
+            raw = os.pread(self._fd, self._STATE.size, 0)
+            if len(raw) == self._STATE.size:
+                tokens, updated_at = self._STATE.unpack(raw)
+                tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * self.rate)
+            else:
+                # Fresh bucket: start full
+                tokens = self.capacity
+            granted = cost == 0 or tokens - cost >= reserve
+            if granted:
+                tokens -= cost
+            os.pwrite(self._fd, self._STATE.pack(tokens, now), 0)
+            return granted, tokens
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def try_acquire(self, reserve=0.0):
+        """Spend one token unless that would leave fewer than ``reserve``"""
+        granted, tokens = self._update(1.0, reserve)
+        metrics.NEWSAPI_BUDGET_REMAINING.set(tokens)
+        return granted
+
+    def remaining(self):
+        _, tokens = self._update()
+        metrics.NEWSAPI_BUDGET_REMAINING.set(tokens)
+        return tokens
+
+    def seconds_until(self, tokens):
+        """How long until the bucket holds ``tokens`` tokens"""
+        missing = tokens - self.remaining()
+        return max(0.0, missing / self.rate) if self.rate > 0 else float("inf")
+
+    def close(self):
+        os.close(self._fd)
+
+
+CacheEntry = namedtuple("CacheEntry", ["fetched_at", "body"])
+
+
+class ResponseCache:
+    """Upstream responses shared across workers, one JSON file per query"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        # key -> (mtime_ns, CacheEntry), so unchanged files are parsed once
+        self._memo = {}
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        memo = self._memo.get(key)
+        if memo is not None and memo[0] == mtime_ns:
+            return memo[1]
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        entry = CacheEntry(data["fetched_at"], data["body"])
+        self._memo[key] = (mtime_ns, entry)
+        return entry
+
+    def entries(self):
+        """Every cached ``(key, CacheEntry)``, in no particular order"""
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            yield data["key"], CacheEntry(data["fetched_at"], data["body"])
+
+    def try_claim(self, key):
+        """Claim the right to refresh ``key`` across workers; None if someone else has it"""
+        claim = LeaderLock(self._path(key)[:-len(".json")] + ".lock")
+        return claim if claim.try_acquire() else None
+
+    def put(self, key, body, fetched_at=None):
+        entry = CacheEntry(fetched_at or time.time(), body)
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"key": key, "fetched_at": entry.fetched_at, "body": body}, f)
+        # Readers in other workers see either the old or the new file
+        os.replace(tmp_path, path)
+        self._memo[key] = (os.stat(path).st_mtime_ns, entry)
+        return entry
+
+
+class ResponseSnapshot:
+    """Gzip-compressed JSON snapshot of the response cache, replaced atomically"""
+
+    def __init__(self, path, max_entries=SNAPSHOT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+
+    def load(self):
+        try:
+            with gzip.open(self.path, "rt") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable NewsAPI snapshot {self.path}: {e}")
+            return []
+        return [(item["key"], CacheEntry(item["fetched_at"], item["body"])) for item in data.get("entries", [])]
+
+    def write(self, entries):
+        # Keep the most recently fetched responses
+        entries = sorted(entries, key=lambda item: item[1].fetched_at, reverse=True)[: self.max_entries]
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+                f.write(json.dumps({
+                    "version": 1,
+                    "written_at": time.time(),
+                    "entries": [
+                        {"key": key, "fetched_at": entry.fetched_at, "body": entry.body} for key, entry in entries
+                    ],
+                }, separators=(",", ":")).encode())
+                f.flush()
+                raw.flush()
+                os.fsync(raw.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def budget_exhausted_response(retry_after):
+    return {
+        "status": "ok",
+        "totalResults": 0,
+        "articles": [],
+        "budgetExhausted": True,
+        "retryAfter": int(retry_after) + 1,
+    }
+
+
+def _parse_pairs(spec):
+    pairs = []
+    for item in spec.split(","):
+        if ":" in item:
+            category, country = item.strip().split(":", 1)
+            pairs.append((category, country))
+    return pairs
+
+
+class NewsAPIClient:
+    def __init__(
+        self,
+        state_dir=None,
+        quota=DAILY_QUOTA,
+        window=QUOTA_WINDOW_SECONDS,
+        burst_fraction=BURST_FRACTION,
+        scheduled_share=SCHEDULED_SHARE,
+        cache_ttl=CACHE_TTL_SECONDS,
+        refresh_pairs=REFRESH_PAIRS,
+        refresh_top=REFRESH_TOP,
+        base_url=NEWS_API_URL,
+        deadline=DEADLINE_SECONDS,
+        hedge=HEDGE_SECONDS,
+        breaker=None,
+        snapshot_path=SNAPSHOT_PATH,
+        record_path=RECORD_PATH,
+        replay_path=REPLAY_PATH,
+        replay_speed=REPLAY_SPEED,
+    ):
+        self.state_dir = state_dir or default_state_dir()
+        self.base_url = base_url
+        self.cache_ttl = cache_ttl
+        self.deadline = deadline
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker("newsapi", BREAKER_FAILURES, BREAKER_RESET_SECONDS)
+        self.snapshot = ResponseSnapshot(snapshot_path) if snapshot_path else None
+        self.recorder = ArchiveRecorder(record_path) if record_path else None
+        self.replay = ArchiveReplay(replay_path, replay_speed) if replay_path else None
+        burst = max(1.0, quota * burst_fraction)
+        self.rate = max(0.0, quota - burst) / window
+        self.reserve = burst * scheduled_share
+        self.scheduled_rate = self.rate * scheduled_share
+        self.refresh_pairs = _parse_pairs(refresh_pairs)
+        self.refresh_top = refresh_top
+        # (category, country) -> requests, decayed with POPULARITY_HALF_LIFE_SECONDS;
+        # only valid pairs are counted, so it holds at most a few hundred
+        self.popularity = Counter()
+        self._decayed_at = time.monotonic()
+        self._burst = burst
+        self._bucket = None
+        self._cache = None
+        self._leader = None
+        self._in_flight = {}
+        self._task = None
+        self._snapshot_task = None
+        # Set when this worker cached a response the snapshot doesn't hold yet
+        self._snapshot_dirty = False
+
+    def _ensure_state(self):
+        if self._cache is None:
+            os.makedirs(self.state_dir, exist_ok=True)
+            self._bucket = SharedTokenBucket(os.path.join(self.state_dir, "budget"), self._burst, self.rate)
+            self._cache = ResponseCache(self.state_dir)
+            self._leader = LeaderLock(os.path.join(self.state_dir, "scheduler.lock"))
+
+    @property
+    def bucket(self):
+        self._ensure_state()
+        return self._bucket
+
+    @property
+    def cache(self):
+        self._ensure_state()
+        return self._cache
+
+    @staticmethod
+    def cache_key(endpoint, params):
+        return f"{endpoint}?{urlencode(sorted(params.items()))}"
+
+    def _request(self, endpoint, params, key):
+        import requests
+
+        start = time.perf_counter()
+        response = requests.get(
+            f"{self.base_url}/{endpoint}",
+            params={**params, "apiKey": os.environ.get("NEWS_API_KEY")},
+            timeout=self.deadline,
+        )
+        response.raise_for_status()
+        body = response.json()
+        if self.recorder is not None:
+            self.recorder.record(key, time.perf_counter() - start, body)
+        return body
+
+    def _fetch_upstream(self, endpoint, params, key):
+        with metrics.observe_newsapi(endpoint):
+            body = self._request(endpoint, params, key)
+        entry = self.cache.put(key, body)
+        self._snapshot_dirty = True
+        return entry
+
+    async def _write_snapshot(self):
+        """Rewrite the durable snapshot in a thread if this worker cached anything since the last write"""
+        if self.snapshot is None or not self._snapshot_dirty:
+            return
+        self._snapshot_dirty = False
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, lambda: self.snapshot.write(self.cache.entries())
+            )
+        except OSError as e:
+            self._snapshot_dirty = True
+            logger.warning(f"Could not write NewsAPI snapshot {self.snapshot.path}: {e}")
+
+    async def _run_snapshots(self):
+        while True:
+            await asyncio.sleep(SNAPSHOT_SECONDS)
+            await self._write_snapshot()
+
+    async def _replay_upstream(self, endpoint, key):
+        with metrics.observe_newsapi(endpoint):
+            try:
+                latency, body = self.replay.get(key)
+            except KeyError:
+                raise ReplayMiss(f"No recorded NewsAPI response for {key}") from None
+            # On the loop: a sleeping thread per request would exhaust the
+            # default executor and queue replays behind each other
+            await asyncio.sleep(latency)
+        return await asyncio.to_thread(self.cache.put, key, body)
+
+    def _record_outcome(self, future):
+        if future.cancelled():
+            self.breaker.cancel()
+        elif future.exception() is None or not _is_upstream_fault(future.exception()):
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def _upstream(self, endpoint, params, key, claim=None):
+        if self.replay is not None:
+            # Every replayed call is its own upstream request
+            pending = asyncio.ensure_future(self._replay_upstream(endpoint, key))
+            pending.add_done_callback(self._record_outcome)
+            return pending
+        # Concurrent misses for the same query share one upstream request,
+        # which runs (and is cached) even if the callers stop waiting for it
+        pending = self._in_flight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(asyncio.to_thread(self._fetch_upstream, endpoint, params, key))
+            self._in_flight[key] = pending
+            pending.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            pending.add_done_callback(self._record_outcome)
+            if claim is not None:
+                pending.add_done_callback(lambda _: claim.release())
+        return pending
+
+    def _fallback(self, endpoint, entry, result, error):
+        if entry is not None:
+            metrics.NEWSAPI_CACHE_RESULTS.labels(endpoint, result).inc()
+            return entry.body
+        raise error
+
+    async def get(self, endpoint, params, scheduled=False):
+        """
+        Answer a NewsAPI query, spending budget only when the cache can't
+
+        ``scheduled`` requests come from the refresh scheduler: they always
+        go upstream and may use the budget reserved for them.
+        """
+        key = self.cache_key(endpoint, params)
+        entry = self.cache.get(key)
+        if not scheduled and entry is not None:
+            if time.time() - entry.fetched_at < self.cache_ttl:
+                metrics.NEWSAPI_CACHE_RESULTS.labels(endpoint, "hit").inc()
+                return entry.body
+            if self._is_kept_warm(endpoint, params):
+                # The scheduler will refresh it; don't pay for it twice
+                metrics.NEWSAPI_CACHE_RESULTS.labels(endpoint, "stale").inc()
+                return entry.body
+
+        pending = self._in_flight.get(key)
+        if pending is None:
+            claim = None
+            if entry is not None and not scheduled and self.replay is None:
+                # Another worker is already refreshing this query
+                claim = self.cache.try_claim(key)
+                if claim is None:
+                    metrics.NEWSAPI_CACHE_RESULTS.labels(endpoint, "stale").inc()
+                    return entry.body
+            if not self.breaker.allow():
+                if claim is not None:
+                    claim.release()
+                return self._fallback(endpoint, entry, "fallback", UpstreamUnavailable("NewsAPI is unavailable"))
+            # Replayed responses cost nothing. The bucket's flock may block, so off the loop
+            if self.replay is None and not await asyncio.to_thread(
+                self.bucket.try_acquire, 0.0 if scheduled else self.reserve
+            ):
+                self.breaker.cancel()
+                if claim is not None:
+                    claim.release()
+                if entry is not None:
+                    metrics.NEWSAPI_CACHE_RESULTS.labels(endpoint, "stale").inc()
+                    return entry.body
+                metrics.NEWSAPI_CACHE_RESULTS.labels(endpoint, "exhausted").inc()
+                return budget_exhausted_response(await asyncio.to_thread(self.bucket.seconds_until, self.reserve + 1))
+            metrics.NEWSAPI_CACHE_RESULTS.labels(endpoint, "miss").inc()
+            pending = self._upstream(endpoint, params, key, claim)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        try:
+            if entry is not None and not scheduled and self.replay is None:
+                done, _ = await asyncio.wait({pending}, timeout=self.hedge)
+                if not done:
+                    return self._fallback(endpoint, entry, "hedged", None)
+            return (await asyncio.wait_for(asyncio.shield(pending), max(0.0, deadline - loop.time()))).body
+        except asyncio.TimeoutError:
+            return self._fallback(endpoint, entry, "fallback", UpstreamTimeout("NewsAPI did not answer in time"))
+        except ReplayMiss as e:
+            return self._fallback(endpoint, entry, "fallback", e)
+        except Exception as e:
+            logger.warning(f"NewsAPI request for {endpoint} failed: {type(e).__name__}")
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            detail = f"NewsAPI request failed (status {status})" if status else "NewsAPI request failed"
+            return self._fallback(endpoint, entry, "fallback", UpstreamError(detail))
+
+    def fresh_version(self, endpoint, params):
+        """
+        fetched_at of the cached response ``get()`` would return as-is, else None
+
+        Lets routes answer conditional requests without touching the body.
+        """
+        entry = self.cache.get(self.cache_key(endpoint, params))
+        if entry is None:
+            return None
+        if time.time() - entry.fetched_at < self.cache_ttl or self._is_kept_warm(endpoint, params):
+            return entry.fetched_at
+        return None
+
+    def record_interest(self, category, country):
+        """Count a request for a headlines pair towards the refresh scheduler; pairs NewsAPI doesn't serve are ignored"""
+        if category not in CATEGORIES or country not in COUNTRIES:
+            return
+        self._decay_popularity()
+        self.popularity[(category, country)] += 1
+
+    def _decay_popularity(self):
+        now = time.monotonic()
+        elapsed = now - self._decayed_at
+        if elapsed < POPULARITY_DECAY_SECONDS:
+            return
+        self._decayed_at = now
+        factor = 0.5 ** (elapsed / POPULARITY_HALF_LIFE_SECONDS)
+        # Pairs nobody has asked for in a long while are forgotten
+        self.popularity = Counter(
+            {pair: count * factor for pair, count in self.popularity.items() if count * factor >= 0.5}
+        )
+
+    async def top_headlines(self, category="business", country="us"):
+        self.record_interest(category, country)
+        return await self.get("top-headlines", {"category": category, "country": country})
+
+    async def everything(self, q, sortBy="publishedAt", language="en"):
+        return await self.get("everything", {"q": q, "sortBy": sortBy, "language": language})
+
+    # Refresh scheduler
+
+    def _is_kept_warm(self, endpoint, params):
+        return endpoint == "top-headlines" and (params.get("category"), params.get("country")) in self.refresh_pairs
+
+    def _scheduled_pairs(self):
+        pairs = list(self.refresh_pairs)
+        self._decay_popularity()
+        for pair, _ in self.popularity.most_common():
+            if len(pairs) >= len(self.refresh_pairs) + self.refresh_top:
+                break
+            if pair not in pairs:
+                pairs.append(pair)
+        return pairs
+
+    def _stalest_pair(self):
+        def age(pair):
+            entry = self.cache.get(self.cache_key("top-headlines", {"category": pair[0], "country": pair[1]}))
+            return entry.fetched_at if entry is not None else 0.0
+
+        pairs = self._scheduled_pairs()
+        return min(pairs, key=age) if pairs else None
+
+    async def _run_scheduler(self):
+        # One refresh per interval spends exactly the scheduled share of the
+        # quota, evenly spread over the window
+        interval = 1.0 / self.scheduled_rate if self.scheduled_rate > 0 else ELECTION_SECONDS
+        while True:
+            if not self._leader.try_acquire():
+                await asyncio.sleep(ELECTION_SECONDS)
+                continue
+            pair = self._stalest_pair()
+            if pair is not None:
+                try:
+                    await self.get("top-headlines", {"category": pair[0], "country": pair[1]}, scheduled=True)
+                except Exception as e:
+                    logger.warning(f"Scheduled NewsAPI refresh of {pair} failed: {e}")
+            await asyncio.sleep(interval)
+
+    def cached(self, endpoint, params):
+        """Whatever is cached for a query, however old, without going upstream"""
+        entry = self.cache.get(self.cache_key(endpoint, params))
+        return entry.body if entry is not None else None
+
+    def warm_start(self):
+        """Seed the shared cache from the durable snapshot; returns entries loaded"""
+        if self.snapshot is None:
+            return 0
+        loaded = 0
+        for key, entry in self.snapshot.load():
+            current = self.cache.get(key)
+            if current is None or current.fetched_at < entry.fetched_at:
+                self.cache.put(key, entry.body, entry.fetched_at)
+                loaded += 1
+        if loaded:
+            logger.info(f"Warm-started NewsAPI cache with {loaded} responses from {self.snapshot.path}")
+        return loaded
+
+    async def start(self):
+        """Warm the cache and start competing for the refresh scheduler"""
+        if self._task is None and self._snapshot_task is None:
+            self._ensure_state()
+            await asyncio.to_thread(self.warm_start)
+            if self.snapshot is not None and self.replay is None:
+                self._snapshot_task = asyncio.get_running_loop().create_task(self._run_snapshots())
+            # Without an API key there is nothing to refresh
+            if os.environ.get("NEWS_API_KEY"):
+                self._task = asyncio.get_running_loop().create_task(self._run_scheduler())
+
+    async def stop(self):
+        for task in (self._task, self._snapshot_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._snapshot_task = None
+        await self._write_snapshot()
+        if self._leader is not None:
+            self._leader.release()
+
+
+client = NewsAPIClient()
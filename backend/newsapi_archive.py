@@ -0,0 +1,121 @@
+"""
+Record/replay archive of NewsAPI responses
+
+With NEWSAPI_RECORD_PATH set, every upstream response the NewsAPI client
+receives is appended to an archive together with how long it took. With
+NEWSAPI_REPLAY_PATH set, the client never goes upstream: responses come
+from the archive instead, keyed by endpoint and query parameters, either
+after their recorded latency or immediately (NEWSAPI_REPLAY_SPEED=max).
+Load tests and CI can then push realistic news volumes through the whole
+stack offline.
+
+File layout: an 8-byte magic followed by records of
+
+    <H key length> <I body length> <f latency seconds> <key> <zlib(JSON body)>
+
+Appends are whole records written under an exclusive flock, so several
+workers can record into one archive. Opening an archive for replay scans
+only the record headers to build a key -> records index; bodies are
+inflated on first use.
+"""
+import fcntl
+import json
+import os
+import struct
+import zlib
+from collections import defaultdict
+
+MAGIC = b"NEWSARC1"
+_RECORD = struct.Struct("<HIf")
+
+RECORDED = "recorded"
+MAX_SPEED = "max"
+
+
+class ArchiveRecorder:
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def record(self, key, latency, body):
+        key_bytes = key.encode()
+        data = zlib.compress(json.dumps(body, separators=(",", ":")).encode(), 6)
+        record = _RECORD.pack(len(key_bytes), len(data), latency) + key_bytes + data
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.write(self._fd, MAGIC)
+            os.write(self._fd, record)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        os.close(self._fd)
+
+
+class ArchiveReplay:
+    """
+    Serve recorded responses by cache key
+
+    A key recorded several times replays its responses, and their
+    latencies, in turn, so a load test sees the same churn and latency
+    distribution the recording did.
+    """
+
+    def __init__(self, path, speed=RECORDED):
+        if speed not in (RECORDED, MAX_SPEED):
+            raise ValueError(f"Unknown replay speed: {speed}")
+        self.path = path
+        self.speed = speed
+        # key -> [(offset, length, latency)]
+        self.index = defaultdict(list)
+        self._bodies = {}
+        self._turn = defaultdict(int)
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a NewsAPI archive")
+            while True:
+                header = f.read(_RECORD.size)
+                if len(header) < _RECORD.size:
+                    break
+                key_length, length, latency = _RECORD.unpack(header)
+                key = f.read(key_length).decode()
+                offset = f.tell()
+                if offset + length > os.fstat(f.fileno()).st_size:
+                    # Torn final record from a crashed recorder
+                    break
+                self.index[key].append((offset, length, latency))
+                f.seek(length, os.SEEK_CUR)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return sum(len(records) for records in self.index.values())
+
+    def _body(self, offset, length):
+        body = self._bodies.get(offset)
+        if body is None:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                body = json.loads(zlib.decompress(f.read(length)))
+            self._bodies[offset] = body
+        return body
+
+    def get(self, key):
+        """
+        The next recorded ``(latency, body)`` for ``key``
+
+        Latency is 0 at max speed. Raises KeyError if ``key`` was never
+        recorded.
+        """
+        records = self.index.get(key)
+        if not records:
+            raise KeyError(key)
+        turn = self._turn[key]
+        self._turn[key] = turn + 1
+        offset, length, latency = records[turn % len(records)]
+        return (0.0 if self.speed == MAX_SPEED else latency), self._body(offset, length)
@@ -0,0 +1,189 @@
+"""
+On-demand statistical profiler for the running worker
+
+GET /debug/profile?seconds=30 samples every thread's stack, plus the
+await chain of every pending asyncio task, from a background thread for
+the requested duration. Nothing is traced between samples, so overhead
+is bounded by the sampling rate and disappears once the profile ends.
+
+The result comes back as collapsed stacks (one ``frame;frame;frame count``
+line per unique stack, the input format of flamegraph.pl and speedscope)
+or as a self-contained flamegraph SVG.
+"""
+import asyncio
+import html
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response
+
+from admin import require_admin
+
+MAX_SECONDS = 120
+MAX_STACK_DEPTH = 128
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse_frame(frame):
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _collapse_task(task):
+    # Follow the coroutine's await chain from the task entry point down to
+    # the innermost suspended coroutine
+    labels = [f"task:{task.get_name()}"]
+    coro = task.get_coro()
+    while coro is not None and len(labels) < MAX_STACK_DEPTH:
+        code = getattr(coro, "cr_code", None) or getattr(coro, "gi_code", None)
+        if code is None:
+            labels.append(type(coro).__name__)
+            break
+        labels.append(_frame_label(code))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return labels
+
+
+class StackSampler:
+    """Samples thread stacks and asyncio task stacks into collapsed counts"""
+
+    def __init__(self, loop=None, interval=0.005, threads=True, tasks=True):
+        self.loop = loop
+        self.interval = interval
+        self.threads = threads
+        self.tasks = tasks
+        self.counts = Counter()
+        self.samples = 0
+
+    def sample(self):
+        own_ident = threading.get_ident()
+        if self.threads:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = [f"thread:{names.get(ident, ident)}"] + _collapse_frame(frame)
+                self.counts[";".join(stack)] += 1
+        if self.tasks and self.loop is not None:
+            try:
+                tasks = asyncio.all_tasks(self.loop)
+            except RuntimeError:
+                tasks = ()
+            for task in tasks:
+                if task.done():
+                    continue
+                try:
+                    self.counts[";".join(_collapse_task(task))] += 1
+                except Exception:
+                    # The loop thread may resume the task while we walk it
+                    continue
+        self.samples += 1
+
+    def run(self, seconds):
+        deadline = time.monotonic() + seconds
+        next_tick = time.monotonic()
+        while next_tick < deadline:
+            self.sample()
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return self.counts
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+def render_flamegraph(counts, title="Flame Graph", width=1200, row_height=16):
+    """Render collapsed stack counts as a standalone SVG flamegraph"""
+    root = {"children": {}, "value": 0}
+    for stack, count in counts.items():
+        node = root
+        node["value"] += count
+        for frame in stack.split(";"):
+            node = node["children"].setdefault(frame, {"children": {}, "value": 0})
+            node["value"] += count
+
+    total = root["value"] or 1
+    rects = []
+    max_depth = 0
+
+    def layout(node, x, depth):
+        nonlocal max_depth
+        for name, child in sorted(node["children"].items()):
+            w = child["value"] / total * width
+            if w >= 0.5:
+                max_depth = max(max_depth, depth)
+                rects.append((name, x, depth, w, child["value"]))
+                layout(child, x, depth + 1)
+            x += w
+
+    layout(root, 0.0, 0)
+    height = (max_depth + 1) * row_height + 40
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">',
+        f'<text x="{width / 2}" y="16" text-anchor="middle" font-size="14">{html.escape(title)}</text>',
+    ]
+    for name, x, depth, w, value in rects:
+        y = height - (depth + 1) * row_height
+        # Warm colour, consistent for a frame name within one graph
+        hue = hash(name) % 60
+        label = html.escape(name)
+        parts.append(
+            f'<g><title>{label} ({value} samples, {value / total:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" '
+            f'fill="hsl({hue},80%,60%)" rx="2"/>'
+        )
+        max_chars = int(w / 7)
+        if max_chars >= 4:
+            text = name if len(name) <= max_chars else name[: max_chars - 2] + ".."
+            parts.append(f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">{html.escape(text)}</text>')
+        parts.append("</g>")
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+router = APIRouter(prefix="/debug", dependencies=[Depends(require_admin)])
+_profiling = False
+
+
+@router.get("/profile", include_in_schema=False)
+async def profile(
+    seconds: float = Query(30, gt=0, le=MAX_SECONDS),
+    format: str = Query("collapsed", pattern="^(collapsed|svg)$"),
+    mode: str = Query("all", pattern="^(all|threads|tasks)$"),
+    hz: int = Query(200, ge=1, le=1000),
+):
+    global _profiling
+    if _profiling:
+        raise HTTPException(status_code=409, detail="A profile is already running in this worker")
+    _profiling = True
+    try:
+        sampler = StackSampler(
+            loop=asyncio.get_running_loop(),
+            interval=1.0 / hz,
+            threads=mode in ("all", "threads"),
+            tasks=mode in ("all", "tasks"),
+        )
+        # The sampler thread comes from the default executor, so the event
+        # loop keeps serving requests while it is being profiled
+        await asyncio.get_running_loop().run_in_executor(None, sampler.run, seconds)
+    finally:
+        _profiling = False
+
+    if format == "svg":
+        title = f"pid {os.getpid()} - {sampler.samples} samples over {seconds:g}s"
+        return Response(render_flamegraph(sampler.counts, title=title), media_type="image/svg+xml")
+    return PlainTextResponse(sampler.collapsed())
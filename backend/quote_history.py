@@ -0,0 +1,252 @@
+"""
+Persistent quote history with 1m/1h/1d rollups
+
+The quote producer's ticks are buffered in memory and written in batches
+every QUOTE_HISTORY_FLUSH_SECONDS to ``quote_ticks``, a MongoDB
+time-series collection (a plain indexed collection on servers older than
+5.0) that expires raw ticks after QUOTE_TICK_RETENTION_DAYS.
+
+Once a minute one worker per host (leader-elected) rolls closed buckets
+up into OHLC bars: ticks into ``quote_bars_1m``, 1m bars into
+``quote_bars_1h``, and 1h bars into ``quote_bars_1d``. Each rollup is one
+aggregation with a ``$merge`` on (symbol, ts), so re-running a window is
+harmless. A watermark per resolution in ``quote_rollups`` records how far
+it has got, and each level only rolls up what the level below has
+finished.
+
+``query()`` serves a chart from the finest resolution that still fits
+the range in ``max_points`` and is retained that far back. A year of one
+symbol is 365 daily bars instead of 31 million ticks. An explicit
+resolution too fine for the range is refused. When even daily bars
+overflow ``max_points``, the earliest ones are returned and flagged
+``truncated``.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+from database import db
+from leader import LeaderLock
+from quote_snapshot import default_path
+
+logger = logging.getLogger(__name__)
+
+# How often buffered ticks are written
+FLUSH_SECONDS = float(os.environ.get("QUOTE_HISTORY_FLUSH_SECONDS", 5.0))
+# How often the rollup leader looks for closed buckets
+ROLLUP_SECONDS = float(os.environ.get("QUOTE_ROLLUP_SECONDS", 60.0))
+TICK_RETENTION = timedelta(days=float(os.environ.get("QUOTE_TICK_RETENTION_DAYS", 2)))
+# Ticks buffered while MongoDB is unreachable; the oldest are dropped past this
+MAX_BUFFERED_TICKS = 100_000
+
+TICKS = "tick"
+# resolution -> (bucket seconds, collection, retention)
+RESOLUTIONS = {
+    TICKS: (1, "quote_ticks", TICK_RETENTION),
+    "1m": (60, "quote_bars_1m", timedelta(days=30)),
+    "1h": (3600, "quote_bars_1h", timedelta(days=730)),
+    "1d": (86400, "quote_bars_1d", None),
+}
+# (resolution, rolled up from), finest first
+ROLLUPS = (("1m", TICKS), ("1h", "1m"), ("1d", "1h"))
+
+
+def _floor(moment, seconds):
+    epoch = datetime(1970, 1, 1)
+    return epoch + timedelta(seconds=(moment - epoch).total_seconds() // seconds * seconds)
+
+
+def expected_points(start, end, resolution, tick_seconds=1.0):
+    """Points ``resolution`` gives over ``start``..``end``, for ticks at the producer's rate"""
+    seconds = tick_seconds if resolution == TICKS else RESOLUTIONS[resolution][0]
+    return (end - start).total_seconds() / seconds
+
+
+def choose_resolution(start, end, max_points, now=None, tick_seconds=1.0):
+    """Finest resolution that covers ``start``..``end`` in at most ``max_points`` points"""
+    now = now or datetime.utcnow()
+    for resolution, (_, _, retention) in RESOLUTIONS.items():
+        if expected_points(start, end, resolution, tick_seconds) <= max_points and (
+            retention is None or start >= now - retention
+        ):
+            return resolution
+    return "1d"
+
+
+class QuoteHistory:
+    def __init__(self, flush_seconds=FLUSH_SECONDS, rollup_seconds=ROLLUP_SECONDS, tick_seconds=1.0):
+        self.flush_seconds = flush_seconds
+        self.rollup_seconds = rollup_seconds
+        self.tick_seconds = tick_seconds
+        self._buffer = []
+        self._leader = LeaderLock(default_path() + ".rollups.lock")
+        self._feed = None
+        self._task = None
+        self._ready = False
+        self._next_rollup = 0.0
+
+    def record_tick(self, symbols, prices, changes):
+        """QuoteFeed tick listener: buffer one document per symbol"""
+        ts = datetime.utcnow()
+        self._buffer.extend(
+            {"ts": ts, "symbol": symbol, "price": price, "change": change}
+            for symbol, price, change in zip(symbols, prices.tolist(), changes.tolist())
+        )
+        if len(self._buffer) > MAX_BUFFERED_TICKS:
+            del self._buffer[: len(self._buffer) - MAX_BUFFERED_TICKS]
+
+    async def ensure_collections(self):
+        from pymongo.errors import CollectionInvalid, OperationFailure
+
+        try:
+            await db.create_collection(
+                "quote_ticks",
+                timeseries={"timeField": "ts", "metaField": "symbol", "granularity": "seconds"},
+                expireAfterSeconds=int(TICK_RETENTION.total_seconds()),
+            )
+        except CollectionInvalid:
+            pass  # already there
+        except OperationFailure as e:
+            # No time-series collections before MongoDB 5.0
+            logger.info(f"Storing quote ticks in a regular collection: {e}")
+            await db.quote_ticks.create_index("ts", expireAfterSeconds=int(TICK_RETENTION.total_seconds()))
+        await db.quote_ticks.create_index([("symbol", 1), ("ts", 1)])
+        for resolution, (_, collection, retention) in RESOLUTIONS.items():
+            if resolution == TICKS:
+                continue
+            await db[collection].create_index([("symbol", 1), ("ts", 1)], unique=True)
+            if retention is not None:
+                await db[collection].create_index("ts", expireAfterSeconds=int(retention.total_seconds()))
+        self._ready = True
+
+    async def flush(self):
+        if not self._buffer:
+            return 0
+        batch, self._buffer = self._buffer, []
+        try:
+            await db.quote_ticks.insert_many(batch, ordered=False)
+        except Exception:
+            # Keep them for the next attempt, ahead of newer ticks
+            self._buffer[:0] = batch
+            del self._buffer[: max(0, len(self._buffer) - MAX_BUFFERED_TICKS)]
+            raise
+        return len(batch)
+
+    async def rollup(self, resolution, source, now=None):
+        """Merge every closed ``resolution`` bucket not rolled up yet; returns the new watermark"""
+        seconds, target, _ = RESOLUTIONS[resolution]
+        _, source_collection, source_retention = RESOLUTIONS[source]
+        now = now or datetime.utcnow()
+        if source == TICKS:
+            # Ticks can still be sitting in some worker's buffer
+            source_through = now - timedelta(seconds=2 * self.flush_seconds)
+        else:
+            state = await db.quote_rollups.find_one({"resolution": source})
+            if state is None:
+                return None
+            source_through = state["through"]
+        end = _floor(source_through, seconds)
+        state = await db.quote_rollups.find_one({"resolution": resolution})
+        start = state["through"] if state else _floor(now - (source_retention or TICK_RETENTION), seconds)
+        if end <= start:
+            return start
+        bucket_ms = seconds * 1000
+        if source == TICKS:
+            fields = {"open": "$price", "high": "$price", "low": "$price", "close": "$price", "count": 1}
+        else:
+            fields = {"open": "$open", "high": "$high", "low": "$low", "close": "$close", "count": "$count"}
+        pipeline = [
+            {"$match": {"ts": {"$gte": start, "$lt": end}}},
+            {"$sort": {"ts": 1}},
+            {"$group": {
+                # Truncate to the bucket without $dateTrunc (MongoDB 5.0+)
+                "_id": {"symbol": "$symbol", "ts": {"$subtract": ["$ts", {"$mod": [{"$toLong": "$ts"}, bucket_ms]}]}},
+                "open": {"$first": fields["open"]},
+                "high": {"$max": fields["high"]},
+                "low": {"$min": fields["low"]},
+                "close": {"$last": fields["close"]},
+                "count": {"$sum": fields["count"]},
+            }},
+            {"$project": {"_id": 0, "symbol": "$_id.symbol", "ts": "$_id.ts",
+                          "open": 1, "high": 1, "low": 1, "close": 1, "count": 1}},
+            {"$merge": {"into": target, "on": ["symbol", "ts"], "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ]
+        await db[source_collection].aggregate(pipeline, allowDiskUse=True).to_list(None)
+        await db.quote_rollups.update_one(
+            {"resolution": resolution}, {"$set": {"through": end, "updated_at": now}}, upsert=True
+        )
+        return end
+
+    async def rollup_all(self):
+        for resolution, source in ROLLUPS:
+            await self.rollup(resolution, source)
+
+    async def query(self, symbol, start, end, max_points=1000, resolution=None):
+        """
+        Bars (or ticks) of ``symbol`` in ``start``..``end``, at most ``max_points`` of them
+
+        Raises ValueError for an explicit ``resolution`` that would give
+        more than ``max_points`` over the range. ``truncated`` is set when
+        more points were there than returned.
+        """
+        if resolution is None:
+            resolution = choose_resolution(start, end, max_points, tick_seconds=self.tick_seconds)
+        elif expected_points(start, end, resolution, self.tick_seconds) > max_points:
+            raise ValueError(f"{resolution} resolution gives more than {max_points} points over this range")
+        _, collection, _ = RESOLUTIONS[resolution]
+        projection = {"_id": 0, "ts": 1}
+        projection.update(dict.fromkeys(("price",) if resolution == TICKS else ("open", "high", "low", "close"), 1))
+        cursor = db[collection].find({"symbol": symbol, "ts": {"$gte": start, "$lt": end}}, projection)
+        # One extra point tells whether the range was cut short
+        points = await cursor.sort("ts", 1).limit(max_points + 1).to_list(max_points + 1)
+        truncated = len(points) > max_points
+        del points[max_points:]
+        if resolution == TICKS:
+            points = [
+                {"ts": p["ts"], "open": p["price"], "high": p["price"], "low": p["price"], "close": p["price"]}
+                for p in points
+            ]
+        return {
+            "symbol": symbol, "resolution": resolution, "start": start, "end": end,
+            "points": points, "truncated": truncated,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                if not self._ready:
+                    await self.ensure_collections()
+                await self.flush()
+                if loop.time() >= self._next_rollup and self._leader.try_acquire():
+                    self._next_rollup = loop.time() + self.rollup_seconds
+                    await self.rollup_all()
+            except Exception as e:
+                logger.warning(f"Quote history iteration failed: {e}")
+
+    async def start(self, feed):
+        if self._task is None:
+            self._feed = feed
+            self.tick_seconds = feed.tick_seconds
+            feed.tick_listeners.append(self.record_tick)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._feed.tick_listeners.remove(self.record_tick)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Dropped {len(self._buffer)} buffered quote ticks: {e}")
+        self._leader.release()
+
+
+history = QuoteHistory()
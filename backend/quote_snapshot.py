@@ -0,0 +1,233 @@
+"""
+Memory-mapped, seqlock-protected quote snapshot shared by all workers
+
+One process (the producer) owns the write side of a small file in
+/dev/shm; every gunicorn worker maps the same file read-only. The page
+cache holds a single copy, so memory stays constant in the worker count,
+and readers look prices up straight from the mapping with no IPC.
+
+Layout (little endian)::
+
+    header  64 bytes   magic, layout version, seq, tick, count, published_at, generation
+    records count * 40 bytes   symbol (S16), price, change, updated_at (f8)
+
+Writers bump ``seq`` to an odd value, write the records, then bump it to
+the next even value. Readers retry whenever ``seq`` was odd or changed
+while they were reading, so they never observe a half-written tick.
+
+Each new producer lays the file out again, possibly with other symbols,
+and bumps ``generation``. Readers check it on every read and re-map the
+file when it changed, so they never read one layout through another.
+"""
+import mmap
+import os
+import tempfile
+import time
+
+import numpy as np
+
+MAGIC = 0x51544B53  # "QTKS"
+LAYOUT_VERSION = 1
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "<u4"),
+    ("layout", "<u4"),
+    ("seq", "<u8"),
+    ("tick", "<u8"),
+    ("count", "<u4"),
+    ("_pad", "<u4"),
+    ("published_at", "<f8"),
+    ("generation", "<u8"),
+    ("_reserved", "V16"),
+])
+RECORD_DTYPE = np.dtype([
+    ("symbol", "S16"),
+    ("price", "<f8"),
+    ("change", "<f8"),
+    ("updated_at", "<f8"),
+])
+HEADER_SIZE = HEADER_DTYPE.itemsize
+SYMBOL_BYTES = RECORD_DTYPE["symbol"].itemsize
+
+# How many times a reader retries before giving up on a consistent read
+MAX_READ_ATTEMPTS = 10000
+
+
+def default_path():
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.environ.get("QUOTE_SNAPSHOT_PATH", os.path.join(base, "connect-the-plots-quotes"))
+
+
+def _views(buf, count):
+    header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=buf, offset=0)
+    records = np.ndarray((count,), dtype=RECORD_DTYPE, buffer=buf, offset=HEADER_SIZE)
+    return header, records
+
+
+class SnapshotWriter:
+    """Write side of the snapshot; only the elected producer holds one"""
+
+    def __init__(self, path, symbols):
+        self.path = path
+        self.symbols = list(symbols)
+        too_long = [s for s in self.symbols if len(s.encode()) > SYMBOL_BYTES]
+        if too_long:
+            # numpy would silently truncate them to a symbol readers can't find
+            raise ValueError(f"Symbols longer than {SYMBOL_BYTES} bytes can't be published: {too_long}")
+        size = HEADER_SIZE + RECORD_DTYPE.itemsize * len(self.symbols)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Never shrink or unlink the file: readers may still map it
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(fd)
+        self.header, self.records = _views(self._mm, len(self.symbols))
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+        seq = int(self.header["seq"][0])
+        generation = int(self.header["generation"][0])
+        if self.header["magic"][0] != MAGIC:
+            seq = generation = 0
+        # Keep the sequence monotonic across producer hand-overs, and mark
+        # the buffer as being written while the layout is (re)initialised
+        self.header["seq"] = seq + 1 + (seq & 1)
+        self.header["generation"] = generation + 1
+        self.header["magic"] = MAGIC
+        self.header["layout"] = LAYOUT_VERSION
+        self.header["count"] = len(self.symbols)
+        self.records["symbol"] = [s.encode() for s in self.symbols]
+        self.header["seq"] += 1
+
+    def publish(self, prices, changes, tick=None):
+        """Publish a full tick; ``prices``/``changes`` are in symbol order"""
+        now = time.time()
+        seq = self.header["seq"]
+        seq += 1
+        self.records["price"] = prices
+        self.records["change"] = changes
+        self.records["updated_at"] = now
+        self.header["tick"] = self.header["tick"][0] + 1 if tick is None else tick
+        self.header["published_at"] = now
+        seq += 1
+
+    def close(self):
+        self.header = self.records = None
+        self._mm.close()
+
+
+class SnapshotReader:
+    """Read side of the snapshot, safe to use from every worker"""
+
+    def __init__(self, path):
+        self.path = path
+        self._mm = None
+        self.header = self.records = None
+        self.index = {}
+        self._generation = None
+
+    def _attach(self):
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            size = os.fstat(fd).st_size
+            if size < HEADER_SIZE:
+                return False
+            mm = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=mm, offset=0)[0]
+        seq = int(header["seq"])
+        count = int(header["count"])
+        generation = int(header["generation"])
+        valid = (
+            not seq & 1
+            and header["magic"] == MAGIC
+            and header["layout"] == LAYOUT_VERSION
+            and size >= HEADER_SIZE + count * RECORD_DTYPE.itemsize
+        )
+        # Views have to go before the mapping can be closed
+        del header
+        if valid:
+            header, records = _views(mm, count)
+            index = {s.decode(): i for i, s in enumerate(records["symbol"].tolist())}
+            # Laid out again while the symbols were read
+            valid = int(header["seq"][0]) == seq
+            if not valid:
+                del header, records
+        if not valid:
+            mm.close()
+            return False
+        self._mm = mm
+        self.header, self.records, self.index = header, records, index
+        self._generation = generation
+        return True
+
+    def _current(self):
+        """Whether the mapping is attached to the snapshot's current layout, re-attaching if needed"""
+        if self._mm is not None:
+            header = self.header
+            if int(header["generation"][0]) == self._generation and header["layout"][0] == LAYOUT_VERSION:
+                return True
+            self.close()
+        return self._attach()
+
+    @property
+    def attached(self):
+        return self._current()
+
+    def _consistent(self, read):
+        """``read(header, records)`` from one published tick; None while there is no snapshot"""
+        for _ in range(MAX_READ_ATTEMPTS):
+            if not self._current():
+                return None
+            header = self.header
+            seq = header["seq"]
+            before = int(seq[0])
+            if before & 1:
+                continue
+            value = read(header, self.records)
+            if int(seq[0]) == before:
+                return value
+        raise RuntimeError("Quote snapshot is being rewritten too often to read consistently")
+
+    def get(self, symbol):
+        """Return ``(price, change, updated_at, tick)`` or None for unknown symbols"""
+
+        def read(header, records):
+            i = self.index.get(symbol)
+            if i is None:
+                return None
+            return (
+                float(records["price"][i]),
+                float(records["change"][i]),
+                float(records["updated_at"][i]),
+                int(header["tick"][0]),
+            )
+
+        return self._consistent(read)
+
+    def snapshot(self):
+        """Return ``(tick, records)`` with a private copy of every record"""
+        return self._consistent(lambda header, records: (int(header["tick"][0]), records.copy()))
+
+    def columns(self, *names):
+        """Return ``(tick, column, ...)`` with a private copy of each named column"""
+        return self._consistent(
+            lambda header, records: (int(header["tick"][0]),) + tuple(records[name].copy() for name in names)
+        )
+
+    @property
+    def tick(self):
+        if not self._current():
+            return None
+        return int(self.header["tick"][0])
+
+    def close(self):
+        if self._mm is not None:
+            self.header = self.records = None
+            self._mm.close()
+            self._mm = None
@@ -0,0 +1,144 @@
+"""
+Mock quote feed shared across gunicorn workers
+
+Exactly one process at a time is the producer: whoever holds an exclusive
+flock on ``<snapshot>.lock`` generates a tick every QUOTE_TICK_SECONDS and
+publishes it into the shared snapshot (see quote_snapshot.py). Every other
+worker only reads. If the producer dies its lock is released by the
+kernel and another worker takes over on its next election attempt,
+continuing from the last published prices.
+
+Callables in ``tick_listeners`` are called by the producer with every
+tick it publishes (quote_history.py records them this way).
+"""
+import asyncio
+import logging
+import os
+
+import numpy as np
+
+import instruments
+from leader import LeaderLock
+from quote_snapshot import SnapshotReader, SnapshotWriter, default_path
+
+logger = logging.getLogger(__name__)
+
+# Every instrument in the registry is quoted, with its mock price range
+QUOTE_INFO = instruments.registry.quote_info()
+
+TICK_SECONDS = float(os.environ.get("QUOTE_TICK_SECONDS", 1.0))
+# How often a non-producer worker checks whether the producer went away
+ELECTION_SECONDS = 5.0
+# Per-tick log-return volatility of the random walk
+TICK_VOLATILITY = 0.002
+
+
+class QuoteFeed:
+    def __init__(self, path=None, stock_info=None, tick_seconds=TICK_SECONDS):
+        self.path = path or default_path()
+        self.stock_info = stock_info or QUOTE_INFO
+        self.symbols = list(self.stock_info)
+        self.tick_seconds = tick_seconds
+        self.reader = SnapshotReader(self.path)
+        self._writer = None
+        self._leader = LeaderLock(self.path + ".lock")
+        self._task = None
+        self._rng = np.random.default_rng()
+        self._low = np.array([self.stock_info[s]["min"] for s in self.symbols], dtype=float)
+        self._high = np.array([self.stock_info[s]["max"] for s in self.symbols], dtype=float)
+        self._open = None
+        self._prices = None
+        # Called as listener(symbols, prices, changes) after each publish
+        self.tick_listeners = []
+
+    @property
+    def is_producer(self):
+        return self._writer is not None
+
+    def _try_become_producer(self):
+        if not self._leader.try_acquire():
+            return False
+
+        # Pick up where the previous producer left off so prices don't jump
+        previous = self.reader.snapshot()
+        self._writer = SnapshotWriter(self.path, self.symbols)
+        self._open = (self._low + self._high) / 2
+        self._prices = self._open.copy()
+        if previous is not None:
+            _, records = previous
+            last = {r["symbol"].decode(): (r["price"], r["change"]) for r in records}
+            for i, symbol in enumerate(self.symbols):
+                if symbol in last and last[symbol][0] > 0:
+                    self._prices[i] = last[symbol][0]
+                    self._open[i] = last[symbol][0] / (1 + last[symbol][1] / 100)
+        logger.info(f"Worker {os.getpid()} is now the quote producer")
+        self._publish()
+        return True
+
+    def _publish(self):
+        # ``change`` is the percent move since the open, which is what the
+        # dashboard displays
+        changes = (self._prices / self._open - 1.0) * 100.0
+        prices, changes = np.round(self._prices, 2), np.round(changes, 2)
+        self._writer.publish(prices, changes)
+        for listener in self.tick_listeners:
+            try:
+                listener(self.symbols, prices, changes)
+            except Exception as e:
+                logger.warning(f"Quote tick listener failed: {e}")
+
+    def tick(self):
+        """Advance every price one step of a bounded random walk and publish it"""
+        steps = self._rng.normal(0.0, TICK_VOLATILITY, len(self._prices))
+        self._prices = np.clip(self._prices * np.exp(steps), self._low, self._high)
+        self._publish()
+
+    async def _run(self):
+        while True:
+            if self.is_producer:
+                self.tick()
+                await asyncio.sleep(self.tick_seconds)
+            else:
+                if not self._try_become_producer():
+                    await asyncio.sleep(ELECTION_SECONDS)
+
+    async def start(self):
+        if self._task is None:
+            self._try_become_producer()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        # Let the next worker take over as producer
+        self._leader.release()
+        self.reader.close()
+
+    def get_quote(self, symbol):
+        """Latest published quote for ``symbol``, or None if unknown/not yet published"""
+        try:
+            quote = self.reader.get(symbol)
+        except RuntimeError:
+            # A producer died mid-publish; its successor will fix the seq
+            return None
+        if quote is None:
+            return None
+        price, change, updated_at, tick = quote
+        return {
+            "symbol": symbol,
+            "name": self.stock_info.get(symbol, {}).get("name", symbol),
+            "price": price,
+            "change": change,
+            "tick": tick,
+        }
+
+
+feed = QuoteFeed()
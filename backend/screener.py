@@ -0,0 +1,153 @@
+"""
+Market screener over the shared quote snapshot
+
+``/api/screener`` filters every quoted instrument by asset class,
+exchange, price and change, and returns the top ``limit`` by a sort key.
+All of it is done with numpy over whole columns rather than per
+instrument:
+
+- prices and changes are copied out of the snapshot once per quote
+  tick, and shared by every request until the next one;
+- class and exchange are small integer codes, laid out once per
+  snapshot layout in the same row order as the quotes;
+- every filter is a boolean mask, and the masks are AND-ed together;
+- the top ``limit`` matching rows are picked with ``np.argpartition``
+  (linear time), and only those rows are sorted.
+
+Over 100k instruments a request takes a fraction of a millisecond
+(scripts/bench_screener.py).
+"""
+import numpy as np
+
+from instruments import CLASSES
+
+MAX_LIMIT = 1000
+
+
+class _Layout:
+    """Registry metadata aligned with the rows of one snapshot layout"""
+
+    def __init__(self, registry, index):
+        count = len(index)
+        self.symbols = [None] * count
+        self.names = [None] * count
+        self.exchanges = []
+        self.exchange_of = np.full(count, -1, dtype=np.int32)
+        # -1: in the snapshot but not in the registry any more
+        self.class_of = np.full(count, -1, dtype=np.int8)
+        codes = {}
+        for class_code, name in enumerate(CLASSES):
+            cls = registry.classes[name]
+            for symbol, instrument, exchange in zip(cls.symbols, cls.names, cls.exchanges):
+                row = index.get(symbol)
+                if row is None:
+                    continue
+                if exchange not in codes:
+                    codes[exchange] = len(self.exchanges)
+                    self.exchanges.append(exchange)
+                self.symbols[row], self.names[row] = symbol, instrument
+                self.class_of[row] = class_code
+                self.exchange_of[row] = codes[exchange]
+        self.exchange_codes = codes
+
+    def exchange_mask(self, exchanges):
+        # A few comparisons beat a table lookup (fancy indexing) by far
+        mask = np.zeros(len(self.exchange_of), dtype=bool)
+        for code in {self.exchange_codes[e] for e in exchanges if e in self.exchange_codes}:
+            mask |= self.exchange_of == code
+        return mask
+
+
+class Screener:
+    def __init__(self, registry, reader):
+        self.registry = registry
+        self.reader = reader
+        self._layout = None
+        self._layout_for = None
+        # (tick, {sort key or column: array})
+        self._columns = (None, None)
+
+    def layout(self):
+        index = self.reader.index
+        if self._layout_for is not index:
+            # The producer (re)laid out the snapshot
+            self._layout, self._layout_for = _Layout(self.registry, index), index
+        return self._layout
+
+    def columns(self):
+        """``(tick, {"price", "change", "abs_change"})`` of the latest tick, or None"""
+        tick = self.reader.tick
+        if tick is None:
+            return None
+        if self._columns[0] != tick:
+            try:
+                columns = self.reader.columns("price", "change")
+            except RuntimeError:
+                return None
+            if columns is None:
+                # The producer is laying the snapshot out again
+                return None
+            tick, price, change = columns
+            self._columns = (tick, {"price": price, "change": change, "abs_change": np.abs(change)})
+        return self._columns
+
+    def screen(self, asset_class=None, exchanges=None, min_price=None, max_price=None,
+               min_change=None, max_change=None, sort="change", descending=True, limit=20):
+        """
+        Instruments matching every given filter, best ``limit`` first
+
+        Returns ``{"tick", "matched", "results"}``, or None before the
+        first quote tick. ``matched`` counts every match, not just the
+        returned ones.
+        """
+        columns = self.columns()
+        if columns is None:
+            return None
+        tick, columns = columns
+        price, change = columns["price"], columns["change"]
+        layout = self.layout()
+        if len(layout.class_of) != len(price):
+            # Re-laid out between the two reads; the next request sees the new layout
+            return None
+
+        mask = layout.class_of >= 0
+        if asset_class is not None:
+            mask &= layout.class_of == CLASSES.index(asset_class)
+        if exchanges:
+            mask &= layout.exchange_mask(exchanges)
+        if min_price is not None:
+            mask &= price >= min_price
+        if max_price is not None:
+            mask &= price <= max_price
+        if min_change is not None:
+            mask &= change >= min_change
+        if max_change is not None:
+            mask &= change <= max_change
+
+        matched = int(np.count_nonzero(mask))
+        limit = min(max(limit, 0), MAX_LIMIT, matched)
+        if limit == 0:
+            top = np.arange(0)
+        else:
+            rows = None if matched == len(mask) else np.flatnonzero(mask)
+            key = columns[sort] if rows is None else columns[sort][rows]
+            if descending:
+                key = -key
+            # Unsorted best `limit`, then sort just those
+            best = np.argpartition(key, limit - 1)[:limit] if limit < len(key) else np.arange(len(key))
+            top = best[np.argsort(key[best], kind="stable")]
+            if rows is not None:
+                top = rows[top]
+
+        results = [
+            {
+                "symbol": layout.symbols[row],
+                "name": layout.names[row],
+                "class": CLASSES[layout.class_of[row]],
+                "exchange": layout.exchanges[layout.exchange_of[row]],
+                "price": round(p, 2),
+                "change": round(c, 2),
+            }
+            for row, p, c in zip(top.tolist(), price[top].tolist(), change[top].tolist())
+        ]
+        return {"tick": tick, "matched": matched, "results": results}
@@ -0,0 +1,169 @@
+"""
+Rolling per-stock news sentiment
+
+Every StockImpact folds its score into one small document per stock in
+the stock_sentiment collection, so /api/stocks/{id}/sentiment is a single
+indexed lookup instead of a scan of the stock's news and impacts.
+
+Each document holds
+
+- an exponentially weighted mean of the scores by impact time
+  (SENTIMENT_HALF_LIFE_HOURS), kept as a decayed sum and weight
+- two ring buffers of per-bucket sums and counts: 5-minute buckets for
+  the last hour and hourly buckets for the last week, from which the
+  1h/24h/7d windows are read. A window is accurate to its bucket size.
+
+Writers fold an impact in with a read-modify-write guarded by a version
+number, retrying on conflict, so concurrent workers never lose updates.
+scripts/backfill_sentiment.py rebuilds every document from stock_impacts.
+"""
+import logging
+import math
+import os
+from datetime import datetime
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+HALF_LIFE_HOURS = float(os.environ.get("SENTIMENT_HALF_LIFE_HOURS", 24.0))
+# Attempts at a conflicting versioned update before giving up
+MAX_RETRIES = 5
+
+# name -> (ring, buckets)
+WINDOWS = {"1h": ("minutes", 12), "24h": ("hours", 24), "7d": ("hours", 168)}
+# ring -> (bucket seconds, buckets kept)
+RINGS = {"minutes": (300, 12), "hours": (3600, 168)}
+
+
+def _epoch(value):
+    if isinstance(value, datetime):
+        return value.timestamp() if value.tzinfo else (value - datetime(1970, 1, 1)).total_seconds()
+    return float(value or 0.0)
+
+
+class _Ring:
+    """Sums and counts of the last ``size`` buckets, slot = bucket % size"""
+
+    def __init__(self, bucket_seconds, size, doc=None):
+        self.bucket_seconds = bucket_seconds
+        self.size = size
+        doc = doc or {}
+        # Newest bucket written; older slots hold head - size + 1 .. head
+        self.head = doc.get("head", -1)
+        self.sums = list(doc.get("sum") or [0.0] * size)
+        self.counts = list(doc.get("count") or [0] * size)
+
+    def add(self, at, score):
+        bucket = int(at // self.bucket_seconds)
+        if bucket <= self.head - self.size:
+            return  # older than anything the ring still covers
+        if bucket > self.head:
+            # Clear the slots the head moves over
+            for stale in range(max(self.head + 1, bucket - self.size + 1), bucket + 1):
+                self.sums[stale % self.size] = 0.0
+                self.counts[stale % self.size] = 0
+            self.head = bucket
+        self.sums[bucket % self.size] += score
+        self.counts[bucket % self.size] += 1
+
+    def window(self, now, buckets):
+        """``(sum, count)`` of the ``buckets`` buckets ending at ``now``"""
+        newest = int(now // self.bucket_seconds)
+        total, count = 0.0, 0
+        for bucket in range(max(newest - buckets + 1, self.head - self.size + 1), min(newest, self.head) + 1):
+            total += self.sums[bucket % self.size]
+            count += self.counts[bucket % self.size]
+        return total, count
+
+    def to_document(self):
+        return {"head": self.head, "sum": self.sums, "count": self.counts}
+
+
+class SentimentAggregate:
+    """EWMA and windowed sentiment of one stock, folded one impact at a time"""
+
+    def __init__(self, doc=None, half_life_hours=HALF_LIFE_HOURS):
+        doc = doc or {}
+        self.half_life_hours = half_life_hours
+        self.decay_rate = math.log(2) / (half_life_hours * 3600)
+        # Decayed score sum and weight, both as of ``ewma_at``
+        self.ewma_sum, self.ewma_weight, self.ewma_at = doc.get("ewma") or (0.0, 0.0, 0.0)
+        self.rings = {name: _Ring(*shape, doc.get(name)) for name, shape in RINGS.items()}
+        self.count = doc.get("count", 0)
+        self.last_at = doc.get("last_at")
+
+    def add(self, score, at):
+        at_seconds = _epoch(at)
+        age = at_seconds - self.ewma_at
+        if age >= 0:
+            decay = math.exp(-self.decay_rate * age)
+            self.ewma_sum = self.ewma_sum * decay + score
+            self.ewma_weight = self.ewma_weight * decay + 1.0
+            self.ewma_at = at_seconds
+        else:
+            # An out-of-order impact is decayed to the newest one instead
+            decay = math.exp(self.decay_rate * age)
+            self.ewma_sum += score * decay
+            self.ewma_weight += decay
+        for ring in self.rings.values():
+            ring.add(at_seconds, score)
+        self.count += 1
+        if isinstance(at, datetime) and (self.last_at is None or at > self.last_at):
+            self.last_at = at
+
+    def to_document(self):
+        doc = {name: ring.to_document() for name, ring in self.rings.items()}
+        doc.update(ewma=[self.ewma_sum, self.ewma_weight, self.ewma_at], count=self.count, last_at=self.last_at)
+        return doc
+
+    def summary(self, now):
+        windows = {}
+        for name, (ring, buckets) in WINDOWS.items():
+            total, count = self.rings[ring].window(now, buckets)
+            windows[name] = {"mean": total / count if count else 0.0, "count": count}
+        return {
+            "ewma": self.ewma_sum / self.ewma_weight if self.ewma_weight else 0.0,
+            "half_life_hours": self.half_life_hours,
+            "windows": windows,
+            "count": self.count,
+            "last_impact_at": self.last_at,
+        }
+
+
+async def record(symbol, stock_id, score, at):
+    """Fold one impact into ``symbol``'s aggregate; returns whether it was stored"""
+    from pymongo.errors import DuplicateKeyError
+
+    for _ in range(MAX_RETRIES):
+        doc = await db.stock_sentiment.find_one({"symbol": symbol}, {"_id": 0})
+        aggregate = SentimentAggregate(doc)
+        aggregate.add(score, at)
+        update = aggregate.to_document()
+        update.update(symbol=symbol, stock_id=stock_id, updated_at=datetime.utcnow())
+        if doc is None:
+            try:
+                await db.stock_sentiment.insert_one(dict(update, version=1))
+                return True
+            except DuplicateKeyError:
+                continue  # another writer created it first
+        update["version"] = doc["version"] + 1
+        result = await db.stock_sentiment.update_one({"symbol": symbol, "version": doc["version"]}, {"$set": update})
+        if result.matched_count:
+            return True
+    logger.warning(f"Gave up recording sentiment for {symbol} after {MAX_RETRIES} conflicting updates")
+    return False
+
+
+async def record_impact(impact):
+    """Fold a stock_impacts document in; failures are logged, never raised"""
+    try:
+        return await record(impact["stock_symbol"], impact.get("stock_id"), impact["impact_score"], impact["created_at"])
+    except Exception as e:
+        logger.warning(f"Could not update sentiment for {impact.get('stock_symbol')}: {e}")
+        return False
+
+
+async def lookup(stock_id):
+    """Stored aggregate of a stock, by its id or symbol, or None"""
+    return await db.stock_sentiment.find_one({"$or": [{"stock_id": stock_id}, {"symbol": stock_id}]}, {"_id": 0})
@@ -1,80 +1,73 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Body, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Body, Query, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any, Union
-from datetime import datetime, timedelta
-from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from typing import List, Optional, Dict, Any, Union, Literal
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+from functools import lru_cache
 import os
+import sys
 import uuid
 import logging
 import json
-import random
+import time
 from pathlib import Path
-import requests
 from datetime import datetime
 import hashlib
-import jwt
-from passlib.context import CryptContext
+
+import alerts
+import causal
+import etag
+import export
+import hotnews
+import impact
+import instruments
+import invalidation
+import jobs
+import lexicon
+import metrics
+import middleware
+import newsapi
+import profiler
+import quote_history
+import quotes
+import screener
+import sentiment
+import suggest
+from database import db, read_db, get_client, close_client, ping, pool_options, pool_stats, warmup
 
 # Setup 
 ROOT_DIR = Path(__file__).parent
 
-# NewsAPI setup
-NEWS_API_KEY = os.environ.get('NEWS_API_KEY')
-NEWS_API_URL = "https://newsapi.org/v2"
+# NewsAPI access (quota budget, shared cache) lives in newsapi.py
 # Load .env but ONLY if the environment variables don't already exist
 # This ensures Render's environment variables take precedence
 load_dotenv(ROOT_DIR / '.env', override=False)
 
 # MongoDB connection
-import sys
-
-# Get connection string from environment variable
-try:
-    # Check if we're in production or dev environment
-    is_production = os.environ.get('RENDER', '') == 'true'
-    
-    if is_production:
-        # In production, use the connection_string environment variable
-        mongo_url = os.environ.get('connection_string')
-        if not mongo_url:
-            print("WARNING: 'connection_string' environment variable not found, falling back to MONGO_URL")
-            mongo_url = os.environ.get('MONGO_URL')
-            
-        print(f"Using production MongoDB connection")
-    else:
-        # In dev, use MONGO_URL from .env file
-        mongo_url = os.environ.get('MONGO_URL')
-        print(f"Using development MongoDB connection")
-    
-    # Set a reasonable timeout for connection
-    client = AsyncIOMotorClient(mongo_url, serverSelectionTimeoutMS=10000)
-    
-    # This database name should match what you want to use in MongoDB Atlas
-    db_name = os.environ.get('DB_NAME', 'stock_news_db')
-    db = client[db_name]
-    
-    print(f"MongoDB connection successful to database: {db_name}")
-except Exception as e:
-    print(f"MongoDB connection error: {e}", file=sys.stderr)
-    # In production, you might want to handle this more gracefully
-    # sys.exit(1)  # Uncomment to exit on connection failure
+# The Motor client is created lazily by database.get_client() on first use,
+# so importing this module (workers, tests, scripts) never touches the network
 
 # For Render deployment
 PORT = int(os.environ.get("PORT", 8001))
 
-# Create the main app
-app = FastAPI(title="Stock Impact News Scanner")
-
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=metrics.InstrumentedRoute)
+# Liveness and readiness probes live outside /api
+health_router = APIRouter(route_class=metrics.InstrumentedRoute)
+# How long /ready waits for MongoDB to answer a ping
+READY_TIMEOUT_SECONDS = float(os.environ.get("READY_TIMEOUT_SECONDS", 1.0))
 
 # Security setup
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/login")
 
+# passlib/bcrypt are only needed once someone logs in or registers
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
 # JWT settings
 SECRET_KEY = os.environ.get("SECRET_KEY", "defaultsecretkey")
 ALGORITHM = "HS256"
@@ -100,6 +93,12 @@ class Stock(BaseModel):
     exchange: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class StockSuggestion(BaseModel):
+    id: Optional[str] = None
+    symbol: str
+    name: str
+    exchange: str
+
 class NewsItem(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     title: str
@@ -117,10 +116,38 @@ class StockImpact(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     news_id: str
     stock_id: str
+    stock_symbol: Optional[str] = None
     impact_score: float  # -1.0 to 1.0 (negative to positive impact)
     explanation: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class SentimentWindow(BaseModel):
+    mean: float
+    count: int
+
+class StockSentiment(BaseModel):
+    symbol: str
+    ewma: float
+    half_life_hours: float
+    windows: Dict[str, SentimentWindow]
+    count: int
+    last_impact_at: Optional[datetime] = None
+
+class QuoteBar(BaseModel):
+    ts: datetime
+    open: float
+    high: float
+    low: float
+    close: float
+
+class QuoteHistory(BaseModel):
+    symbol: str
+    resolution: Literal["tick", "1m", "1h", "1d"]
+    start: datetime
+    end: datetime
+    points: List[QuoteBar]
+    truncated: bool = False  # more points in the range than max_points
+
 class UserBase(BaseModel):
     email: EmailStr
     username: str
@@ -157,6 +184,33 @@ class Comment(BaseModel):
     upvotes: int = 0
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class AlertCreate(BaseModel):
+    symbol: str
+    kind: Literal["price_above", "price_below", "change_above", "change_below"]
+    threshold: float  # price, or percent change since the open for change_* alerts
+
+class Alert(AlertCreate):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    active: bool = True
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # Price or change when the alert was set; it fires on a move across the threshold from here
+    reference: Optional[float] = None
+    triggered_at: Optional[datetime] = None
+    triggered_value: Optional[float] = None
+
+class StockImpactSummary(BaseModel):
+    symbol: str
+    net_impact: float
+    news_count: int
+
+class ImpactSummary(BaseModel):
+    net_impact: float  # equal-weighted mean over favorites
+    half_life_hours: float
+    as_of: datetime
+    stocks: List[StockImpactSummary]
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -164,15 +218,31 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     username: Optional[str] = None
 
+# Read caches, invalidated on every write by the bus in invalidation.py
+user_cache = invalidation.bus.register(invalidation.ReadCache("users", ("username", "id", "email")))
+stock_cache = invalidation.bus.register(invalidation.ReadCache("stocks", ("id", "symbol")))
+news_cache = invalidation.bus.register(invalidation.ReadCache("news", ("id",)))
+# The newest news, compact and indexed by category and symbol
+invalidation.bus.register(hotnews.hot)
+# Typeahead over every stock, patched from the same change events
+invalidation.bus.register(suggest.index)
+
+async def find_stock(stock_id: str):
+    """A stock by its id or, failing that, its symbol"""
+    cached = stock_cache.get("id", stock_id) or stock_cache.get("symbol", stock_id)
+    if cached is not None:
+        return cached
+    return await stock_cache.find_one("id", stock_id) or await stock_cache.find_one("symbol", stock_id)
+
 # Auth helper functions
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 async def get_user(username: str):
-    user_dict = await db.users.find_one({"username": username})
+    user_dict = await user_cache.find_one("username", username)
     if user_dict:
         return UserInDB(**user_dict)
     return None
@@ -186,6 +256,7 @@ async def authenticate_user(username: str, password: str):
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    import jwt
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -196,6 +267,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    import jwt
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -223,19 +295,8 @@ mock_news_sources = [
     {"name": "Wall Street Journal", "url": "https://wsj.com", "reliability_score": 0.91}
 ]
 
-# Mock stocks
-mock_stocks = [
-    {"symbol": "AAPL", "name": "Apple Inc.", "exchange": "NASDAQ"},
-    {"symbol": "GOOGL", "name": "Alphabet Inc.", "exchange": "NASDAQ"},
-    {"symbol": "AMZN", "name": "Amazon.com Inc.", "exchange": "NASDAQ"},
-    {"symbol": "TSLA", "name": "Tesla Inc.", "exchange": "NASDAQ"},
-    {"symbol": "META", "name": "Meta Platforms Inc.", "exchange": "NASDAQ"},
-    {"symbol": "MSFT", "name": "Microsoft Corporation", "exchange": "NASDAQ"},
-    {"symbol": "JPM", "name": "JPMorgan Chase & Co.", "exchange": "NYSE"},
-    {"symbol": "V", "name": "Visa Inc.", "exchange": "NYSE"},
-    {"symbol": "JNJ", "name": "Johnson & Johnson", "exchange": "NYSE"},
-    {"symbol": "WMT", "name": "Walmart Inc.", "exchange": "NYSE"}
-]
+# Mock stocks, from the instrument registry
+mock_stocks = instruments.registry.stock_documents()
 
 # Mock news headlines with impacts
 mock_news = [
@@ -390,44 +451,151 @@ mock_comments = [
     }
 ]
 
-# Mock function for LLM analysis
-def analyze_news_impact(news_item, stock):
+# Stand-in for LLM analysis
+def lexicon_signal(news_item):
+    """``(score, terms)`` of an article from the offline financial lexicon (lexicon.py)"""
+    return lexicon.scorer.explain(f"{news_item['title']}. {news_item.get('content') or ''}")
+
+def analyze_news_impact(news_item, stock, signal=None):
     """
-    Mock LLM function to analyze impact of news on a stock
-    This will be replaced with actual LLM integration
+    Analyze the impact of news on a stock: curated impacts first, then
+    the lexicon sentiment of the article, ``signal`` if already scored
     """
     # Check if we have a pre-defined impact for this news-stock combination
-    for impact in mock_impacts:
-        if impact["stock_symbol"] == stock["symbol"] and impact["news_title"] == news_item["title"]:
+    for curated in mock_impacts:
+        if curated["stock_symbol"] == stock["symbol"] and curated["news_title"] == news_item["title"]:
             return {
-                "impact_score": impact["impact_score"],
-                "explanation": impact["explanation"]
+                "impact_score": curated["impact_score"],
+                "explanation": curated["explanation"]
             }
     
-    # Generate a random impact if no pre-defined one exists
-    random_impact = random.uniform(-1.0, 1.0)
-    explanation = f"This news might {'positively' if random_impact > 0 else 'negatively'} impact {stock['name']} due to potential market sentiment shifts."
+    score, terms = signal or lexicon_signal(news_item)
+    if score:
+        explanation = (
+            f"This news is likely to {'positively' if score > 0 else 'negatively'} impact {stock['name']}: "
+            f"its wording is {'positive' if score > 0 else 'negative'} overall ({', '.join(terms)})."
+        )
+    else:
+        explanation = f"This news carries no clear positive or negative signal for {stock['name']}."
     
     return {
-        "impact_score": random_impact,
+        "impact_score": score,
         "explanation": explanation
     }
 
+def analyze_news_impacts(news_item, stocks):
+    """analyze_news_impact for each of ``stocks``, by symbol, scoring the article once"""
+    signal = lexicon_signal(news_item) if stocks else None
+    return {stock["symbol"]: analyze_news_impact(news_item, stock, signal) for stock in stocks}
+
+IMPACT_JOB = "impact"
+# Set on a stock_impacts document when it is written and cleared once it
+# is folded into its stock's sentiment
+SENTIMENT_PENDING = "sentiment_pending"
+# Server error codes for an index that exists with other options
+INDEX_OPTIONS_CONFLICT = 85
+INDEX_KEY_SPECS_CONFLICT = 86
+
+async def enqueue_impact_analysis(news_id: str):
+    return await jobs.queue.enqueue(IMPACT_JOB, {"news_id": news_id}, key=f"{IMPACT_JOB}:{news_id}")
+
+@jobs.queue.handler(IMPACT_JOB)
+async def analyze_news_job(payload, worker):
+    """
+    Write the StockImpacts of one news item; running it again adds nothing
+
+    Impacts are written flagged SENTIMENT_PENDING and the flag is cleared
+    once sentiment has recorded them, so an attempt that stopped in
+    between has its impacts recorded by the retry.
+    """
+    from pymongo.errors import DuplicateKeyError
+
+    news_item = await db.news.find_one({"id": payload["news_id"]}, {"_id": 0})
+    if news_item is None:
+        return {"impacts": 0}
+    stocks = await db.stocks.find({"symbol": {"$in": news_item.get("affected_stocks") or []}}, {"_id": 0}).to_list(None)
+    analyses = await worker.compute(analyze_news_impacts, news_item, stocks)
+    written = 0
+    for stock in stocks:
+        impact_analysis = analyses[stock["symbol"]]
+        stock_impact = {
+            "id": str(uuid.uuid4()),
+            "news_id": news_item["id"],
+            "stock_id": stock.get("id", ""),
+            "stock_symbol": stock["symbol"],
+            "impact_score": impact_analysis["impact_score"],
+            "explanation": impact_analysis["explanation"],
+            "created_at": datetime.utcnow(),
+            SENTIMENT_PENDING: True
+        }
+        # Unique on (news_id, stock_symbol): a retried job, or an attempt
+        # running alongside one whose lease expired, writes nothing new
+        try:
+            result = await db.stock_impacts.update_one(
+                {"news_id": stock_impact["news_id"], "stock_symbol": stock_impact["stock_symbol"]},
+                {"$setOnInsert": stock_impact},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            continue  # the other attempt wrote it
+        if result.upserted_id is not None:
+            written += 1
+    unrecorded = 0
+    async for stock_impact in db.stock_impacts.find({"news_id": news_item["id"], SENTIMENT_PENDING: True}, {"_id": 0}):
+        if await sentiment.record_impact(stock_impact):
+            await db.stock_impacts.update_one({"id": stock_impact["id"]}, {"$unset": {SENTIMENT_PENDING: ""}})
+        else:
+            unrecorded += 1
+    if unrecorded:
+        raise RuntimeError(f"Sentiment of {unrecorded} impacts of news {news_item['id']} not recorded")
+    return {"impacts": written}
+
+async def ensure_impact_key():
+    """Unique (news_id, stock_symbol) index on stock_impacts, replacing a non-unique one"""
+    from pymongo.errors import DuplicateKeyError, OperationFailure
+
+    keys = [("news_id", 1), ("stock_symbol", 1)]
+    try:
+        try:
+            await db.stock_impacts.create_index(keys, unique=True)
+        except DuplicateKeyError:
+            raise
+        except OperationFailure as e:
+            # Same keys, other options: an index from before it was unique
+            if e.code not in (INDEX_OPTIONS_CONFLICT, INDEX_KEY_SPECS_CONFLICT):
+                raise
+            await db.stock_impacts.drop_index(keys)
+            await db.stock_impacts.create_index(keys, unique=True)
+    except DuplicateKeyError as e:
+        logger.warning(f"stock_impacts holds duplicate (news_id, stock_symbol) pairs; remove them to make it unique: {e}")
+        await db.stock_impacts.create_index(keys)
+
 # DB initialization function
 async def init_db():
     try:
         # Create indexes
         logger.info("Creating database indexes...")
         await db.news.create_index("title")
+        await db.news.create_index("published_at")
         await db.stocks.create_index("symbol", unique=True)
         await db.users.create_index("username", unique=True)
         await db.users.create_index("email", unique=True)
+        await db.alerts.create_index("id", unique=True)
+        await db.alerts.create_index([("user_id", 1), ("created_at", -1)])
+        await db.alerts.create_index("updated_at")
+        await db.stock_impacts.create_index("created_at")
+        await ensure_impact_key()
+        await db.comments.create_index([("post_id", 1), ("created_at", 1)])
+        await db.stock_sentiment.create_index("symbol", unique=True)
+        await db.stock_sentiment.create_index("stock_id")
+        await jobs.queue.ensure_indexes()
         
         # Initialize mock data if needed
         logger.info("Checking if stock data initialization is needed...")
         if await db.stocks.count_documents({}) == 0:
             logger.info("Initializing stocks collection with mock data...")
             await db.stocks.insert_many(mock_stocks)
+            invalidation.bus.publish("stocks")
             logger.info("Initialized stocks collection with mock data")
         else:
             logger.info("Stocks collection already contains data, skipping initialization")
@@ -440,10 +608,6 @@ async def init_db():
         else:
             logger.info("News sources collection already contains data, skipping initialization")
         
-        # Get stock IDs for reference
-        logger.info("Fetching stock data for reference...")
-        stocks = {stock["symbol"]: stock for stock in await db.stocks.find().to_list(1000)}
-        
         # Create news items if none exist
         logger.info("Checking if news data initialization is needed...")
         if await db.news.count_documents({}) == 0:
@@ -452,23 +616,9 @@ async def init_db():
                 news_id = str(uuid.uuid4())
                 news_item["id"] = news_id
                 await db.news.insert_one(news_item)
-                
-                # Create impact records for affected stocks
-                for symbol in news_item["affected_stocks"]:
-                    if symbol in stocks:
-                        stock = stocks[symbol]
-                        impact_analysis = analyze_news_impact(news_item, stock)
-                        
-                        impact = {
-                            "id": str(uuid.uuid4()),
-                            "news_id": news_id,
-                            "stock_id": stock["id"] if "id" in stock else "",
-                            "impact_score": impact_analysis["impact_score"],
-                            "explanation": impact_analysis["explanation"],
-                            "created_at": datetime.utcnow()
-                        }
-                        
-                        await db.stock_impacts.insert_one(impact)
+                invalidation.bus.publish("news", news_item)
+                # Impact records are written by the job workers
+                await enqueue_impact_analysis(news_id)
             
             logger.info("Initialized news collection with mock data")
         else:
@@ -494,6 +644,7 @@ async def init_db():
                 }
                 
                 await db.users.insert_one(user)
+                invalidation.bus.publish("users", user)
                 user_ids[user_data["username"]] = user_id
             
             logger.info("Initialized users collection with mock data")
@@ -549,6 +700,25 @@ async def init_db():
         # Continue with application startup even if initialization fails
         # In production, you might want to handle this differently
 
+# Health Routes
+@health_router.get("/health")
+async def health_check():
+    """Liveness: the process is up; never touches the database"""
+    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+
+@health_router.get("/ready")
+async def readiness_check(response: Response):
+    """Readiness: MongoDB answers, plus this worker's live connection pool counts"""
+    start = time.perf_counter()
+    try:
+        await ping(READY_TIMEOUT_SECONDS)
+        mongo = {"status": "ok", "ping_ms": round((time.perf_counter() - start) * 1000, 2)}
+    except Exception as e:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        mongo = {"status": "unavailable", "error": str(e) or type(e).__name__}
+    mongo.update(pid=os.getpid(), pools=pool_stats(), options=pool_options())
+    return {"status": "ready" if mongo["status"] == "ok" else "not ready", "mongo": mongo}
+
 # API Routes
 @api_router.get("/")
 async def root():
@@ -556,67 +726,120 @@ async def root():
 
 # NewsAPI Routes
 @api_router.get("/newsapi/top-headlines")
-async def get_top_headlines(category: str = "business", country: str = "us"):
+async def get_top_headlines(request: Request, response: Response, category: str = "business", country: str = "us"):
+    # A cached response that is still current is tagged by its fetch time
+    version = newsapi.client.fresh_version("top-headlines", {"category": category, "country": country})
+    if version is not None:
+        not_modified = etag.versioned(request, response, category, country, version)
+        if not_modified is not None:
+            newsapi.client.record_interest(category, country)
+            return not_modified
     try:
-        url = f"{NEWS_API_URL}/top-headlines"
-        params = {
-            "apiKey": NEWS_API_KEY,
-            "category": category,
-            "country": country
-        }
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return await newsapi.client.top_headlines(category, country)
+    except newsapi.UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/newsapi/everything")
 async def get_everything(q: str, sortBy: str = "publishedAt", language: str = "en"):
     try:
-        url = f"{NEWS_API_URL}/everything"
-        params = {
-            "apiKey": NEWS_API_KEY,
-            "q": q,
-            "sortBy": sortBy,
-            "language": language
-        }
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return await newsapi.client.everything(q, sortBy, language)
+    except newsapi.UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/stock/{symbol}")
-async def get_stock_data(symbol: str):
+async def get_stock_data(request: Request, response: Response, symbol: str):
+    # Quotes come from the shared snapshot so every worker serves the same tick
+    quote = quotes.feed.get_quote(symbol)
+    if quote is None:
+        if symbol not in quotes.feed.stock_info:
+            raise HTTPException(status_code=404, detail=f"Unknown symbol: {symbol}")
+        raise HTTPException(status_code=503, detail="Quotes are not available yet")
+    # The quote only changes when the producer publishes a new tick
+    return etag.versioned(request, response, symbol, quote["tick"]) or quote
+
+# Whole asset classes at once, serialized once per tick
+instrument_snapshots = instruments.SnapshotCache(instruments.registry, quotes.feed.reader)
+
+@api_router.get("/instruments/snapshot")
+async def get_instruments_snapshot(request: Request, asset_class: str = Query(instruments.STOCK, alias="class")):
+    return instrument_snapshots.response(request, asset_class)
+
+# Filters and top-K over every quote at once (see screener.py)
+market_screener = screener.Screener(instruments.registry, quotes.feed.reader)
+
+@api_router.get("/screener")
+async def get_screener(
+    request: Request,
+    response: Response,
+    asset_class: Optional[Literal["stock", "mutual_fund", "etf"]] = Query(None, alias="class"),
+    exchange: Optional[List[str]] = Query(None),
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_change: Optional[float] = None,
+    max_change: Optional[float] = None,
+    sort: Literal["change", "abs_change", "price"] = "change",
+    order: Literal["desc", "asc"] = "desc",
+    limit: int = Query(20, ge=1, le=screener.MAX_LIMIT),
+):
+    result = market_screener.screen(
+        asset_class, exchange, min_price, max_price, min_change, max_change, sort, order == "desc", limit
+    )
+    if result is None:
+        raise HTTPException(status_code=503, detail="Quotes are not available yet")
+    # Results only change with the quotes
+    return etag.versioned(request, response, str(request.query_params), result["tick"]) or result
+
+def naive_utc(moment: datetime) -> datetime:
+    """Query timestamps as naive UTC, like everything stored in MongoDB"""
+    return moment.astimezone(timezone.utc).replace(tzinfo=None) if moment.tzinfo else moment
+
+@api_router.get("/stock/{symbol}/history", response_model=QuoteHistory)
+async def get_stock_history(
+    symbol: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    max_points: int = 1000,
+    resolution: Optional[Literal["tick", "1m", "1h", "1d"]] = None,
+):
+    if symbol not in quotes.feed.stock_info:
+        raise HTTPException(status_code=404, detail=f"Unknown symbol: {symbol}")
+    end = naive_utc(end) if end else datetime.utcnow()
+    start = naive_utc(start) if start else end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    max_points = min(max(max_points, 10), 10000)
+    # The finest resolution that fits the range in max_points (see quote_history.py)
     try:
-        # This is a mock implementation since we're removing Finnhub
-        # In a real application, you would integrate with a stock data API
-        mock_data = {
-            "symbol": symbol,
-            "price": round(random.uniform(50, 500), 2),
-            "change": round(random.uniform(-5, 5), 2)
-        }
-        return mock_data
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return await quote_history.history.query(symbol, start, end, max_points, resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # News Routes
 @api_router.get("/news", response_model=List[NewsItem])
 async def get_news(limit: int = 10, skip: int = 0, category: Optional[str] = None):
+    # Recent pages come from memory (see hotnews.py)
+    news = hotnews.hot.newest(limit, skip, category=category)
+    if news is not None:
+        return news
     query = {} if category is None else {"category": category}
-    news = await db.news.find(query).sort("published_at", -1).skip(skip).limit(limit).to_list(limit)
+    news = await read_db.news.find(query).sort("published_at", -1).skip(skip).limit(limit).to_list(limit)
     return news
 
 @api_router.get("/news/{news_id}", response_model=NewsItem)
 async def get_news_item(news_id: str):
-    news = await db.news.find_one({"id": news_id})
+    news = hotnews.hot.get(news_id) or await news_cache.find_one("id", news_id)
     if news is None:
         raise HTTPException(status_code=404, detail="News item not found")
     return news
 
 @api_router.get("/news/{news_id}/impacts", response_model=List[StockImpact])
-async def get_news_impacts(news_id: str):
-    impacts = await db.stock_impacts.find({"news_id": news_id}).to_list(1000)
+async def get_news_impacts(news_id: str, limit: int = 1000, skip: int = 0):
+    # Pages of at most `limit`; /api/export/impacts streams them all
+    impacts = await db.stock_impacts.find({"news_id": news_id}).skip(skip).limit(limit).to_list(limit)
     if not impacts:
         raise HTTPException(status_code=404, detail="No impacts found for this news item")
     return impacts
@@ -625,33 +848,47 @@ async def get_news_impacts(news_id: str):
 @api_router.get("/stocks", response_model=List[Stock])
 async def get_stocks(limit: int = 100, exchange: Optional[str] = None):
     query = {} if exchange is None else {"exchange": exchange}
-    stocks = await db.stocks.find(query).limit(limit).to_list(limit)
+    stocks = await read_db.stocks.find(query).limit(limit).to_list(limit)
     return stocks
 
+@api_router.get("/stocks/suggest", response_model=List[StockSuggestion])
+async def suggest_stocks(q: str, limit: int = Query(10, ge=1, le=suggest.MAX_SUGGESTIONS)):
+    # Prefix match on symbols and company names, from memory (see suggest.py)
+    return suggest.index.suggest(q, limit)
+
 @api_router.get("/stocks/{stock_id}", response_model=Stock)
 async def get_stock(stock_id: str):
-    stock = await db.stocks.find_one({"id": stock_id})
+    stock = await find_stock(stock_id)
     if stock is None:
-        # Try finding by symbol
-        stock = await db.stocks.find_one({"symbol": stock_id})
-        if stock is None:
-            raise HTTPException(status_code=404, detail="Stock not found")
+        raise HTTPException(status_code=404, detail="Stock not found")
     return stock
 
 @api_router.get("/stocks/{stock_id}/news", response_model=List[NewsItem])
 async def get_stock_news(stock_id: str, limit: int = 10):
-    stock = await db.stocks.find_one({"id": stock_id})
+    stock = await find_stock(stock_id)
     if stock is None:
-        # Try finding by symbol
-        stock = await db.stocks.find_one({"symbol": stock_id})
-        if stock is None:
-            raise HTTPException(status_code=404, detail="Stock not found")
+        raise HTTPException(status_code=404, detail="Stock not found")
     
     # Find news that affects this stock
     symbol = stock["symbol"]
-    news = await db.news.find({"affected_stocks": symbol}).sort("published_at", -1).limit(limit).to_list(limit)
+    news = hotnews.hot.newest(limit, symbol=symbol)
+    if news is not None:
+        return news
+    news = await read_db.news.find({"affected_stocks": symbol}).sort("published_at", -1).limit(limit).to_list(limit)
     return news
 
+@api_router.get("/stocks/{stock_id}/sentiment", response_model=StockSentiment)
+async def get_stock_sentiment(stock_id: str):
+    # One indexed read of the stock's rolling aggregate (see sentiment.py)
+    doc = await sentiment.lookup(stock_id)
+    if doc is None:
+        stock = await find_stock(stock_id)
+        if stock is None:
+            raise HTTPException(status_code=404, detail="Stock not found")
+        doc = {"symbol": stock["symbol"]}
+    aggregate = sentiment.SentimentAggregate(doc)
+    return {"symbol": doc["symbol"], **aggregate.summary(time.time())}
+
 # User Routes
 @api_router.post("/users", response_model=User)
 async def create_user(user: UserCreate):
@@ -671,6 +908,7 @@ async def create_user(user: UserCreate):
     user_dict["favorite_news"] = []
     
     await db.users.insert_one(user_dict)
+    invalidation.bus.publish("users", user_dict)
     return User(**user_dict)
 
 @api_router.post("/login", response_model=Token)
@@ -694,14 +932,16 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 async def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
+@api_router.get("/users/me/impact-summary", response_model=ImpactSummary)
+async def get_impact_summary(current_user: User = Depends(get_current_user)):
+    # Time-decayed net news impact across the user's favorites
+    return await impact.analytics.summary(current_user.favorite_stocks)
+
 @api_router.post("/users/me/favorite-stocks/{stock_id}")
 async def add_favorite_stock(stock_id: str, current_user: User = Depends(get_current_user)):
-    stock = await db.stocks.find_one({"id": stock_id})
+    stock = await find_stock(stock_id)
     if stock is None:
-        # Try finding by symbol
-        stock = await db.stocks.find_one({"symbol": stock_id})
-        if stock is None:
-            raise HTTPException(status_code=404, detail="Stock not found")
+        raise HTTPException(status_code=404, detail="Stock not found")
     
     symbol = stock["symbol"]
     
@@ -710,6 +950,7 @@ async def add_favorite_stock(stock_id: str, current_user: User = Depends(get_cur
         {"id": current_user.id, "favorite_stocks": {"$ne": symbol}},
         {"$push": {"favorite_stocks": symbol}}
     )
+    invalidation.bus.publish("users", id=current_user.id)
     
     if result.modified_count == 0:
         return {"message": "Stock already in favorites"}
@@ -717,26 +958,74 @@ async def add_favorite_stock(stock_id: str, current_user: User = Depends(get_cur
 
 @api_router.delete("/users/me/favorite-stocks/{stock_id}")
 async def remove_favorite_stock(stock_id: str, current_user: User = Depends(get_current_user)):
-    stock = await db.stocks.find_one({"id": stock_id})
+    stock = await stock_cache.find_one("id", stock_id)
     symbol = stock["symbol"] if stock else stock_id
     
     result = await db.users.update_one(
         {"id": current_user.id},
         {"$pull": {"favorite_stocks": symbol}}
     )
+    invalidation.bus.publish("users", id=current_user.id)
     
     if result.modified_count == 0:
         return {"message": "Stock not in favorites"}
+    # Alerts only make sense on favorites
+    await db.alerts.update_many(
+        {"user_id": current_user.id, "symbol": symbol, "active": True},
+        {"$set": {"active": False, "updated_at": datetime.utcnow()}}
+    )
     return {"message": f"Removed {symbol} from favorites"}
 
+# Alert Routes
+@api_router.get("/users/me/alerts", response_model=List[Alert])
+async def get_alerts(active: Optional[bool] = None, limit: int = 100, current_user: User = Depends(get_current_user)):
+    query = {"user_id": current_user.id}
+    if active is not None:
+        query["active"] = active
+    return await db.alerts.find(query).sort("created_at", -1).limit(limit).to_list(limit)
+
+@api_router.post("/users/me/alerts", response_model=Alert)
+async def create_alert(alert: AlertCreate, current_user: User = Depends(get_current_user)):
+    symbol = alert.symbol.upper()
+    if symbol not in current_user.favorite_stocks:
+        raise HTTPException(status_code=400, detail=f"Add {symbol} to your favorites before setting alerts on it")
+
+    quote = quotes.feed.get_quote(symbol)
+    reference = None
+    if quote is not None:
+        reference = quote["price"] if alert.kind.startswith("price_") else quote["change"]
+    new_alert = Alert(user_id=current_user.id, reference=reference, **{**alert.dict(), "symbol": symbol})
+    await db.alerts.insert_one(new_alert.dict())
+    if alerts.engine.is_leader:
+        # Alerts created on other workers reach the engine on its next sync
+        alerts.engine.index.add(new_alert.id, symbol, new_alert.kind, new_alert.threshold, reference)
+    return new_alert
+
+@api_router.delete("/users/me/alerts/{alert_id}")
+async def delete_alert(alert_id: str, current_user: User = Depends(get_current_user)):
+    result = await db.alerts.update_one(
+        {"id": alert_id, "user_id": current_user.id, "active": True},
+        {"$set": {"active": False, "updated_at": datetime.utcnow()}}
+    )
+    if result.modified_count == 0:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    if alerts.engine.is_leader:
+        alerts.engine.index.remove(alert_id)
+    return {"message": "Alert removed"}
+
 # Forum Routes
 @api_router.get("/forum/posts", response_model=List[ForumPost])
-async def get_forum_posts(limit: int = 20, skip: int = 0):
-    posts = await db.forum_posts.find().sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+async def get_forum_posts(limit: int = 20, skip: int = 0, session=Depends(causal.read_session)):
+    # From a secondary, after the caller's own posts (see causal.py)
+    posts = await causal.read(
+        session,
+        lambda session: read_db.forum_posts.find(session=session).sort("created_at", -1).skip(skip).limit(limit).to_list(limit),
+    )
     return posts
 
 @api_router.post("/forum/posts", response_model=ForumPost)
 async def create_forum_post(
+    response: Response,
     title: str = Body(...),
     content: str = Body(...),
     stocks: List[str] = Body([]),
@@ -754,12 +1043,13 @@ async def create_forum_post(
         created_at=datetime.utcnow()
     )
     
-    await db.forum_posts.insert_one(post.dict())
+    async with causal.write_session(response) as session:
+        await db.forum_posts.insert_one(post.dict(), session=session)
     return post
 
 @api_router.get("/forum/posts/{post_id}", response_model=ForumPost)
-async def get_forum_post(post_id: str):
-    post = await db.forum_posts.find_one({"id": post_id})
+async def get_forum_post(post_id: str, session=Depends(causal.read_session)):
+    post = await causal.read(session, lambda session: read_db.forum_posts.find_one({"id": post_id}, session=session))
     if post is None:
         raise HTTPException(status_code=404, detail="Post not found")
     return post
@@ -767,6 +1057,7 @@ async def get_forum_post(post_id: str):
 @api_router.post("/forum/posts/{post_id}/comments", response_model=Comment)
 async def add_comment(
     post_id: str,
+    response: Response,
     content: str = Body(...),
     current_user: User = Depends(get_current_user)
 ):
@@ -784,41 +1075,75 @@ async def add_comment(
         created_at=datetime.utcnow()
     )
     
-    await db.comments.insert_one(comment.dict())
-    
-    # Add comment ID to post's comments list
-    await db.forum_posts.update_one(
-        {"id": post_id},
-        {"$push": {"comments": comment.id}}
-    )
+    async with causal.write_session(response) as session:
+        await db.comments.insert_one(comment.dict(), session=session)
+        
+        # Add comment ID to post's comments list
+        await db.forum_posts.update_one(
+            {"id": post_id},
+            {"$push": {"comments": comment.id}},
+            session=session
+        )
     
     return comment
 
 @api_router.get("/forum/posts/{post_id}/comments", response_model=List[Comment])
-async def get_post_comments(post_id: str):
-    post = await db.forum_posts.find_one({"id": post_id})
+async def get_post_comments(post_id: str, limit: int = 1000, skip: int = 0, session=Depends(causal.read_session)):
+    post = await causal.read(session, lambda session: read_db.forum_posts.find_one({"id": post_id}, session=session))
     if post is None:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    comments = await db.comments.find({"post_id": post_id}).sort("created_at", 1).to_list(1000)
+    # Pages of at most `limit`; /api/export/comments streams them all
+    comments = await causal.read(
+        session,
+        lambda session: read_db.comments.find({"post_id": post_id}, session=session).sort("created_at", 1).skip(skip).limit(limit).to_list(limit),
+    )
     return comments
 
+# Export Routes
+# Streamed from the cursor in constant memory (see export.py)
+@api_router.get("/export/news")
+async def export_news(format: Literal["ndjson", "csv"] = "ndjson", category: Optional[str] = None, since: Optional[datetime] = None):
+    query = {}
+    if category is not None:
+        query["category"] = category
+    if since is not None:
+        query["published_at"] = {"$gte": since}
+    return export.export_response(db.news, query, list(NewsItem.model_fields), format, "news")
+
+@api_router.get("/export/impacts")
+async def export_impacts(format: Literal["ndjson", "csv"] = "ndjson", news_id: Optional[str] = None, stock_symbol: Optional[str] = None):
+    query = {}
+    if news_id is not None:
+        query["news_id"] = news_id
+    if stock_symbol is not None:
+        query["stock_symbol"] = stock_symbol
+    return export.export_response(db.stock_impacts, query, list(StockImpact.model_fields), format, "impacts")
+
+@api_router.get("/export/comments")
+async def export_comments(format: Literal["ndjson", "csv"] = "ndjson", post_id: Optional[str] = None):
+    query = {} if post_id is None else {"post_id": post_id}
+    sort = [("created_at", 1)] if post_id is not None else None
+    return export.export_response(db.comments, query, list(Comment.model_fields), format, "comments", sort=sort)
+
 @api_router.post("/forum/posts/{post_id}/upvote")
-async def upvote_post(post_id: str, current_user: User = Depends(get_current_user)):
-    result = await db.forum_posts.update_one({"id": post_id}, {"$inc": {"upvotes": 1}})
+async def upvote_post(post_id: str, response: Response, current_user: User = Depends(get_current_user)):
+    async with causal.write_session(response) as session:
+        result = await db.forum_posts.update_one({"id": post_id}, {"$inc": {"upvotes": 1}}, session=session)
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Post not found")
     return {"message": "Post upvoted successfully"}
 
 # Initialize database on startup
-@app.on_event("startup")
 async def startup_event():
     try:
         logger.info("Starting application initialization...")
         logger.info("Testing MongoDB connection...")
         # Just a basic command to verify connection works
-        await client.admin.command('ping')
+        await get_client().admin.command('ping')
         logger.info("MongoDB connection test successful")
+        # Open the pool's connections before the first requests need them
+        await warmup()
         
         # Initialize database
         await init_db()
@@ -830,20 +1155,62 @@ async def startup_event():
         # But for now, we'll continue to allow the application to start
         # Even with DB issues so we can at least debug
 
-# Include the router in the main app
-app.include_router(api_router)
-
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 # Shutdown event
-@app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    close_client()
     logger.info("Database connection closed")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    metrics.start_event_loop_monitor()
+    await quotes.feed.start()
+    await quote_history.history.start(quotes.feed)
+    await newsapi.client.start()
+    await invalidation.bus.start()
+    await startup_event()
+    await suggest.index.start()
+    await hotnews.hot.start()
+    await impact.analytics.start()
+    await jobs.worker.start()
+    await alerts.engine.start()
+    yield
+    await alerts.engine.stop()
+    await jobs.worker.stop()
+    await impact.analytics.stop()
+    await hotnews.hot.stop()
+    await suggest.index.stop()
+    await newsapi.client.stop()
+    await invalidation.bus.stop()
+    await quote_history.history.stop()
+    await quotes.feed.stop()
+    metrics.stop_event_loop_monitor()
+    await shutdown_db_client()
+
+def create_app() -> FastAPI:
+    """
+    Build the ASGI application
+
+    Nothing here performs I/O: the Mongo client, passlib and jwt are all
+    loaded on first use, and database setup runs in the lifespan handler.
+    """
+    app = FastAPI(title="Stock Impact News Scanner", lifespan=lifespan)
+
+    # Prometheus metrics
+    app.add_api_route("/metrics", metrics.metrics_response, include_in_schema=False)
+
+    # Include the router in the main app
+    app.include_router(api_router)
+    app.include_router(health_router)
+    app.include_router(profiler.router)
+    app.include_router(jobs.router)
+
+    # Pure ASGI middleware, innermost first: CORS, ETags and 304s, then
+    # compression of whatever goes out
+    app.add_middleware(middleware.CORSMiddleware, allow_origins=["*"], allow_credentials=True,
+                       expose_headers=[causal.HEADER])
+    app.add_middleware(etag.ETagMiddleware)
+    app.add_middleware(middleware.CompressionMiddleware)
+    return app
+
+# Module-level app for `gunicorn server:app`; `server:create_app()` works too
+app = create_app()
@@ -1,60 +1,66 @@
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from dotenv import load_dotenv
 import os
-import random
-import requests
 import datetime
+import logging
+import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import List, Literal, Optional
 
 # Setup
 ROOT_DIR = Path(__file__).parent
+# Sibling modules are imported by name, both when started from backend/
+# (`simple_server:app`) and from the repo root (`backend.simple_server:app`)
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
 load_dotenv(ROOT_DIR / '.env', override=False)
 
+import etag
+import instruments
+import metrics
+import middleware
+import newsapi
+import profiler
+import quotes
+import screener
+
+logger = logging.getLogger(__name__)
+
 # NewsAPI setup
 NEWS_API_KEY = os.environ.get('NEWS_API_KEY')
-NEWS_API_URL = "https://newsapi.org/v2"
-
-# Create the main app
-app = FastAPI(title="Stock News Scanner")
-
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Add middleware for security headers
-@app.middleware("http")
-async def add_security_headers(request: Request, call_next):
-    response = await call_next(request)
-    # Allow JavaScript execution
-    response.headers["Content-Security-Policy"] = "default-src 'self'; script-src 'self' 'unsafe-inline' 'unsafe-eval'; style-src 'self' 'unsafe-inline'; img-src 'self' data: https:; connect-src 'self' https:;"
-    # Other security headers
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "DENY"
-    response.headers["X-XSS-Protection"] = "1; mode=block"
-    return response
+
+# API routes live on a router; create_app() assembles the application
+router = APIRouter(route_class=metrics.InstrumentedRoute)
 
 # We'll move the root endpoint to /api to avoid conflicts with the frontend
-@app.get("/api")
+@router.get("/api")
 async def api_root():
     return {"message": "Welcome to the Stock News Scanner API", "status": "healthy"}
 
-@app.get("/health")
+@router.get("/health")
 async def health_check():
     """Health check endpoint for Render"""
     return {"status": "healthy", "timestamp": datetime.datetime.now().isoformat()}
 
-@app.get("/api/newsapi/top-headlines")
-async def get_top_headlines(category: str = "business", country: str = "us"):
+@router.get("/api/newsapi/top-headlines")
+async def get_top_headlines(request: Request, response: Response, category: str = "business", country: str = "us"):
+    if NEWS_API_KEY or newsapi.client.replay is not None:
+        # A cached response that is still current is tagged by its fetch time
+        version = newsapi.client.fresh_version("top-headlines", {"category": category, "country": country})
+        if version is not None:
+            not_modified = etag.versioned(request, response, category, country, version)
+            if not_modified is not None:
+                newsapi.client.record_interest(category, country)
+                return not_modified
     try:
-        if not NEWS_API_KEY:
+        if not NEWS_API_KEY and newsapi.client.replay is None:
+            # Prefer the last real headlines from the warm-start snapshot
+            cached = newsapi.client.cached("top-headlines", {"category": category, "country": country})
+            if cached is not None:
+                return cached
             # Return mock data if no API key is provided
             return {
                 "status": "ok",
@@ -83,22 +89,20 @@ async def get_top_headlines(category: str = "business", country: str = "us"):
                 ]
             }
         
-        url = f"{NEWS_API_URL}/top-headlines"
-        params = {
-            "apiKey": NEWS_API_KEY,
-            "category": category,
-            "country": country
-        }
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        return await newsapi.client.top_headlines(category, country)
+    except newsapi.UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/newsapi/everything")
+@router.get("/api/newsapi/everything")
 async def get_everything(q: str, sortBy: str = "publishedAt", language: str = "en"):
     try:
-        if not NEWS_API_KEY:
+        if not NEWS_API_KEY and newsapi.client.replay is None:
+            # Prefer the last real results from the warm-start snapshot
+            cached = newsapi.client.cached("everything", {"q": q, "sortBy": sortBy, "language": language})
+            if cached is not None:
+                return cached
             # Return mock data if no API key is provided
             return {
                 "status": "ok",
@@ -126,83 +130,73 @@ async def get_everything(q: str, sortBy: str = "publishedAt", language: str = "e
                     }
                 ]
             }
-            
-        url = f"{NEWS_API_URL}/everything"
-        params = {
-            "apiKey": NEWS_API_KEY,
-            "q": q,
-            "sortBy": sortBy,
-            "language": language
-        }
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/stock/{symbol}")
-async def get_stock_data(symbol: str):
-    try:
-        # Stock names and price ranges for more realistic mock data
-        stock_info = {
-            "AAPL": {"name": "Apple Inc.", "min": 150, "max": 200},
-            "GOOGL": {"name": "Alphabet Inc.", "min": 120, "max": 150},
-            "MSFT": {"name": "Microsoft Corp.", "min": 300, "max": 350},
-            "AMZN": {"name": "Amazon.com Inc.", "min": 120, "max": 150},
-            "TSLA": {"name": "Tesla Inc.", "min": 150, "max": 200},
-            "META": {"name": "Meta Platforms Inc.", "min": 300, "max": 350},
-            "NVDA": {"name": "NVIDIA Corp.", "min": 700, "max": 800},
-            "JPM": {"name": "JPMorgan Chase & Co.", "min": 150, "max": 200},
-            "V": {"name": "Visa Inc.", "min": 230, "max": 280},
-            "JNJ": {"name": "Johnson & Johnson", "min": 150, "max": 180}
-        }
-        
-        # Use stock-specific price range if available, otherwise use default
-        info = stock_info.get(symbol, {"name": symbol, "min": 50, "max": 500})
-        
-        # Mock stock data
-        mock_data = {
-            "symbol": symbol,
-            "name": info["name"],
-            "price": round(random.uniform(info["min"], info["max"]), 2),
-            "change": round(random.uniform(-5, 5), 2)
-        }
-        return mock_data
+        return await newsapi.client.everything(q, sortBy, language)
+    except newsapi.UpstreamError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Define all API routes first before mounting static files
+@router.get("/api/stock/{symbol}")
+async def get_stock_data(request: Request, response: Response, symbol: str):
+    # Quotes come from the shared snapshot so every worker serves the same tick
+    quote = quotes.feed.get_quote(symbol)
+    if quote is None:
+        if symbol not in quotes.feed.stock_info:
+            raise HTTPException(status_code=404, detail=f"Unknown symbol: {symbol}")
+        raise HTTPException(status_code=503, detail="Quotes are not available yet")
+    # The quote only changes when the producer publishes a new tick
+    return etag.versioned(request, response, symbol, quote["tick"]) or quote
+
+# Whole asset classes at once, serialized once per tick
+instrument_snapshots = instruments.SnapshotCache(instruments.registry, quotes.feed.reader)
 
-# Mount static files for frontend
-frontend_build_dir = Path(__file__).parent.parent / "frontend" / "build"
-print(f"Looking for frontend build directory at: {frontend_build_dir}")
-print(f"Frontend build directory exists: {frontend_build_dir.exists()}")
-print(f"Contents of parent directory: {list(frontend_build_dir.parent.iterdir())}")
+@router.get("/api/instruments/snapshot")
+async def get_instruments_snapshot(request: Request, asset_class: str = Query(instruments.STOCK, alias="class")):
+    return instrument_snapshots.response(request, asset_class)
+
+# Filters and top-K over every quote at once (see screener.py)
+market_screener = screener.Screener(instruments.registry, quotes.feed.reader)
+
+@router.get("/api/screener")
+async def get_screener(
+    request: Request,
+    response: Response,
+    asset_class: Optional[Literal["stock", "mutual_fund", "etf"]] = Query(None, alias="class"),
+    exchange: Optional[List[str]] = Query(None),
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_change: Optional[float] = None,
+    max_change: Optional[float] = None,
+    sort: Literal["change", "abs_change", "price"] = "change",
+    order: Literal["desc", "asc"] = "desc",
+    limit: int = Query(20, ge=1, le=screener.MAX_LIMIT),
+):
+    result = market_screener.screen(
+        asset_class, exchange, min_price, max_price, min_change, max_change, sort, order == "desc", limit
+    )
+    if result is None:
+        raise HTTPException(status_code=503, detail="Quotes are not available yet")
+    # Results only change with the quotes
+    return etag.versioned(request, response, str(request.query_params), result["tick"]) or result
+
+def mount_frontend(app: FastAPI, frontend_build_dir: Path):
+    """Serve the React build: /static, top-level files and SPA routing"""
+    logger.info(f"Frontend build directory {frontend_build_dir} exists: {frontend_build_dir.exists()}")
+    if not frontend_build_dir.exists():
+        return
 
-# Check if frontend build directory exists
-if frontend_build_dir.exists():
-    print(f"Frontend build directory contents: {list(frontend_build_dir.iterdir())}")
-    # Mount static files directory - make sure to serve all static files, not just the /static directory
     app.mount("/static", StaticFiles(directory=str(frontend_build_dir / "static")), name="static")
-    # Also mount any other static files at the root level
-    for item in frontend_build_dir.iterdir():
-        if item.is_file() and item.name != "index.html":
-            print(f"Mounting static file: {item.name}")
-            @app.get(f"/{item.name}")
-            async def serve_static_file(item=item):
-                return FileResponse(str(item))
-    
+    index_html = str(frontend_build_dir / "index.html")
+
     # Add a route to serve index.html at the root
     @app.get("/")
     async def serve_root():
-        return FileResponse(str(frontend_build_dir / "index.html"))
-    
-    # Add a route to serve asset-manifest.json
-    @app.get("/asset-manifest.json")
-    async def serve_manifest():
-        return FileResponse(str(frontend_build_dir / "asset-manifest.json"))
-    
-    # Catch-all route for SPA routing
+        return FileResponse(index_html)
+
+    # Catch-all route for SPA routing. Top-level build files (favicon.ico,
+    # manifest.json, asset-manifest.json, ...) are served from here too, so
+    # boot doesn't have to list the build directory and register a route each
     @app.get("/{full_path:path}")
     async def serve_frontend(request: Request, full_path: str):
         # Skip API routes
@@ -215,7 +209,38 @@ if frontend_build_dir.exists():
             return FileResponse(str(file_path))
             
         # Otherwise serve index.html for client-side routing
-        return FileResponse(str(frontend_build_dir / "index.html"))
+        return FileResponse(index_html)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    metrics.start_event_loop_monitor()
+    await quotes.feed.start()
+    await newsapi.client.start()
+    yield
+    await newsapi.client.stop()
+    await quotes.feed.stop()
+    metrics.stop_event_loop_monitor()
+
+def create_app(frontend_build_dir: Path = ROOT_DIR.parent / "frontend" / "build") -> FastAPI:
+    """Build the ASGI application without any I/O beyond checking for the frontend build"""
+    app = FastAPI(title="Stock News Scanner", lifespan=lifespan)
+
+    # Pure ASGI middleware, innermost first: CORS, security headers,
+    # ETags and 304s, then compression of whatever goes out
+    app.add_middleware(middleware.CORSMiddleware, allow_origins=["*"], allow_credentials=True)
+    app.add_middleware(middleware.SecurityHeadersMiddleware)
+    app.add_middleware(etag.ETagMiddleware)
+    app.add_middleware(middleware.CompressionMiddleware)
+
+    app.add_api_route("/metrics", metrics.metrics_response, include_in_schema=False)
+    app.include_router(profiler.router)
+    # Define all API routes first before mounting static files
+    app.include_router(router)
+    mount_frontend(app, frontend_build_dir)
+    return app
+
+# Module-level app for `uvicorn backend.simple_server:app`
+app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,293 @@
+"""
+In-memory typeahead index over the stocks collection
+
+``/api/stocks/suggest?q=`` answers from memory, without a MongoDB query
+per keystroke. Every stock is indexed under a few normalized keys
+(lowercase, accents and punctuation stripped): its symbol, its full
+name, and the name from each later word on, so "motors" finds "General
+Motors Co." too. Legal suffixes (inc, corp, ...) are not keys of their
+own.
+
+Stocks are identified by symbol: the seeded ones
+(``instruments.registry.stock_documents()``) carry no ``id``. Keys are
+kept in one sorted list, and a parallel array holds the stock each key
+belongs to. A query bisects the list to the range of keys
+starting with it. The range is ranked by popularity (how many users
+follow the stock) with ``np.argpartition``, so even a one-letter prefix
+over 100k stocks is a fraction of a millisecond.
+
+The index registers with the invalidation bus like a ReadCache. A write
+to ``stocks`` in any worker marks the stock stale, and a background task
+re-reads just the stale stocks and patches their keys in place. A clear
+reloads the whole collection: a fresh index is built in a thread and
+swapped in, so suggestions keep being served from the old one meanwhile.
+Popularity is recounted every SUGGEST_POPULARITY_SECONDS.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import re
+import unicodedata
+from array import array
+
+import numpy as np
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+POPULARITY_SECONDS = float(os.environ.get("SUGGEST_POPULARITY_SECONDS", 300.0))
+RETRY_SECONDS = 5.0
+MAX_SUGGESTIONS = 50
+# Name words that never start a key of their own, besides single letters
+SKIP_WORDS = {"inc", "corp", "corporation", "co", "company", "ltd", "plc", "llc", "sa", "ag", "nv", "the", "and"}
+# A stock has at most this many keys: symbol, name and name words
+MAX_WORD_KEYS = 6
+FIELDS = {"_id": 0, "id": 1, "symbol": 1, "name": 1, "exchange": 1}
+
+_NOT_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text):
+    """Lowercase ASCII words separated by single spaces"""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return _NOT_ALNUM.sub(" ", text.lower()).strip()
+
+
+def keys_for(stock):
+    symbol = normalize(stock["symbol"])
+    name = normalize(stock.get("name") or "")
+    keys = {symbol, name}
+    words = name.split(" ")
+    starts = [i for i, word in enumerate(words) if i and len(word) > 1 and word not in SKIP_WORDS]
+    keys.update(" ".join(words[i:]) for i in starts[:MAX_WORD_KEYS])
+    keys.discard("")
+    return keys
+
+
+class SuggestIndex:
+    # Registered with invalidation.bus like a ReadCache of this collection
+    collection = "stocks"
+    key_fields = ("id", "symbol")
+
+    def __init__(self, popularity_seconds=POPULARITY_SECONDS):
+        self.popularity_seconds = popularity_seconds
+        # slot -> stock document (None once removed); slots are reused
+        self._stocks = []
+        self._free = []
+        # symbol -> slot, and id -> symbol for stocks that have an id
+        self._slot_of = {}
+        self._symbol_of_id = {}
+        self._popularity = np.zeros(0)
+        # Sorted keys, and the slot of the stock each one belongs to
+        self._keys = []
+        self._slots = array("q")
+        self._stale = set()
+        self._reload = True
+        self._wake = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    # -- building ---------------------------------------------------------
+
+    def load(self, stocks, popularity=None):
+        """Index ``stocks`` from scratch"""
+        self._stocks = [dict(stock) for stock in stocks]
+        self._free = []
+        self._slot_of = {stock["symbol"]: slot for slot, stock in enumerate(self._stocks)}
+        self._symbol_of_id = {stock["id"]: stock["symbol"] for stock in self._stocks if stock.get("id") is not None}
+        entries = sorted((key, slot) for slot, stock in enumerate(self._stocks) for key in keys_for(stock))
+        self._keys = [key for key, _ in entries]
+        self._slots = array("q", (slot for _, slot in entries))
+        self._popularity = np.zeros(len(self._stocks))
+        if popularity is not None:
+            self.set_popularity(popularity)
+
+    def _adopt(self, other):
+        for name in ("_stocks", "_free", "_slot_of", "_symbol_of_id", "_popularity", "_keys", "_slots"):
+            setattr(self, name, getattr(other, name))
+
+    def set_popularity(self, counts):
+        """``counts``: symbol -> number of followers"""
+        self._popularity = np.array(
+            [counts.get(stock["symbol"], 0) if stock else 0 for stock in self._stocks], dtype=float
+        )
+
+    def _unindex(self, slot):
+        for key in keys_for(self._stocks[slot]):
+            i = bisect.bisect_left(self._keys, key)
+            # Several stocks can share a key; find this stock's entry
+            while self._keys[i] == key and self._slots[i] != slot:
+                i += 1
+            del self._keys[i]
+            del self._slots[i]
+
+    def _index(self, slot):
+        for key in keys_for(self._stocks[slot]):
+            i = bisect.bisect_left(self._keys, key)
+            self._keys.insert(i, key)
+            self._slots.insert(i, slot)
+
+    def remove(self, symbol):
+        slot = self._slot_of.pop(symbol, None)
+        if slot is None:
+            return
+        self._unindex(slot)
+        if self._stocks[slot].get("id") is not None:
+            self._symbol_of_id.pop(self._stocks[slot]["id"], None)
+        self._stocks[slot] = None
+        self._popularity[slot] = 0
+        self._free.append(slot)
+
+    def upsert(self, stock):
+        stock = dict(stock)
+        # A stock renamed to a new symbol leaves its old entry behind
+        renamed = self._symbol_of_id.get(stock.get("id"))
+        if renamed is not None and renamed != stock["symbol"]:
+            self.remove(renamed)
+        slot = self._slot_of.get(stock["symbol"])
+        if slot is not None:
+            popularity = self._popularity[slot]
+            self.remove(stock["symbol"])
+        else:
+            popularity = 0
+        if self._free:
+            slot = self._free.pop()
+            self._stocks[slot] = stock
+        else:
+            slot = len(self._stocks)
+            self._stocks.append(stock)
+            self._popularity = np.append(self._popularity, 0.0)
+        self._popularity[slot] = popularity
+        self._slot_of[stock["symbol"]] = slot
+        if stock.get("id") is not None:
+            self._symbol_of_id[stock["id"]] = stock["symbol"]
+        self._index(slot)
+
+    # -- querying ---------------------------------------------------------
+
+    def suggest(self, q, limit=10):
+        """The ``limit`` most popular stocks with a key starting with ``q``; an exact symbol first"""
+        prefix = normalize(q)
+        limit = min(max(limit, 0), MAX_SUGGESTIONS)
+        if not prefix or not limit:
+            return []
+        lo = bisect.bisect_left(self._keys, prefix)
+        # Every key starting with `prefix` sorts below prefix + U+FFFF
+        hi = bisect.bisect_left(self._keys, prefix + "\uffff", lo)
+        if lo == hi:
+            return []
+        slots = np.frombuffer(self._slots[lo:hi], dtype=np.int64)
+        # Most followed first; equally followed ones in key order
+        score = np.arange(len(slots)) / len(slots) - self._popularity[slots]
+        # A stock can match through several keys: over-fetch, then dedupe
+        wanted = limit * (MAX_WORD_KEYS + 2)
+        if len(slots) > wanted:
+            best = np.argpartition(score, wanted - 1)[:wanted]
+            slots, score = slots[best], score[best]
+        ranked = list(dict.fromkeys(slots[np.argsort(score, kind="stable")].tolist()))
+        exact = self._slot_of.get(q.strip().upper())
+        if exact is not None:
+            ranked = [exact] + [slot for slot in ranked if slot != exact]
+        return [self._stocks[slot] for slot in ranked[:limit]]
+
+    # -- invalidation bus -------------------------------------------------
+
+    def keys_of(self, document):
+        if not document:
+            return []
+        return [(field, document[field]) for field in self.key_fields if document.get(field) is not None]
+
+    def invalidate(self, keys):
+        self._stale.update(keys)
+        self._notify()
+
+    def clear(self):
+        self._reload = True
+        self._notify()
+
+    def _notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    # -- background sync --------------------------------------------------
+
+    async def _popularity_counts(self):
+        pipeline = [
+            {"$unwind": "$favorite_stocks"},
+            {"$group": {"_id": "$favorite_stocks", "followers": {"$sum": 1}}},
+        ]
+        return {row["_id"]: row["followers"] async for row in db.users.aggregate(pipeline)}
+
+    async def refresh(self):
+        """Apply pending changes: a full reload, or just the stale stocks"""
+        if self._reload:
+            self._reload = False
+            self._stale.clear()
+            stocks = await db.stocks.find({}, FIELDS).to_list(None)
+            counts = await self._popularity_counts()
+            fresh = SuggestIndex()
+            await asyncio.get_running_loop().run_in_executor(None, fresh.load, stocks, counts)
+            self._adopt(fresh)
+            logger.info(f"Indexed {len(self)} stocks for suggestions")
+            return
+        if not self._stale:
+            return
+        stale, self._stale = self._stale, set()
+        ids = [value for field, value in stale if field == "id"]
+        symbols = [value for field, value in stale if field == "symbol"]
+        found = await db.stocks.find(
+            {"$or": [{"id": {"$in": ids}}, {"symbol": {"$in": symbols}}]}, FIELDS
+        ).to_list(None)
+        for stock in found:
+            self.upsert(stock)
+        found_ids = {stock.get("id") for stock in found}
+        found_symbols = {stock["symbol"] for stock in found}
+        for stock_id in ids:
+            if stock_id not in found_ids and stock_id in self._symbol_of_id:
+                self.remove(self._symbol_of_id[stock_id])
+        for symbol in symbols:
+            if symbol not in found_symbols:
+                self.remove(symbol)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_popularity = loop.time() + self.popularity_seconds
+        while True:
+            # Changes arriving while we refresh wake the next iteration
+            self._wake.clear()
+            try:
+                await self.refresh()
+                if loop.time() >= next_popularity:
+                    next_popularity = loop.time() + self.popularity_seconds
+                    self.set_popularity(await self._popularity_counts())
+            except Exception as e:
+                logger.warning(f"Could not refresh the suggestion index, reloading in {RETRY_SECONDS} s: {e}")
+                self._reload = True
+                await asyncio.sleep(RETRY_SECONDS)
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(next_popularity - loop.time(), 0.1))
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+index = SuggestIndex()
@@ -8,6 +8,25 @@ import HomePage from './components/HomePage';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Reads may be served by a lagging database secondary: after our own
+// writes (posts, comments, upvotes) the backend hands out an X-Read-After
+// token, and sending the newest one back makes later reads include them
+let readAfter = sessionStorage.getItem('readAfter');
+axios.interceptors.response.use((response) => {
+  const token = response.headers['x-read-after'];
+  if (token) {
+    readAfter = token;
+    sessionStorage.setItem('readAfter', token);
+  }
+  return response;
+});
+axios.interceptors.request.use((config) => {
+  if (readAfter && config.url && config.url.startsWith(API)) {
+    config.headers['X-Read-After'] = readAfter;
+  }
+  return config;
+});
+
 // Helper function to format dates
 const formatDate = (dateString) => {
   const options = { year: 'numeric', month: 'short', day: 'numeric', hour: '2-digit', minute: '2-digit' };
@@ -13,32 +13,18 @@ const HomePage = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
-  // Mock data for mutual funds and ETFs
-  const mockMutualFunds = [
-    { symbol: "VFIAX", name: "Vanguard 500 Index", price: "432.18", change: "+1.25%" },
-    { symbol: "FXAIX", name: "Fidelity 500 Index", price: "178.45", change: "+1.18%" },
-    { symbol: "SWPPX", name: "Schwab S&P 500 Index", price: "68.92", change: "+1.22%" },
-    { symbol: "VTSAX", name: "Vanguard Total Stock", price: "118.75", change: "+0.95%" },
-    { symbol: "VBTLX", name: "Vanguard Total Bond", price: "10.25", change: "-0.15%" },
-    { symbol: "PRMTX", name: "T. Rowe Price Growth", price: "142.65", change: "+1.75%" },
-    { symbol: "AGTHX", name: "American Growth Fund", price: "65.87", change: "+0.92%" },
-    { symbol: "FCNTX", name: "Fidelity Contrafund", price: "17.53", change: "+1.45%" },
-    { symbol: "VWELX", name: "Vanguard Wellington", price: "45.76", change: "+0.35%" },
-    { symbol: "VDIGX", name: "Vanguard Dividend Growth", price: "35.42", change: "+0.65%" }
-  ];
-  
-  const mockETFs = [
-    { symbol: "SPY", name: "SPDR S&P 500 ETF", price: "478.35", change: "+1.32%" },
-    { symbol: "QQQ", name: "Invesco QQQ Trust", price: "425.67", change: "+1.85%" },
-    { symbol: "VTI", name: "Vanguard Total Stock ETF", price: "252.18", change: "+1.05%" },
-    { symbol: "VOO", name: "Vanguard S&P 500 ETF", price: "438.92", change: "+1.28%" },
-    { symbol: "ARKK", name: "ARK Innovation ETF", price: "45.23", change: "-2.15%" },
-    { symbol: "IVV", name: "iShares Core S&P 500", price: "475.12", change: "+1.30%" },
-    { symbol: "VEA", name: "Vanguard FTSE Developed", price: "48.75", change: "+0.45%" },
-    { symbol: "IEFA", name: "iShares Core MSCI EAFE", price: "72.38", change: "+0.55%" },
-    { symbol: "AGG", name: "iShares Core US Aggregate", price: "108.25", change: "-0.25%" },
-    { symbol: "BND", name: "Vanguard Total Bond ETF", price: "72.15", change: "-0.18%" }
-  ];
+  // One snapshot request per asset class instead of one request per symbol
+  const fetchInstruments = async (backendUrl, assetClass) => {
+    const response = await axios.get(`${backendUrl}/api/instruments/snapshot?class=${assetClass}`);
+    return response.data.instruments
+      .filter((item) => item.price !== null)
+      .map((item) => ({
+        symbol: item.symbol,
+        name: item.name,
+        price: item.price.toFixed(2),
+        change: `${item.change > 0 ? '+' : ''}${item.change.toFixed(2)}%`
+      }));
+  };
 
   // Function to fetch data
   const fetchData = async () => {
@@ -56,28 +42,18 @@ const HomePage = () => {
         source: item.source.name
       }));
 
-      // Fetch stock data (using mock data from our backend)
-      const stockSymbols = [
-        "AAPL", "GOOGL", "MSFT", "AMZN", "TSLA", 
-        "META", "NVDA", "JPM", "V", "JNJ"
-      ];
-      const stocksData = await Promise.all(
-        stockSymbols.map(async (symbol) => {
-          const response = await axios.get(`${backendUrl}/api/stock/${symbol}`);
-          return {
-            symbol,
-            name: response.data.name || getStockName(symbol),
-            price: response.data.price.toFixed(2),
-            change: `${response.data.change > 0 ? '+' : ''}${response.data.change.toFixed(2)}%`
-          };
-        })
-      );
+      // Fetch quotes for every asset class from our backend
+      const [stocksData, mutualFundsData, etfsData] = await Promise.all([
+        fetchInstruments(backendUrl, 'stock'),
+        fetchInstruments(backendUrl, 'mutual_fund'),
+        fetchInstruments(backendUrl, 'etf')
+      ]);
 
       setNews(formattedNews);
       setPerformanceData({
         stocks: stocksData,
-        mutualFunds: mockMutualFunds,
-        etfs: mockETFs
+        mutualFunds: mutualFundsData,
+        etfs: etfsData
       });
       setLoading(false);
     } catch (err) {
@@ -86,23 +62,6 @@ const HomePage = () => {
     }
   };
 
-  // Helper function to get stock names
-  const getStockName = (symbol) => {
-    const stockNames = {
-      "AAPL": "Apple Inc.",
-      "GOOGL": "Alphabet Inc.",
-      "MSFT": "Microsoft Corp.",
-      "AMZN": "Amazon.com Inc.",
-      "TSLA": "Tesla Inc.",
-      "META": "Meta Platforms Inc.",
-      "NVDA": "NVIDIA Corp.",
-      "JPM": "JPMorgan Chase & Co.",
-      "V": "Visa Inc.",
-      "JNJ": "Johnson & Johnson"
-    };
-    return stockNames[symbol] || symbol;
-  };
-
   // Initial data fetch
   useEffect(() => {
     fetchData();
@@ -0,0 +1,93 @@
+"""
+Rebuild per-stock sentiment aggregates from stock_impacts
+
+Streams every impact in creation order, folds it into its stock's
+SentimentAggregate in memory and writes one document per stock into the
+stock_sentiment collection, replacing whatever was there. Re-running it
+is safe; impacts written by the API while it runs may be dropped from
+the rebuilt aggregates, so run it before impacts start flowing or while
+they are paused.
+
+    python scripts/backfill_sentiment.py --dry-run
+    python scripts/backfill_sentiment.py
+
+Uses the same MONGO_URL / DB_NAME settings as the backend.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(BACKEND_DIR / ".env", override=False)
+
+from database import close_client, db  # noqa: E402
+from sentiment import SentimentAggregate  # noqa: E402
+
+
+async def run(dry_run):
+    start = time.perf_counter()
+    stocks = {stock["id"]: stock["symbol"] async for stock in db.stocks.find({}, {"_id": 0, "id": 1, "symbol": 1})}
+    aggregates, stock_ids = {}, {}
+    folded = skipped = 0
+    cursor = db.stock_impacts.find(
+        {}, {"_id": 0, "stock_id": 1, "stock_symbol": 1, "impact_score": 1, "created_at": 1}
+    ).sort("created_at", 1)
+    async for impact in cursor:
+        # Older impacts only carry the stock's id
+        symbol = impact.get("stock_symbol") or stocks.get(impact.get("stock_id"))
+        if not symbol or impact.get("created_at") is None:
+            skipped += 1
+            continue
+        if symbol not in aggregates:
+            aggregates[symbol] = SentimentAggregate()
+            stock_ids[symbol] = impact.get("stock_id")
+        aggregates[symbol].add(impact["impact_score"], impact["created_at"])
+        folded += 1
+    print(f"Folded {folded} impacts into {len(aggregates)} stocks ({skipped} skipped) in {time.perf_counter() - start:.2f} s")
+
+    now = time.time()
+    for symbol, aggregate in sorted(aggregates.items()):
+        summary = aggregate.summary(now)
+        windows = "  ".join(f"{name} {w['mean']:+.3f}/{w['count']}" for name, w in summary["windows"].items())
+        print(f"  {symbol:<6} ewma {summary['ewma']:+.3f}  {windows}")
+
+    if not dry_run:
+        from pymongo import UpdateOne
+
+        updated_at = datetime.utcnow()
+        # Bumping the version makes concurrent versioned writers retry
+        replacements = [
+            UpdateOne(
+                {"symbol": symbol},
+                {
+                    "$set": dict(aggregate.to_document(), stock_id=stock_ids[symbol], updated_at=updated_at),
+                    "$inc": {"version": 1},
+                },
+                upsert=True,
+            )
+            for symbol, aggregate in aggregates.items()
+        ]
+        if replacements:
+            await db.stock_sentiment.bulk_write(replacements, ordered=False)
+        # Impacts folded in here must not be recorded again by a retried job
+        await db.stock_impacts.update_many({"sentiment_pending": True}, {"$unset": {"sentiment_pending": ""}})
+        print(f"Wrote {len(replacements)} aggregates")
+    close_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dry-run", action="store_true", help="Print the aggregates without writing them")
+    args = parser.parse_args()
+    asyncio.run(run(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Per-tick evaluation benchmark for the watchlist alert engine
+
+Indexes a large number of random alerts across the quote feed's symbols,
+then publishes random-walk ticks into a private quote snapshot and times
+AlertEngine.check_tick() on each one. Fails if the p99 evaluation time
+exceeds the budget.
+
+    python scripts/bench_alerts.py
+    python scripts/bench_alerts.py --alerts 2000000 --ticks 500 --budget-ms 10
+
+No MongoDB is needed: alerts are indexed directly, and fired ones are
+re-armed at a fresh threshold so the active count stays constant.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from alerts import KINDS, PRICE_ABOVE, PRICE_BELOW, AlertEngine  # noqa: E402
+from quote_snapshot import SnapshotWriter  # noqa: E402
+from quotes import QUOTE_INFO, TICK_VOLATILITY  # noqa: E402
+
+
+def random_threshold(rng, kind, price, change):
+    # Thresholds a few percent either side of the current quote, so a
+    # realistic trickle of alerts fires on every tick
+    if kind in (PRICE_ABOVE, PRICE_BELOW):
+        offset = rng.uniform(0.0, 0.05) * price
+        return price + offset if kind == PRICE_ABOVE else price - offset
+    offset = rng.uniform(0.0, 5.0)
+    return change + offset if kind.endswith("above") else change - offset
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--alerts", type=int, default=1_000_000)
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("ALERT_TICK_BUDGET_MS", 10.0)))
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    symbols = list(QUOTE_INFO)
+    opens = np.array([(QUOTE_INFO[s]["min"] + QUOTE_INFO[s]["max"]) / 2 for s in symbols])
+    prices = opens.copy()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-alerts-"), "quotes")
+    writer = SnapshotWriter(path, symbols)
+    engine = AlertEngine(path=path)
+
+    start = time.perf_counter()
+    symbol_of = rng.integers(0, len(symbols), args.alerts)
+    kind_of = rng.integers(0, len(KINDS), args.alerts)
+    for alert_id in range(args.alerts):
+        i = symbol_of[alert_id]
+        kind = KINDS[kind_of[alert_id]]
+        engine.index.add(alert_id, symbols[i], kind, random_threshold(rng, kind, prices[i], 0.0))
+    print(f"Indexed {len(engine.index)} alerts on {len(symbols)} symbols in {time.perf_counter() - start:.1f} s")
+
+    timings = []
+    fired_total = 0
+    for _ in range(args.ticks):
+        prices = prices * np.exp(rng.normal(0.0, TICK_VOLATILITY, len(prices)))
+        changes = (prices / opens - 1.0) * 100.0
+        writer.publish(np.round(prices, 2), np.round(changes, 2))
+
+        start = time.perf_counter()
+        fired = engine.check_tick()
+        timings.append(time.perf_counter() - start)
+
+        # Re-arm what fired so every tick evaluates the full alert count
+        quotes = dict(zip(symbols, zip(prices, changes)))
+        for symbol, hits in fired:
+            for kind, _, ids, _ in hits:
+                fired_total += len(ids)
+                for alert_id in ids.tolist():
+                    engine.index.add(alert_id, symbol, kind, random_threshold(rng, kind, *quotes[symbol]))
+
+    writer.close()
+    engine.reader.close()
+    timings_ms = sorted(t * 1000 for t in timings)
+    p50 = statistics.median(timings_ms)
+    p99 = timings_ms[min(len(timings_ms) - 1, int(len(timings_ms) * 0.99))]
+    ok = p99 <= args.budget_ms
+    print(
+        f"{args.ticks} ticks: p50 {p50:.2f} ms  p99 {p99:.2f} ms  max {timings_ms[-1]:.2f} ms "
+        f"(budget {args.budget_ms:.0f} ms)  {fired_total / args.ticks:.0f} alerts fired per tick  "
+        f"{'OK' if ok else 'OVER BUDGET'}"
+    )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Memory and latency benchmark for the in-memory news hot set
+
+Generates random articles (a few sources and categories, 1-4 affected
+stocks out of a few hundred symbols) and round-trips them through BSON,
+so they are dicts just as the MongoDB driver decodes them. It reports
+the bytes per article of those dicts against HotNews records built from
+them, with and without the article text (title, content, url), which
+both keep as is. It then times HotNews.newest() for the front page,
+categories and symbols.
+
+Random inserts, updates and deletes are applied along the way, and every
+page is compared with a brute-force sort of the same articles. Fails on
+a wrong page, a record not at least --min-saving smaller than the dict,
+or a median query time over the budget.
+
+    python scripts/bench_hot_news.py
+    python scripts/bench_hot_news.py --articles 20000 --size 10000 --budget-ms 0.1
+"""
+import argparse
+import gc
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import bson
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from hotnews import HotNews  # noqa: E402
+
+SOURCES = ("Bloomberg", "CNBC", "Reuters", "Wall Street Journal", "Financial Times")
+CATEGORIES = ("Economy", "Technology", "Manufacturing", "Energy", "Healthcare", "Finance", "Retail", "Politics")
+WORDS = "shares market company quarter results investors analysts growth outlook revenue profit rate".split()
+TEXT_FIELDS = ("title", "content", "url")
+
+
+def random_articles(rng, count, symbols, start):
+    articles = []
+    for i in range(count):
+        # Whole milliseconds, like MongoDB dates
+        published = start + timedelta(milliseconds=int(rng.integers(0, 30 * 86_400_000)))
+        articles.append({
+            "id": f"news-{i}",
+            "title": " ".join(rng.choice(WORDS, 10)).capitalize(),
+            "content": " ".join(rng.choice(WORDS, 80)).capitalize() + ".",
+            "url": f"https://example.com/news/{i}",
+            "source": str(rng.choice(SOURCES)),
+            "published_at": published,
+            "category": str(rng.choice(CATEGORIES)),
+            "affected_stocks": [str(s) for s in rng.choice(symbols, rng.integers(1, 5), replace=False)],
+            "confidence_score": float(rng.random()),
+            "validated_sources": [str(s) for s in rng.choice(SOURCES, rng.integers(1, 4), replace=False)],
+            "created_at": published + timedelta(seconds=30),
+        })
+    return [bson.decode(bson.encode(article)) for article in articles]
+
+
+def allocated(build):
+    """Bytes still allocated by what ``build()`` returns"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def expected(documents, limit, skip, category=None, symbol=None):
+    rows = [
+        d for d in documents.values()
+        if (category is None or d["category"] == category) and (symbol is None or symbol in d["affected_stocks"])
+    ]
+    rows.sort(key=lambda d: (d["published_at"], d["id"]), reverse=True)
+    return [d["id"] for d in rows[skip:skip + limit]]
+
+
+def check(hot, documents, rng, symbols, checks):
+    """Compare random pages with brute force; return the number of wrong ones"""
+    wrong = 0
+    for _ in range(checks):
+        limit, skip = int(rng.integers(1, 30)), int(rng.choice([0, 0, 0, 10, 50]))
+        kind = rng.integers(3)
+        query = {} if kind == 0 else {"category": str(rng.choice(CATEGORIES))} if kind == 1 else {
+            "symbol": str(rng.choice(symbols))}
+        page = hot.newest(limit, skip, **query)
+        if page is not None and [d["id"] for d in page] != expected(documents, limit, skip, **query):
+            wrong += 1
+            print(f"WRONG PAGE limit={limit} skip={skip} {query}")
+    return wrong
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--articles", type=int, default=10_000, help="Articles in the collection")
+    parser.add_argument("--size", type=int, default=5000, help="Hot set size")
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=2000, help="Timed queries")
+    parser.add_argument("--budget-ms", type=float, default=0.2, help="Median newest() time, limit 10")
+    parser.add_argument("--min-saving", type=float, default=0.3, help="Smallest saving per article, text excluded")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    symbols = np.array([f"S{i:03d}" for i in range(args.symbols)])
+    start = datetime(2026, 1, 1)
+    articles = random_articles(rng, args.articles, symbols, start)
+    newest = sorted(articles, key=lambda d: d["published_at"], reverse=True)[:args.size + 1]
+
+    # Memory of the newest articles, as decoded dicts and as records
+    sample = [bson.decode(bson.encode(d)) for d in newest[:args.size]]
+    text = sum(sys.getsizeof(d[field]) for d in sample for field in TEXT_FIELDS)
+    dicts, dict_bytes = allocated(lambda: [bson.decode(bson.encode(d)) for d in sample])
+    del dicts
+    # Loaded from documents decoded inside the measurement: only what the records keep is counted
+    hot, hot_bytes = allocated(lambda: _loaded(args.size, [bson.decode(bson.encode(d)) for d in sample]))
+    del hot
+    count = len(sample)
+    dict_rest, hot_rest = (dict_bytes - text) / count, (hot_bytes - text) / count
+    saving = 1 - hot_rest / dict_rest
+    print(f"{count} articles: dicts {dict_bytes / count:,.0f} B/article, hot set {hot_bytes / count:,.0f} B/article; "
+          f"without the {text / count:,.0f} B of text {dict_rest:,.0f} vs {hot_rest:,.0f} B ({saving:.0%} smaller)")
+
+    # Correctness, through inserts, updates and deletes
+    documents = {d["id"]: d for d in articles}
+    hot = HotNews(size=args.size)
+    hot.load(newest, complete=len(newest) <= args.size)
+    hot._reload = False
+    wrong = check(hot, documents, rng, symbols, 500)
+    extra = random_articles(rng, 2000, symbols, start + timedelta(days=10))
+    for i, article in enumerate(extra):
+        article["id"] = f"extra-{i}"
+        action = rng.integers(4)
+        if action == 0 and documents:
+            victim = str(rng.choice(list(documents)))
+            del documents[victim]
+            hot.remove(victim)
+        elif action == 1:
+            victim = dict(documents[str(rng.choice(list(documents)))])
+            victim["published_at"] = article["published_at"]
+            victim["category"] = article["category"]
+            documents[victim["id"]] = victim
+            hot.upsert(victim)
+        else:
+            documents[article["id"]] = article
+            hot.upsert(article)
+    wrong += check(hot, documents, rng, symbols, 2000)
+    print(f"{len(hot)} articles held after {len(extra)} writes, hits {hot.hits} misses {hot.misses}, "
+          f"{wrong} wrong pages")
+
+    ok = not wrong and saving >= args.min_saving
+    categories = [str(c) for c in rng.choice(CATEGORIES, args.rounds)]
+    picks = [str(s) for s in rng.choice(symbols, args.rounds)]
+    for name, query in (("front page", lambda i: {}), ("category", lambda i: {"category": categories[i]}),
+                        ("symbol", lambda i: {"symbol": picks[i]})):
+        timings = []
+        for i in range(args.rounds):
+            started = time.perf_counter()
+            hot.newest(10, **query(i))
+            timings.append((time.perf_counter() - started) * 1000)
+        p50 = statistics.median(timings)
+        ok &= p50 <= args.budget_ms
+        print(f"newest {name:<10} p50 {p50:.4f} ms  max {max(timings):.3f} ms")
+
+    print(f"budget {args.budget_ms} ms, saving at least {args.min_saving:.0%}: {'OK' if ok else 'FAILED'}")
+    sys.exit(0 if ok else 1)
+
+
+def _loaded(size, documents):
+    hot = HotNews(size=size)
+    hot.load(documents, complete=False)
+    return hot
+
+
+if __name__ == "__main__":
+    main()
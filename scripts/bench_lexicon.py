@@ -0,0 +1,79 @@
+"""
+Throughput benchmark for the lexicon sentiment scorer
+
+Generates random news-like articles (filler words mixed with lexicon
+terms, negators and sentence breaks) and scores them in batches with
+LexiconScorer.score(). Fails if fewer articles per second than the
+target are scored on one core. A handful of fixed sentences are checked
+first, so a broken negation or sign fails the run too.
+
+    python scripts/bench_lexicon.py
+    python scripts/bench_lexicon.py --articles 200000 --words 400 --batch-size 5000
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from lexicon import NEGATIVE, NEGATORS, POSITIVE, LexiconScorer  # noqa: E402
+
+FILLER = (
+    "the company said on monday that its quarterly results for the period were in line with what analysts "
+    "at several banks had expected while shares of the group traded in new york and investors watched the "
+    "central bank as the market opened"
+).split()
+
+# text, expected sign
+EXPECTED = (
+    ("Apple beats estimates and shares surge to a record high.", 1),
+    ("Quarterly profit was not strong; revenue missed forecasts.", -1),
+    ("The bank didn't miss estimates this time.", 1),
+    ("Shares plunged after the downgrade. Analysts are not optimistic.", -1),
+    ("Revenue rose, but the outlook remains weak and margins declined.", -1),
+    ("The company held its annual meeting on Tuesday.", 0),
+)
+
+
+def random_articles(rng, count, words):
+    terms = list(POSITIVE) + list(NEGATIVE)
+    vocabulary = np.array(FILLER * 4 + terms + list(NEGATORS) + [".", ".", ",", "but"])
+    tokens = rng.choice(vocabulary, (count, words))
+    return [" ".join(row) for row in tokens]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--articles", type=int, default=50_000)
+    parser.add_argument("--words", type=int, default=200, help="Words per article")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--target", type=float, default=10_000, help="Articles per second")
+    args = parser.parse_args()
+
+    scorer = LexiconScorer()
+    scores = scorer.score([text for text, _ in EXPECTED])
+    wrong = [(text, score) for (text, sign), score in zip(EXPECTED, scores) if np.sign(score) != sign]
+    for text, score in wrong:
+        print(f"WRONG SIGN {score:+.2f}: {text}")
+
+    articles = random_articles(np.random.default_rng(7), args.articles, args.words)
+    scorer.score(articles[:10])  # import scipy outside the timing
+    start = time.perf_counter()
+    for i in range(0, len(articles), args.batch_size):
+        scorer.score(articles[i:i + args.batch_size])
+    elapsed = time.perf_counter() - start
+
+    rate = len(articles) / elapsed
+    ok = not wrong and rate >= args.target
+    print(
+        f"{len(articles)} articles of {args.words} words in batches of {args.batch_size}: {elapsed:.2f} s, "
+        f"{rate:,.0f} articles/s (target {args.target:,.0f})  {'OK' if ok else 'FAILED'}"
+    )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
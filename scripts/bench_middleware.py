@@ -0,0 +1,138 @@
+"""
+Requests-per-second benchmark for the middleware stack
+
+Drives simple_server's routes in-process through two stacks and prints
+requests per second and bytes on the wire for each:
+
+  legacy     Starlette's CORSMiddleware plus the old @app.middleware("http")
+             security-header function
+  pure-asgi  create_app(): CORS, security headers, ETags and compression as
+             pure ASGI middleware
+
+    python scripts/bench_middleware.py
+    python scripts/bench_middleware.py --requests 5000 --runs 5
+
+No network, MongoDB or NewsAPI key is needed: NewsAPI routes serve their
+mock payloads, and /metrics stands in for a large compressible response.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# Mock NewsAPI payloads, and no state shared with a running server
+os.environ["NEWS_API_KEY"] = ""
+os.environ["NEWSAPI_STATE_DIR"] = tempfile.mkdtemp(prefix="bench-middleware-")
+os.environ["NEWSAPI_SNAPSHOT_PATH"] = ""
+
+from fastapi import FastAPI, Request  # noqa: E402
+from starlette.middleware.cors import CORSMiddleware  # noqa: E402
+
+import metrics  # noqa: E402
+import simple_server  # noqa: E402
+
+# (label, path, request headers)
+PROBES = [
+    ("tiny JSON", "/api/", []),
+    ("1 KB JSON", "/api/newsapi/everything?q=apple", []),
+    ("13 KB text", "/metrics", []),
+    ("13 KB text, gzip", "/metrics", [(b"accept-encoding", b"gzip, deflate")]),
+    ("13 KB text, br", "/metrics", [(b"accept-encoding", b"gzip, deflate, br")]),
+]
+
+
+async def legacy_security_headers(request: Request, call_next):
+    # The pre-ASGI implementation, kept here as the baseline
+    response = await call_next(request)
+    response.headers["Content-Security-Policy"] = "default-src 'self'; script-src 'self' 'unsafe-inline' 'unsafe-eval'; style-src 'self' 'unsafe-inline'; img-src 'self' data: https:; connect-src 'self' https:;"
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    response.headers["X-Frame-Options"] = "DENY"
+    response.headers["X-XSS-Protection"] = "1; mode=block"
+    return response
+
+
+def legacy_app():
+    app = FastAPI()
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.middleware("http")(legacy_security_headers)
+    app.add_api_route("/metrics", metrics.metrics_response)
+    app.include_router(simple_server.router)
+    return app
+
+
+def pure_asgi_app():
+    return simple_server.create_app(frontend_build_dir=Path(os.devnull) / "no-frontend")
+
+
+async def hammer(app, path, extra_headers, requests):
+    route, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": route, "raw_path": route.encode(),
+        "root_path": "", "query_string": query.encode(),
+        "headers": [(b"host", b"localhost"), (b"origin", b"http://localhost:3000")] + extra_headers,
+        "client": ("127.0.0.1", 1), "server": ("localhost", 80),
+    }
+    wire_bytes = 0
+
+    never = asyncio.Event()
+
+    def receiver():
+        requested = []
+
+        async def receive():
+            if not requested:
+                requested.append(True)
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # Like a live connection: nothing more until the client goes away
+            await never.wait()
+
+        return receive
+
+    async def send(message):
+        nonlocal wire_bytes
+        if message["type"] == "http.response.start":
+            wire_bytes += sum(len(k) + len(v) + 4 for k, v in message["headers"])
+        else:
+            wire_bytes += len(message.get("body", b""))
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receiver(), send)
+    elapsed = time.perf_counter() - start
+    return requests / elapsed, wire_bytes / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    stacks = [("legacy", legacy_app()), ("pure-asgi", pure_asgi_app())]
+    for label, path, headers in PROBES:
+        baseline = None
+        for name, app in stacks:
+            # First pass warms up routing and the JSON encoder
+            asyncio.run(hammer(app, path, headers, 100))
+            results = [asyncio.run(hammer(app, path, headers, args.requests)) for _ in range(args.runs)]
+            rps = statistics.median(r[0] for r in results)
+            wire = results[-1][1]
+            baseline = baseline or rps
+            print(f"{label:18s} {name:10s} {rps:9.0f} req/s ({rps / baseline:5.2f}x)  {wire:7.0f} bytes/response")
+
+
+if __name__ == "__main__":
+    main()
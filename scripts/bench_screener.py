@@ -0,0 +1,95 @@
+"""
+Latency benchmark for the market screener
+
+Builds a registry of random stocks, funds and ETFs across a handful of
+exchanges, publishes random quotes for them into a private quote
+snapshot, and times Screener.screen() on a mix of typical queries (top
+movers, gainers in one class, price bands on one exchange). Fails if the
+median of any query exceeds the budget; p99 is reported too, but on a
+shared machine it mostly measures scheduling noise.
+
+    python scripts/bench_screener.py
+    python scripts/bench_screener.py --instruments 500000 --budget-ms 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from instruments import CLASSES, InstrumentRegistry  # noqa: E402
+from quote_snapshot import SnapshotReader, SnapshotWriter  # noqa: E402
+from screener import Screener  # noqa: E402
+
+EXCHANGES = ("NYSE", "NASDAQ", "NYSE Arca", "BATS", "LSE", "TSX")
+
+QUERIES = {
+    "top movers": dict(sort="abs_change", limit=20),
+    "etf gainers": dict(asset_class="etf", sort="change", limit=20),
+    "fund losers": dict(asset_class="mutual_fund", sort="change", descending=False, limit=20),
+    "nasdaq 50-150": dict(exchanges=["NASDAQ"], min_price=50, max_price=150, sort="price", limit=100),
+    "stocks up 2-5%": dict(asset_class="stock", min_change=2, max_change=5, sort="change", limit=50),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--instruments", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--budget-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    n = args.instruments
+    classes = rng.choice(len(CLASSES), n, p=[0.7, 0.15, 0.15])
+    exchanges = rng.integers(0, len(EXCHANGES), n)
+    lows = rng.uniform(5, 500, n)
+    rows = [
+        (f"X{i:06d}", f"Instrument {i}", CLASSES[classes[i]], EXCHANGES[exchanges[i]], lows[i], lows[i] * 1.1)
+        for i in range(n)
+    ]
+    registry = InstrumentRegistry(rows, path="")
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-screener-"), "quotes")
+    writer = SnapshotWriter(path, registry.symbols)
+    prices = np.array([(low + high) / 2 for _, _, _, _, low, high in rows])
+    by_symbol = dict(zip((row[0] for row in rows), prices))
+    prices = np.array([by_symbol[s] for s in registry.symbols])
+    reader = SnapshotReader(path)
+    screener = Screener(registry, reader)
+
+    start = time.perf_counter()
+    writer.publish(np.round(prices, 2), np.round(rng.normal(0, 2, n), 2))
+    screener.screen()
+    print(f"{n} instruments, first query (incl. layout) {1000 * (time.perf_counter() - start):.1f} ms")
+
+    ok = True
+    for name, query in QUERIES.items():
+        timings = []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            result = screener.screen(**query)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p50 = statistics.median(timings)
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        ok &= p50 <= args.budget_ms
+        print(
+            f"{name:15} p50 {p50:.3f} ms  p99 {p99:.3f} ms  "
+            f"{result['matched']:>6} matched  {len(result['results'])} returned"
+        )
+
+    writer.close()
+    reader.close()
+    print(f"budget {args.budget_ms} ms: {'OK' if ok else 'OVER BUDGET'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
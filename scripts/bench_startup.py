@@ -0,0 +1,105 @@
+"""
+Startup-time benchmark for the backend apps
+
+Measures, in a fresh interpreter per run, how long it takes to import the
+app module (which also builds the app via create_app()) and to serve the
+very first request, then fails if either exceeds its budget. Worker spawn
+time under gunicorn and autoscaling is dominated by these two numbers.
+
+    python scripts/bench_startup.py                       # both apps
+    python scripts/bench_startup.py --module server --runs 10
+    python scripts/bench_startup.py --import-budget 0.8 --first-request-budget 0.05
+
+No MongoDB or network is needed: the lifespan (which connects to Mongo)
+is not run and the probed routes don't touch the database.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+# Route probed for the first-request measurement of each app
+PROBES = {
+    "server": "/api/",
+    "simple_server": "/health",
+}
+
+CHILD = r"""
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+module = __import__(sys.argv[1])
+t1 = time.perf_counter()
+
+async def first_request(app, path):
+    sent = []
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": b"", "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 1), "server": ("localhost", 80),
+    }
+    requested = []
+    async def receive():
+        if not requested:
+            requested.append(True)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Like a live connection: nothing more until the client goes away
+        await asyncio.Event().wait()
+    async def send(message):
+        sent.append(message)
+    await app(scope, receive, send)
+    return sent[0]["status"]
+
+start = time.perf_counter()
+status = asyncio.run(first_request(module.app, sys.argv[2]))
+t2 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "first_request": t2 - start, "status": status,
+                  "modules": len(sys.modules)}))
+"""
+
+
+def run_once(module):
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, module, PROBES[module]],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--module", choices=sorted(PROBES), action="append")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=float(os.environ.get("IMPORT_BUDGET_SECONDS", 1.5)))
+    parser.add_argument(
+        "--first-request-budget", type=float, default=float(os.environ.get("FIRST_REQUEST_BUDGET_SECONDS", 0.1))
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.module or sorted(PROBES):
+        # First run warms the bytecode cache and the OS page cache
+        run_once(module)
+        results = [run_once(module) for _ in range(args.runs)]
+        import_s = statistics.median(r["import"] for r in results)
+        first_s = statistics.median(r["first_request"] for r in results)
+        ok = import_s <= args.import_budget and first_s <= args.first_request_budget
+        failed |= not ok
+        print(
+            f"{module:14s} import {import_s * 1000:7.1f} ms (budget {args.import_budget * 1000:.0f})  "
+            f"first request {first_s * 1000:6.1f} ms (budget {args.first_request_budget * 1000:.0f})  "
+            f"status {results[-1]['status']}  modules {results[-1]['modules']}  {'OK' if ok else 'OVER BUDGET'}"
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Typeahead latency benchmark for the stock suggestion index
+
+Indexes the seeded stocks plus random ones with made-up company names,
+all shaped like ``instruments.registry.stock_documents()`` (symbol, name
+and exchange, no id), with Zipf-distributed follower counts, then times SuggestIndex.suggest() for every prefix a
+user would type on the way to a few symbols and names ("a", "ap",
+"app", ...). Also times incremental updates (a stock renamed in place)
+against a full rebuild. Fails if the median suggestion time exceeds the
+budget.
+
+    python scripts/bench_suggest.py
+    python scripts/bench_suggest.py --stocks 500000 --budget-ms 2
+
+No MongoDB is needed: the index is loaded directly.
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from instruments import registry  # noqa: E402
+from suggest import SuggestIndex  # noqa: E402
+
+WORDS = (
+    "american", "global", "general", "united", "first", "pacific", "atlantic", "national", "international",
+    "energy", "motors", "bank", "financial", "systems", "health", "pharma", "capital", "holdings", "foods",
+    "airlines", "networks", "semiconductor", "software", "insurance", "realty", "mining", "steel", "retail",
+    "apple", "alpha", "delta", "omega", "north", "south", "green", "blue", "river", "mountain", "star",
+)
+SUFFIXES = ("Inc.", "Corp.", "Co.", "Holdings", "Group", "plc", "Ltd.")
+TYPED = ("apple", "appl", "gener", "motors", "bank of", "semiconductor", "zz", "q")
+
+
+def random_stocks(rng, count):
+    letters = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    stocks = registry.stock_documents()[:count]
+    symbols = {stock["symbol"] for stock in stocks}
+    while len(stocks) < count:
+        symbol = "".join(rng.choice(letters, rng.integers(1, 6)))
+        if symbol in symbols:
+            continue
+        symbols.add(symbol)
+        words = [w.title() for w in rng.choice(WORDS, rng.integers(1, 4))]
+        name = " ".join(words + [rng.choice(SUFFIXES)])
+        stocks.append({"symbol": symbol, "name": name, "exchange": "NYSE"})
+    return stocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--stocks", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--budget-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    stocks = random_stocks(rng, args.stocks)
+    popularity = {stock["symbol"]: int(n) for stock, n in zip(stocks, rng.zipf(1.5, len(stocks)))}
+
+    index = SuggestIndex()
+    start = time.perf_counter()
+    index.load(stocks, popularity)
+    print(f"Indexed {len(index)} stocks under {len(index._keys)} keys in {time.perf_counter() - start:.2f} s")
+
+    ok = True
+    queries = [word[:n] for word in TYPED + tuple(s["symbol"] for s in stocks[:5]) for n in range(1, len(word) + 1)]
+    timings, sizes = [], []
+    for _ in range(args.rounds):
+        for q in queries:
+            start = time.perf_counter()
+            sizes.append(len(index.suggest(q, 10)))
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p50 = statistics.median(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    ok &= p50 <= args.budget_ms
+    print(f"suggest   {len(queries)} prefixes: p50 {p50:.3f} ms  p99 {p99:.3f} ms  max {timings[-1]:.3f} ms")
+
+    timings = []
+    for i in range(200):
+        stock = dict(stocks[int(rng.integers(len(stocks)))], name=f"Renamed {i} Industries Inc.")
+        start = time.perf_counter()
+        index.upsert(stock)
+        timings.append((time.perf_counter() - start) * 1000)
+    assert index.suggest("renamed 199", 1)[0]["name"] == "Renamed 199 Industries Inc."
+    print(f"upsert    p50 {statistics.median(timings):.3f} ms  max {max(timings):.3f} ms (vs a full rebuild above)")
+
+    print(f"budget {args.budget_ms} ms: {'OK' if ok else 'OVER BUDGET'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
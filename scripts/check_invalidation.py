@@ -0,0 +1,152 @@
+"""
+Cross-worker cache invalidation check
+
+Starts several worker processes, each with its own InvalidationBus and
+ReadCache, caches one document in all of them, then changes it from the
+parent process and measures how long every worker takes to drop it.
+Fails if any worker still holds the stale entry after the timeout.
+
+By default the change is an update in MongoDB, seen by the workers
+through change streams. That needs a replica set; a local single-node
+one is enough:
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017 &
+    mongosh --eval 'rs.initiate()'
+    MONGO_URL=mongodb://localhost:27017/?replicaSet=rs0 python scripts/check_invalidation.py
+
+With --fallback the parent only publishes the change and the workers
+pick it up from the shared log, so no MongoDB is needed:
+
+    python scripts/check_invalidation.py --fallback --workers 8 --rounds 200
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(BACKEND_DIR / ".env", override=False)
+
+from invalidation import InvalidationBus, ReadCache  # noqa: E402
+
+COLLECTION = "invalidation_check"
+
+
+def worker(conn, path, fallback):
+    async def run():
+        bus = InvalidationBus(path=path, poll_seconds=0.01, change_streams=not fallback)
+        cache = bus.register(ReadCache(COLLECTION, ("id",)))
+        await bus.start()
+        while True:
+            if not conn.poll():
+                await asyncio.sleep(0.001)
+                continue
+            command, document = conn.recv()
+            if command == "stop":
+                break
+            if command == "ready":
+                conn.send(bus.streaming or fallback)
+                continue
+            cache.put(document)
+            conn.send("armed")
+            while cache.get("id", document["id"]) is not None:
+                await asyncio.sleep(0.001)
+            conn.send(time.time())
+        await bus.stop()
+
+    asyncio.run(run())
+
+
+async def change(bus, document, fallback):
+    if fallback:
+        bus.publish(COLLECTION, id=document["id"])
+    else:
+        from database import db
+
+        await db[COLLECTION].update_one({"id": document["id"]}, {"$set": document}, upsert=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=2.0, help="Seconds every worker has to drop the entry")
+    parser.add_argument("--fallback", action="store_true", help="Use the shared log instead of change streams")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="check-invalidation-"), "invalidations")
+    context = multiprocessing.get_context("spawn")
+    pipes, processes = [], []
+    for _ in range(args.workers):
+        parent, child = context.Pipe()
+        process = context.Process(target=worker, args=(child, path, args.fallback), daemon=True)
+        process.start()
+        pipes.append(parent)
+        processes.append(process)
+
+    # Wait until every worker is following the chosen source
+    deadline = time.time() + 30
+    for conn in pipes:
+        while True:
+            conn.send(("ready", None))
+            if conn.recv():
+                break
+            if time.time() > deadline:
+                print("Workers never opened a change stream; is MONGO_URL a replica set?")
+                sys.exit(1)
+            time.sleep(0.1)
+
+    bus = InvalidationBus(path=path, change_streams=False)
+    loop = asyncio.new_event_loop()
+    latencies, failures = [], 0
+    for round_ in range(args.rounds):
+        document = {"id": f"check-{round_}", "round": round_}
+        for conn in pipes:
+            conn.send(("arm", document))
+            conn.recv()
+        written = time.time()
+        loop.run_until_complete(change(bus, document, args.fallback))
+        slowest = 0.0
+        for conn in pipes:
+            if conn.poll(args.timeout):
+                slowest = max(slowest, conn.recv() - written)
+            else:
+                failures += 1
+        latencies.append(slowest * 1000)
+        if failures:
+            break
+
+    for conn in pipes:
+        conn.send(("stop", None))
+    for process in processes:
+        process.join(5)
+        if process.is_alive():
+            process.terminate()
+    if not args.fallback:
+        from database import db
+
+        loop.run_until_complete(db[COLLECTION].drop())
+    loop.close()
+
+    source = "shared log" if args.fallback else "change streams"
+    if failures:
+        print(f"FAILED: a worker kept a stale entry for more than {args.timeout} s ({source})")
+        sys.exit(1)
+    latencies.sort()
+    print(
+        f"{args.rounds} changes x {args.workers} workers via {source}: "
+        f"p50 {statistics.median(latencies):.1f} ms  max {latencies[-1]:.1f} ms  OK"
+    )
+
+
+if __name__ == "__main__":
+    main()
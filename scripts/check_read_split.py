@@ -0,0 +1,166 @@
+"""
+Read/write split check against a replica set
+
+Checks what database.read_db and causal.py promise, on a real replica
+set with at least two secondaries:
+
+1. Routing: plain reads through read_db are served by secondaries,
+   never by the primary.
+2. Read-your-writes: every write is made in causal.write_session(). Its
+   X-Read-After token is then read back through causal.session_after()
+   on read_db, and must find the write every time. Plain reads that miss
+   it are counted, to show the lag the token hides.
+3. A lagging member: replication to one secondary is paused (the
+   stopReplProducer fail point, which needs enableTestCommands). A plain
+   read there must miss the write. A read with the token must wait
+   (time out) rather than return stale data. Once replication resumes,
+   the same read must find the write. Skipped with --no-stall.
+
+A local three-node replica set:
+
+    for i in 0 1 2; do
+        mkdir -p /tmp/rs$i
+        mongod --replSet rs0 --port $((27017 + i)) --dbpath /tmp/rs$i --bind_ip localhost \\
+            --setParameter enableTestCommands=1 --fork --logpath /tmp/rs$i.log
+    done
+    mongosh --port 27017 --eval 'rs.initiate({_id: "rs0", members: [
+        {_id: 0, host: "localhost:27017"}, {_id: 1, host: "localhost:27018"},
+        {_id: 2, host: "localhost:27019"}]})'
+    MONGO_URL="mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0" \\
+        python scripts/check_read_split.py --rounds 500
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(BACKEND_DIR / ".env", override=False)
+
+import causal  # noqa: E402
+from database import close_client, db, get_client, get_db_name, read_db  # noqa: E402
+
+COLLECTION = "read_split_check"
+
+
+def address(host):
+    name, _, port = host.rpartition(":")
+    return name, int(port)
+
+
+async def write(document):
+    """Insert ``document`` the way handlers do; returns its X-Read-After token"""
+    response = SimpleNamespace(headers={})
+    async with causal.write_session(response) as session:
+        await db[COLLECTION].insert_one(dict(document), session=session)
+    return response.headers.get(causal.HEADER)
+
+
+async def routing_and_causal_reads(rounds, primary):
+    served_by, misses, found = {}, 0, 0
+    for i in range(rounds):
+        document = {"id": f"check-{i}", "round": i}
+        token = await write(document)
+        if token is None:
+            print("FAILED: no X-Read-After token; is MONGO_URL a replica set?")
+            return False
+        # Plain read from a secondary, right after the write
+        cursor = read_db[COLLECTION].find({"id": document["id"]})
+        misses += not await cursor.to_list(1)
+        served_by[cursor.address] = served_by.get(cursor.address, 0) + 1
+        # The same read after the token
+        async with causal.session_after(token) as session:
+            found += await read_db[COLLECTION].find_one({"id": document["id"]}, session=session) is not None
+    members = ", ".join(f"{host}:{port} {n}" for (host, port), n in sorted(served_by.items()))
+    print(f"plain reads served by: {members} (primary {primary[0]}:{primary[1]})")
+    print(f"read-your-writes: {found}/{rounds} found with the token; "
+          f"{misses}/{rounds} plain reads missed their write")
+    ok = found == rounds and primary not in served_by
+    if primary in served_by:
+        print("FAILED: plain reads went to the primary; check MONGO_READ_PREFERENCE")
+    return ok
+
+
+async def lagging_member(secondary, timeout_ms):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import ReadPreference
+    from pymongo.errors import ExecutionTimeout
+
+    direct = AsyncIOMotorClient(f"mongodb://{secondary[0]}:{secondary[1]}/?directConnection=true")
+    lagging = direct.get_database(get_db_name(), read_preference=ReadPreference.SECONDARY_PREFERRED)[COLLECTION]
+
+    async def fail_point(mode):
+        await direct.admin.command("configureFailPoint", "stopReplProducer", mode=mode)
+
+    ok = True
+    await fail_point("alwaysOn")
+    try:
+        document = {"id": "check-lagging"}
+        token = await write(document)
+        stale = await lagging.find_one({"id": document["id"]}) is None
+        print(f"paused {secondary[0]}:{secondary[1]}: plain read {'missed the write' if stale else 'FOUND it'}")
+        ok &= stale
+        times = causal.decode(token)
+        session = await direct.start_session(causal_consistency=True)
+        session.advance_cluster_time(times["clusterTime"])
+        session.advance_operation_time(times["operationTime"])
+        try:
+            try:
+                result = await lagging.find({"id": document["id"]}, session=session).max_time_ms(timeout_ms).to_list(1)
+                print(f"FAILED: read with the token returned {'the write' if result else 'stale data'} while paused")
+                ok = False
+            except ExecutionTimeout:
+                print(f"read with the token waited for the write (timed out after {timeout_ms} ms)")
+            resume = asyncio.get_running_loop().call_later(0.5, lambda: asyncio.ensure_future(fail_point("off")))
+            started = time.perf_counter()
+            result = await lagging.find({"id": document["id"]}, session=session).max_time_ms(30_000).to_list(1)
+            waited = (time.perf_counter() - started) * 1000
+            resume.cancel()
+            print(f"replication resumed after 500 ms: read with the token "
+                  f"{'found the write' if result else 'FAILED to find the write'} after {waited:.0f} ms")
+            ok &= bool(result)
+        finally:
+            await session.end_session()
+    finally:
+        await fail_point("off")
+        direct.close()
+    return ok
+
+
+async def run(args):
+    hello = await get_client().admin.command("hello")
+    if "setName" not in hello or len(hello.get("hosts", [])) < 3:
+        print("FAILED: MONGO_URL must be a replica set with a primary and two secondaries")
+        return False
+    primary = address(hello["primary"])
+    secondaries = [address(host) for host in hello["hosts"] if address(host) != primary]
+    await db[COLLECTION].drop()
+    try:
+        ok = await routing_and_causal_reads(args.rounds, primary)
+        if not args.no_stall:
+            ok &= await lagging_member(secondaries[0], args.timeout_ms)
+    finally:
+        await db[COLLECTION].drop()
+        close_client()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rounds", type=int, default=200, help="Writes read back right away")
+    parser.add_argument("--timeout-ms", type=int, default=1000, help="How long a read may wait on a paused member")
+    parser.add_argument("--no-stall", action="store_true", help="Don't pause replication to a secondary")
+    args = parser.parse_args()
+    ok = asyncio.run(run(args))
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
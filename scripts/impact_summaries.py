@@ -0,0 +1,75 @@
+"""
+Batch impact summaries for every user
+
+Loads the news x stock impact matrix and every user's favorites from
+MongoDB, computes each user's time-decayed net news impact in one sparse
+matrix product and prints a digest, or stores the results with --write
+(one document per user in the impact_summaries collection).
+
+    python scripts/impact_summaries.py
+    python scripts/impact_summaries.py --write
+
+Uses the same MONGO_URL / DB_NAME settings as the backend.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(BACKEND_DIR / ".env", override=False)
+
+from database import close_client, db  # noqa: E402
+from impact import ImpactAnalytics  # noqa: E402
+
+
+async def run(write):
+    analytics = ImpactAnalytics()
+    start = time.perf_counter()
+    await analytics.refresh(force=True)
+    loaded = time.perf_counter()
+    favorites = {
+        user["id"]: user.get("favorite_stocks", [])
+        async for user in db.users.find({}, {"_id": 0, "id": 1, "favorite_stocks": 1})
+    }
+    users = time.perf_counter()
+    results = analytics.matrix.summaries(favorites)
+    computed = time.perf_counter()
+    print(
+        f"{len(analytics.matrix)} impacts, {len(favorites)} users: load {loaded - start:.2f} s, "
+        f"users {users - loaded:.2f} s, compute {(computed - users) * 1000:.1f} ms"
+    )
+
+    if write:
+        from pymongo import UpdateOne
+
+        now = datetime.utcnow()
+        updates = [
+            UpdateOne({"user_id": user_id}, {"$set": {"net_impact": value, "computed_at": now}}, upsert=True)
+            for user_id, value in results.items()
+        ]
+        if updates:
+            await db.impact_summaries.bulk_write(updates, ordered=False)
+        print(f"Wrote {len(updates)} summaries")
+    else:
+        ranked = sorted(results.items(), key=lambda item: item[1])
+        for user_id, value in ranked if len(ranked) <= 10 else ranked[:5] + ranked[-5:]:
+            print(f"  {user_id}  {value:+.4f}")
+    close_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--write", action="store_true", help="Upsert results into impact_summaries")
+    args = parser.parse_args()
+    asyncio.run(run(args.write))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Bulk import of news articles from NDJSON archives
+
+Streams one or more ``.ndjson`` / ``.ndjson.gz`` files (one article per
+line) into the news collection without loading them into memory. A
+parser thread validates each line against the API's NewsItem model and
+hands batches to concurrent writers through a bounded queue, so parsing
+and writing overlap and a slow database throttles the parser instead of
+piling batches up in memory. Batches are unordered insert_many calls
+against a unique index on ``id``; articles without an id get one derived
+from their URL, so re-importing a file never duplicates articles.
+
+Every written article gets an impact analysis job (backend/jobs.py), so
+the job workers fill in its stock impacts; --skip-analysis leaves them
+out.
+
+Progress is checkpointed next to each input (``<file>.checkpoint``) once
+every batch before it has been written, so an interrupted import picks up
+where it stopped when run again with the same file.
+
+    python scripts/import_news.py archive-2024.ndjson.gz
+    python scripts/import_news.py a.ndjson b.ndjson.gz --batch-size 2000 --writers 4
+    python scripts/import_news.py archive.ndjson.gz --dry-run
+
+Besides NewsItem's own fields, NewsAPI-style articles are accepted:
+``publishedAt``, ``source: {"name": ...}`` and ``description`` when there
+is no ``content``. Uses the same MONGO_URL / DB_NAME settings as the
+backend.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(BACKEND_DIR / ".env", override=False)
+
+from pydantic import ValidationError  # noqa: E402
+
+import invalidation  # noqa: E402
+import jobs  # noqa: E402
+from database import close_client, db  # noqa: E402
+from server import IMPACT_JOB, NewsItem  # noqa: E402
+
+# Mongo's error code for a duplicate key
+DUPLICATE_KEY = 11000
+MAX_ERRORS_SHOWN = 5
+
+
+def open_archive(path):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def to_news_item(record, category):
+    """Map a NewsItem or NewsAPI-style article onto NewsItem's fields"""
+    source = record.get("source")
+    if isinstance(source, dict):
+        source = source.get("name") or source.get("id")
+    item = dict(record)
+    item["source"] = source or "unknown"
+    item.setdefault("published_at", record.get("publishedAt"))
+    item.setdefault("content", record.get("description") or "")
+    item.setdefault("category", category)
+    if not item.get("id") and item.get("url"):
+        # Stable across runs, so a re-import hits the unique index
+        item["id"] = str(uuid.uuid5(uuid.NAMESPACE_URL, item["url"]))
+    return NewsItem.model_validate(item).model_dump()
+
+
+class Checkpoint:
+    """Decompressed byte offset up to which every article has been written"""
+
+    def __init__(self, path):
+        self.input_path = path
+        self.path = path + ".checkpoint"
+        self.offset = 0
+        self.inserted = 0
+        self.size = os.path.getsize(path)
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                state = json.load(f)
+            if state.get("size") == self.size:
+                self.offset, self.inserted = state["offset"], state["inserted"]
+
+    def save(self, offset, inserted):
+        self.offset, self.inserted = offset, inserted
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"size": self.size, "offset": offset, "inserted": inserted}, f)
+        os.replace(tmp, self.path)
+
+    def done(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class Progress:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.parsed = self.inserted = self.duplicates = self.invalid = self.bytes = 0
+        self.errors = []
+        self._reported = self.start
+
+    def report(self, final=False):
+        now = time.perf_counter()
+        if not final and now - self._reported < 5:
+            return
+        self._reported = now
+        elapsed = max(now - self.start, 1e-9)
+        print(
+            f"{'Done: ' if final else ''}{self.parsed} parsed, {self.inserted} inserted, "
+            f"{self.duplicates} duplicates, {self.invalid} invalid in {elapsed:.1f} s "
+            f"({self.inserted / elapsed:,.0f} docs/s written, {self.parsed / elapsed:,.0f} docs/s parsed, "
+            f"{self.bytes / elapsed / 2**20:.1f} MiB/s)",
+            flush=True,
+        )
+
+
+def parse(path, start_offset, batch_size, category, put, progress, stop):
+    """Parser thread: read ``path`` from ``start_offset`` and ``put`` batches"""
+    seq = 0
+    batch, offset = [], start_offset
+    with open_archive(path) as f:
+        if start_offset:
+            f.seek(start_offset)  # gzip decompresses up to it without parsing
+        for line in f:
+            if stop.is_set():
+                return
+            offset += len(line)
+            progress.bytes += len(line)
+            if not line.strip():
+                continue
+            try:
+                batch.append(to_news_item(json.loads(line), category))
+            except (ValueError, ValidationError) as e:
+                progress.invalid += 1
+                if len(progress.errors) < MAX_ERRORS_SHOWN:
+                    progress.errors.append(f"{path} @ {offset}: {str(e).splitlines()[0]}")
+                continue
+            if len(batch) >= batch_size:
+                progress.parsed += len(batch)
+                put((seq, offset, batch))
+                seq += 1
+                batch = []
+    progress.parsed += len(batch)
+    # The final batch may be empty: it still carries the end offset
+    put((seq, offset, batch))
+    put(None)
+
+
+async def write(queue, checkpoint, progress, dry_run, analyze, committed):
+    """Writer task: insert batches and advance the checkpoint in order"""
+    while True:
+        item = await queue.get()
+        if item is None:
+            await queue.put(None)  # let the other writers stop too
+            return
+        seq, offset, batch = item
+        inserted = duplicates = 0
+        if batch and not dry_run:
+            from pymongo.errors import BulkWriteError
+
+            try:
+                result = await db.news.insert_many(batch, ordered=False)
+                inserted = len(result.inserted_ids)
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                    raise
+                inserted = e.details.get("nInserted", 0)
+                duplicates = len(errors)
+            if analyze:
+                # Keyed per article: duplicates and re-runs don't queue it again
+                ids = [article["id"] for article in batch]
+                await jobs.queue.enqueue_many(
+                    IMPACT_JOB, [{"news_id": i} for i in ids], [f"{IMPACT_JOB}:{i}" for i in ids]
+                )
+        progress.inserted += inserted
+        progress.duplicates += duplicates
+        # Only move the checkpoint past batches whose predecessors are all written
+        committed["done"][seq] = offset
+        while committed["next"] in committed["done"]:
+            committed["offset"] = committed["done"].pop(committed["next"])
+            committed["next"] += 1
+        if not dry_run:
+            checkpoint.save(committed["offset"], checkpoint.inserted + inserted)
+        progress.report()
+
+
+async def import_file(path, args, progress):
+    checkpoint = Checkpoint(path)
+    if checkpoint.offset:
+        print(f"{path}: resuming at byte {checkpoint.offset:,} ({checkpoint.inserted} articles already written)")
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=args.max_pending)
+    stop = threading.Event()
+
+    def put(item):
+        # Blocks the parser thread while the queue is full: backpressure
+        if not stop.is_set():
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    committed = {"next": 0, "done": {}, "offset": checkpoint.offset}
+    parser = loop.run_in_executor(
+        None, parse, path, checkpoint.offset, args.batch_size, args.category, put, progress, stop
+    )
+    writers = [
+        asyncio.ensure_future(write(queue, checkpoint, progress, args.dry_run, not args.skip_analysis, committed))
+        for _ in range(args.writers)
+    ]
+    try:
+        await asyncio.gather(parser, *writers)
+    except BaseException:
+        stop.set()
+        for writer in writers:
+            writer.cancel()
+        # Unblock a parser waiting on the full queue
+        while not queue.empty():
+            queue.get_nowait()
+        raise
+    if not args.dry_run:
+        checkpoint.done()
+
+
+async def run(args):
+    if not args.dry_run:
+        await db.news.create_index("id", unique=True)
+        await jobs.queue.ensure_indexes()
+    progress = Progress()
+    try:
+        for path in args.paths:
+            await import_file(path, args, progress)
+    finally:
+        if progress.inserted:
+            # API workers on this host reload their cached and hot news
+            # (with change streams they have seen the inserts already)
+            invalidation.bus.publish("news")
+        progress.report(final=True)
+        for error in progress.errors:
+            print(f"  invalid: {error}")
+        close_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("paths", nargs="+", help="NDJSON files, optionally gzip-compressed (.gz)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Articles per insert_many")
+    parser.add_argument("--writers", type=int, default=2, help="Concurrent insert_many calls")
+    parser.add_argument("--max-pending", type=int, default=8, help="Parsed batches buffered ahead of the writers")
+    parser.add_argument("--category", default="general", help="Category for articles that have none")
+    parser.add_argument("--dry-run", action="store_true", help="Parse and validate only; write nothing")
+    parser.add_argument("--skip-analysis", action="store_true", help="Don't queue impact analysis jobs")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("Interrupted; run again with the same files to resume from the checkpoint")
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Fault-injection check for the NewsAPI client's breaker, deadlines and hedging
+
+Starts a local stand-in for NewsAPI whose behaviour can be switched at
+runtime (healthy, slow, failing, hanging), points a NewsAPIClient at it
+and checks that caller latency stays bounded through each incident:
+
+    python scripts/newsapi_fault_injection.py
+
+Exits non-zero if any check fails. No network or API key is needed.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from circuit_breaker import CLOSED, OPEN, CircuitBreaker  # noqa: E402
+from newsapi import NewsAPIClient, UpstreamTimeout, UpstreamUnavailable  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEADLINE = 0.5
+HEDGE = 0.05
+BREAKER_FAILURES = 3
+BREAKER_RESET = 0.5
+
+
+class StandInNewsAPI(BaseHTTPRequestHandler):
+    mode = "healthy"
+    delay = 0.0
+    hits = 0
+
+    def do_GET(self):
+        cls = type(self)
+        cls.hits += 1
+        if cls.mode in ("slow", "hanging"):
+            time.sleep(cls.delay)
+        if cls.mode == "failing":
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = json.dumps({
+            "status": "ok",
+            "totalResults": 1,
+            "articles": [{"title": f"Headline served at {time.time()}"}],
+        }).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped waiting, which is the point of the deadline
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class FaultInjectionTester:
+    def __init__(self, base_url, state_dir):
+        self.tests_run = 0
+        self.tests_passed = 0
+        self.breaker = CircuitBreaker("newsapi-fault-injection", BREAKER_FAILURES, BREAKER_RESET)
+        self.client = NewsAPIClient(
+            state_dir=state_dir,
+            # Never the backend's warm-start snapshot: these bodies are fake
+            snapshot_path=os.path.join(state_dir, "newsapi-snapshot.json.gz"),
+            quota=1_000_000,
+            cache_ttl=0,  # every request tries the upstream
+            refresh_pairs="",
+            base_url=base_url,
+            deadline=DEADLINE,
+            hedge=HEDGE,
+            breaker=self.breaker,
+        )
+
+    def check(self, name, condition, detail=""):
+        self.tests_run += 1
+        if condition:
+            self.tests_passed += 1
+            logger.info(f"✅ {name} {detail}")
+        else:
+            logger.error(f"❌ {name} {detail}")
+
+    async def timed(self, coro):
+        start = time.perf_counter()
+        try:
+            result = await coro
+        except Exception as e:
+            result = e
+        return result, time.perf_counter() - start
+
+    async def run(self):
+        client = self.client
+
+        StandInNewsAPI.mode = "healthy"
+        result, elapsed = await self.timed(client.top_headlines("business", "us"))
+        self.check("Healthy upstream answers", isinstance(result, dict) and result["totalResults"] == 1,
+                   f"in {elapsed * 1000:.1f} ms")
+        first_title = result["articles"][0]["title"]
+
+        # Slow upstream with a cached copy: hedge to the cache
+        StandInNewsAPI.mode, StandInNewsAPI.delay = "slow", DEADLINE * 0.6
+        result, elapsed = await self.timed(client.top_headlines("business", "us"))
+        self.check("Slow upstream is hedged to the cached copy",
+                   elapsed < HEDGE + 0.05 and result["articles"][0]["title"] == first_title,
+                   f"in {elapsed * 1000:.1f} ms")
+        await asyncio.sleep(DEADLINE)
+        refreshed = client.cache.get(client.cache_key("top-headlines", {"category": "business", "country": "us"}))
+        self.check("Hedged request still refreshes the cache in the background",
+                   refreshed.body["articles"][0]["title"] != first_title)
+
+        # Hanging upstream with nothing cached: bounded by the deadline
+        StandInNewsAPI.mode, StandInNewsAPI.delay = "hanging", DEADLINE * 4
+        result, elapsed = await self.timed(client.everything("nothing-cached"))
+        self.check("Hanging upstream without a cached copy times out at the deadline",
+                   isinstance(result, UpstreamTimeout) and elapsed < DEADLINE + 0.1,
+                   f"in {elapsed * 1000:.1f} ms")
+        # Let the abandoned request finish so it counts against the breaker
+        await asyncio.sleep(DEADLINE + 0.1)
+        self.breaker.record_success()
+
+        # Failing upstream: fall back, then trip the breaker
+        StandInNewsAPI.mode = "failing"
+        latencies = []
+        for _ in range(BREAKER_FAILURES):
+            result, elapsed = await self.timed(client.top_headlines("business", "us"))
+            latencies.append(elapsed)
+        self.check("Failing upstream falls back to the last good response",
+                   isinstance(result, dict) and result["totalResults"] == 1)
+        self.check("Breaker opens after consecutive failures", self.breaker.state == OPEN)
+
+        hits_before = StandInNewsAPI.hits
+        for _ in range(200):
+            result, elapsed = await self.timed(client.top_headlines("business", "us"))
+            latencies.append(elapsed)
+        self.check("Open breaker answers from cache without touching the upstream",
+                   StandInNewsAPI.hits == hits_before and isinstance(result, dict))
+        p99 = statistics.quantiles(latencies, n=100)[98]
+        self.check("Tail latency stays bounded during the incident", p99 < HEDGE + 0.05,
+                   f"p99 {p99 * 1000:.2f} ms over {len(latencies)} requests")
+
+        result, _ = await self.timed(client.everything("still-nothing-cached"))
+        self.check("Open breaker without a cached copy reports unavailable",
+                   isinstance(result, UpstreamUnavailable))
+
+        # Recovery: a single half-open probe closes the breaker again
+        StandInNewsAPI.mode = "healthy"
+        await asyncio.sleep(BREAKER_RESET)
+        hits_before = StandInNewsAPI.hits
+        await asyncio.gather(*[client.everything(f"probe-{i}") for i in range(5)], return_exceptions=True)
+        self.check("Half-open breaker lets exactly one probe through", StandInNewsAPI.hits == hits_before + 1)
+        self.check("Successful probe closes the breaker", self.breaker.state == CLOSED)
+
+        logger.info(f"\n📊 Fault injection: {self.tests_passed}/{self.tests_run} checks passed")
+        return self.tests_passed == self.tests_run
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInNewsAPI)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ.setdefault("NEWS_API_KEY", "fault-injection")
+    state_dir = tempfile.mkdtemp(prefix="newsapi-fault-injection-")
+    try:
+        tester = FaultInjectionTester(f"http://127.0.0.1:{server.server_port}", state_dir)
+        ok = asyncio.run(tester.run())
+    finally:
+        server.shutdown()
+        shutil.rmtree(state_dir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Offline NewsAPI load test from a recorded archive
+
+Record real traffic first by running either server with
+NEWSAPI_RECORD_PATH=/path/to/newsapi.arc, then:
+
+    python scripts/replay_newsapi.py info newsapi.arc
+    python scripts/replay_newsapi.py load newsapi.arc --requests 2000 --concurrency 32
+    python scripts/replay_newsapi.py load newsapi.arc --speed max
+
+``load`` drives simple_server's NewsAPI routes in-process with every
+recorded query, the client replaying upstream responses from the archive
+(with their recorded latency unless ``--speed max``), and prints
+throughput, latency percentiles and payload sizes. No network or API key
+is needed.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from newsapi_archive import MAX_SPEED, RECORDED, ArchiveReplay  # noqa: E402
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def info(args):
+    archive = ArchiveReplay(args.archive)
+    size = os.path.getsize(args.archive)
+    latencies = [latency for records in archive.index.values() for _, _, latency in records]
+    print(f"{args.archive}: {len(archive)} responses for {len(archive.index)} queries, {size / 1024:.1f} KiB")
+    if latencies:
+        print(
+            f"recorded latency p50 {percentile(latencies, 50) * 1000:.0f} ms  "
+            f"p90 {percentile(latencies, 90) * 1000:.0f} ms  p99 {percentile(latencies, 99) * 1000:.0f} ms"
+        )
+    for key, records in sorted(archive.index.items()):
+        print(f"  {len(records):4d}x  {key}")
+
+
+async def request(app, path):
+    route, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": route, "raw_path": route.encode(),
+        "root_path": "", "query_string": query.encode(), "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 1), "server": ("localhost", 80),
+    }
+    requested = []
+    response = {"status": None, "bytes": 0}
+
+    async def receive():
+        if not requested:
+            requested.append(True)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Like a live connection: nothing more until the client goes away
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        else:
+            response["bytes"] += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response
+
+
+async def drive(app, paths, requests, concurrency):
+    latencies, sizes, statuses = [], [], {}
+    next_request = iter(range(requests))
+
+    async def worker():
+        for i in next_request:
+            start = time.perf_counter()
+            response = await request(app, paths[i % len(paths)])
+            latencies.append(time.perf_counter() - start)
+            sizes.append(response["bytes"])
+            statuses[response["status"]] = statuses.get(response["status"], 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return time.perf_counter() - start, latencies, sizes, statuses
+
+
+def load(args):
+    os.environ["NEWSAPI_REPLAY_PATH"] = args.archive
+    os.environ["NEWSAPI_REPLAY_SPEED"] = args.speed
+    # Nothing is served from cache, and the replaying client neither
+    # hedges nor shares requests: every request waits for its own replay
+    os.environ["NEWSAPI_CACHE_TTL_SECONDS"] = "0"
+    os.environ["NEWSAPI_REFRESH_PAIRS"] = ""
+    os.environ["NEWSAPI_STATE_DIR"] = tempfile.mkdtemp(prefix="replay-newsapi-")
+    os.environ["NEWSAPI_SNAPSHOT_PATH"] = ""
+    import simple_server
+
+    app = simple_server.create_app(frontend_build_dir=Path(os.devnull) / "no-frontend")
+    paths = [f"/api/newsapi/{key}" for key in sorted(simple_server.newsapi.client.replay.index)]
+    if not paths:
+        sys.exit(f"{args.archive} holds no responses")
+    elapsed, latencies, sizes, statuses = asyncio.run(drive(app, paths, args.requests, args.concurrency))
+    print(
+        f"{args.requests} requests over {len(paths)} queries at {args.speed} speed, concurrency {args.concurrency}: "
+        f"{args.requests / elapsed:.0f} req/s"
+    )
+    print(
+        f"latency p50 {percentile(latencies, 50) * 1000:.1f} ms  p90 {percentile(latencies, 90) * 1000:.1f} ms  "
+        f"p99 {percentile(latencies, 99) * 1000:.1f} ms"
+    )
+    print(f"payload mean {statistics.mean(sizes) / 1024:.1f} KiB  max {max(sizes) / 1024:.1f} KiB  statuses {statuses}")
+    sys.exit(0 if set(statuses) == {200} else 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    info_parser = commands.add_parser("info", help="Summarize an archive")
+    info_parser.add_argument("archive")
+    info_parser.set_defaults(func=info)
+    load_parser = commands.add_parser("load", help="Replay an archive through simple_server")
+    load_parser.add_argument("archive")
+    load_parser.add_argument("--requests", type=int, default=1000)
+    load_parser.add_argument("--concurrency", type=int, default=16)
+    load_parser.add_argument("--speed", choices=[RECORDED, MAX_SPEED], default=RECORDED)
+    load_parser.set_defaults(func=load)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Standalone job worker
+
+Runs queued jobs (impact analysis of new articles, see backend/jobs.py)
+outside the API servers, so analysis scales separately from request
+serving. Start as many as needed, on any host that reaches MongoDB; set
+JOB_WORKERS=0 on the API servers to keep them out of it.
+
+    python scripts/run_jobs.py
+    python scripts/run_jobs.py --concurrency 8 --runner process
+
+Stops on Ctrl-C or SIGTERM. Jobs it is running are picked up again by
+another worker once their lease expires. Uses the same MONGO_URL /
+DB_NAME settings as the backend.
+"""
+import argparse
+import asyncio
+import signal
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(BACKEND_DIR / ".env", override=False)
+
+import jobs  # noqa: E402
+import server  # noqa: E402,F401  (registers the job handlers)
+from database import close_client  # noqa: E402
+
+
+async def run(args):
+    await jobs.queue.ensure_indexes()
+    worker = jobs.Worker(jobs.queue, concurrency=args.concurrency, runner=args.runner)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await worker.start()
+    try:
+        await stop.wait()
+    finally:
+        await worker.stop()
+        close_client()
+    print(f"Worker {worker.id}: {worker.processed} jobs done, {worker.failed} attempts failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=max(jobs.WORKERS, 1), help="Jobs run at once")
+    parser.add_argument("--runner", choices=("async", "process"), default=jobs.RUNNER,
+                        help="Run CPU-bound analysis inline or in a process pool")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()